@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0002_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filerecord',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0003_filerecord_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='rules_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
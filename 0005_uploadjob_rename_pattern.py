@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0004_userprofile_rules_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='rename_pattern',
+            field=models.CharField(default='{index}_{name}', max_length=255),
+        ),
+    ]
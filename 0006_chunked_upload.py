@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0005_uploadjob_rename_pattern'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('last_modified', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_files', to='organizer.uploadjob')),
+            ],
+            options={
+                'ordering': ['index'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.BigIntegerField()),
+                ('length', models.BigIntegerField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='organizer.chunkedfile')),
+            ],
+            options={
+                'ordering': ['offset'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='uploadchunk',
+            constraint=models.UniqueConstraint(fields=('file', 'offset'), name='unique_upload_chunk_offset'),
+        ),
+        migrations.AddConstraint(
+            model_name='chunkedfile',
+            constraint=models.UniqueConstraint(fields=('job', 'index'), name='unique_chunked_file_index'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0006_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='organize_strategy',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0007_uploadjob_organize_strategy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='file_errors',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-17 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('organizer', '0010_contentsignature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='duplicate_action',
+            field=models.CharField(choices=[('keep', 'Keep in place'), ('group', 'Group in duplicates/'), ('skip', 'Skip')], default='keep', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='duplicates',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='duplicates_found',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='FileFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('file_size', models.BigIntegerField()),
+                ('perceptual_hash', models.CharField(blank=True, default='', max_length=16)),
+                ('original_name', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='organizer.uploadjob')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'file_size'], name='fingerprint_user_size')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='filefingerprint',
+            constraint=models.UniqueConstraint(fields=('user', 'content_hash'), name='unique_user_fingerprint'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0011_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='filerecord',
+            name='original_name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='filerecord',
+            index=models.Index(fields=['job', 'category', 'created_at'], name='file_job_category_created'),
+        ),
+        migrations.AddIndex(
+            model_name='filerecord',
+            index=models.Index(fields=['job', 'created_at'], name='file_job_created'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadjob',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='job_user_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadjob',
+            index=models.Index(fields=['user', 'created_at'], name='job_user_created'),
+        ),
+    ]
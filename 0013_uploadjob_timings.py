@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0012_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
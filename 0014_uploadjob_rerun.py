@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0013_uploadjob_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='rerun',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0014_uploadjob_rerun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='unpack_archives',
+            field=models.BooleanField(default=False),
+        ),
+    ]
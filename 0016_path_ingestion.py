@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-17 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0015_uploadjob_unpack_archives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='move_sources',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='source_path',
+            field=models.CharField(blank=True, default='', max_length=1024),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='target_path',
+            field=models.CharField(blank=True, default='', max_length=1024),
+        ),
+        migrations.AlterField(
+            model_name='filerecord',
+            name='organized_path',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+        migrations.AlterField(
+            model_name='filerecord',
+            name='original_path',
+            field=models.CharField(max_length=1024),
+        ),
+    ]
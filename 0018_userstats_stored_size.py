@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 15:05
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_stored_size(apps, schema_editor):
+    UploadJob = apps.get_model('organizer', 'UploadJob')
+    UserStats = apps.get_model('organizer', 'UserStats')
+    sizes = UploadJob.objects.filter(source_path='').values('user_id').annotate(size=Sum('total_size'))
+    for row in sizes:
+        UserStats.objects.filter(user_id=row['user_id']).update(stored_size=row['size'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0017_retention_and_quota'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='stored_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_stored_size, migrations.RunPython.noop),
+    ]
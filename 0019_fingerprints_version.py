@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-17 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizer', '0018_userstats_stored_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='fingerprints_version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RemoveIndex(
+            model_name='filefingerprint',
+            name='fingerprint_user_size',
+        ),
+    ]
@@ -1,30 +1,122 @@
+import re
+
 from django.contrib import admin
-from .models import UserProfile, CustomRule, UploadJob, FileRecord
+from .models import UserProfile, UserStats, CustomRule, UploadJob, FileRecord, ContentSignature, FileFingerprint
+from .dedupe import invalidate_fingerprints
+from .ruleengine import invalidate_rules
+from .stats import rebuild_stats
+
+
+SHA256_RE = re.compile(r'[0-9a-f]{64}')
 
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'total_files_organized', 'created_at')
+    list_display = ('user', 'total_files_organized', 'storage_quota', 'created_at')
     readonly_fields = ('total_files_organized', 'total_space_saved')
 
 
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'total_jobs', 'completed_jobs', 'total_files', 'total_size', 'stored_size',
+                    'updated_at')
+    readonly_fields = ('total_jobs', 'completed_jobs', 'total_files', 'total_size', 'stored_size',
+                       'updated_at')
+    actions = ['recompute']
+
+    @admin.action(description='Recompute from jobs')
+    def recompute(self, request, queryset):
+        for user_id in queryset.values_list('user_id', flat=True):
+            rebuild_stats(user_id)
+
+
 @admin.register(CustomRule)
 class CustomRuleAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'rule_type', 'enabled', 'created_at')
     list_filter = ('rule_type', 'enabled', 'created_at')
     search_fields = ('name', 'user__username')
 
+    # Rules changed here must reach the users' compiled-rule caches too.
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_rules(obj.user)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_rules(obj.user)
+
+    def delete_queryset(self, request, queryset):
+        users = {rule.user for rule in queryset.select_related('user')}
+        super().delete_queryset(request, queryset)
+        for user in users:
+            invalidate_rules(user)
+
 
 @admin.register(UploadJob)
 class UploadJobAdmin(admin.ModelAdmin):
     list_display = ('job_name', 'user', 'status', 'total_files', 'created_at')
     list_filter = ('status', 'created_at')
-    search_fields = ('job_name', 'user__username')
-    readonly_fields = ('created_at', 'completed_at')
+    list_select_related = ('user',)
+    search_fields = ('^job_name', '=user__username')
+    readonly_fields = ('created_at', 'completed_at', 'queued_at', 'started_at', 'worker', 'error_message', 'organize_strategy')
+
+    # Bulk and admin deletes bypass the incremental counters; recount instead.
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_stats(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            rebuild_stats(user_id)
 
 
 @admin.register(FileRecord)
 class FileRecordAdmin(admin.ModelAdmin):
     list_display = ('original_name', 'new_name', 'category', 'job')
     list_filter = ('category', 'created_at')
-    search_fields = ('original_name', 'new_name')
+    list_select_related = ('job',)
+    # Prefix matches rather than substrings. They are still case-insensitive,
+    # which SQLite runs as a scan (its LIKE can't use an index).
+    search_fields = ('^original_name', '^new_name')
+    raw_id_fields = ('job',)
+    # Counting every record on each search is a full scan; skip it.
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # A full sha256 is also looked up exactly, which can use the content_hash index.
+        term = search_term.strip().lower()
+        if SHA256_RE.fullmatch(term):
+            results |= queryset.filter(content_hash=term)
+        return results, may_have_duplicates
+
+
+@admin.register(ContentSignature)
+class ContentSignatureAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'category', 'created_at')
+    list_filter = ('category',)
+    search_fields = ('^content_hash',)
+
+
+@admin.register(FileFingerprint)
+class FileFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('original_name', 'user', 'file_size', 'perceptual_hash', 'job', 'created_at')
+    search_fields = ('original_name', 'user__username', '^content_hash')
+    raw_id_fields = ('job',)
+
+    # Processes cache each user's image index (see dedupe.image_tree).
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_fingerprints(obj.user_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_fingerprints(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            invalidate_fingerprints(user_id)
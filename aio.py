@@ -0,0 +1,84 @@
+"""Blocking work off the event loop, for the async views.
+
+Async views must not block the event loop, and sync_to_async runs
+everything on one shared thread by default. So reading and writing files,
+hashing and compressing go to a bounded pool of ORGANIZER_ASYNC_IO_THREADS
+threads that every transfer shares. A slow client then holds a thread
+only while one of its chunks is read or written, not for the whole
+transfer.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_DONE = object()
+
+
+def io_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ORGANIZER_ASYNC_IO_THREADS', 32),
+                    thread_name_prefix='organizer-io',
+                )
+    return _executor
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking call on the I/O pool."""
+    return await asyncio.get_running_loop().run_in_executor(io_executor(), partial(fn, *args, **kwargs))
+
+
+def _with_connections_closed(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_db(fn, *args, **kwargs):
+    """Like `run_io`, for blocking calls that also use the ORM.
+
+    Each pool thread keeps its own connection, and it is recycled
+    per CONN_MAX_AGE as it would be at the end of a request.
+    """
+    return await run_io(_with_connections_closed, fn, *args, **kwargs)
+
+
+async def iterate_io(iterator):
+    """Async iterator over a blocking one, advanced a step at a time on the I/O pool.
+
+    The iterator must not use the ORM: its steps may run on different threads.
+    """
+    iterator = iter(iterator)
+    lock = threading.Lock()
+
+    def step():
+        with lock:
+            return next(iterator, _DONE)
+
+    def close():
+        with lock:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            item = await loop.run_in_executor(io_executor(), step)
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        # Closing waits for a step still running after a disconnect, so it
+        # goes to the pool too rather than blocking the loop.
+        io_executor().submit(close)
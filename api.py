@@ -0,0 +1,382 @@
+"""JSON API: chunked, resumable uploads and paginated job/file listings.
+
+A client opens an upload session listing its files, PUTs byte ranges of
+each file in any order (several at once if it likes), and asks for the
+list of received ranges to resume after a dropped connection. Chunks are
+written at their offset straight into a preallocated part file in the job
+directory; `complete` then moves each finished file into the blob store
+and builds the job manifest, exactly like a form upload (archives
+included, when the session asked for them to be unpacked).
+
+Job and file listings use keyset pagination (see pagination.py), so
+paging through a 50k-file job never loads more than a page of records.
+The files a listing's filters select can also be downloaded as a ZIP of
+their own (see archivecache.py).
+"""
+import re
+import shutil
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView
+from rest_framework.parsers import BaseParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .archivecache import ArchiveCache, archive_members, selection_key
+from .archives import ArchiveError, is_archive
+from .compression import CompressionPolicy, compression_workers
+from .fileserve import serve_file
+from .ingest import JobIngest, safe_filename
+from .manifest import Manifest
+from .models import ChunkedFile, FileRecord, UploadChunk, UploadJob
+from .naming import DEFAULT_PATTERN
+from .pagination import KeysetPagination
+from .quota import QuotaExceeded, check_quota
+from .retention import discard_job
+from .ruleengine import RuleSyntaxError, parse_size
+from .serializers import FileRecordSerializer, JobSerializer, UploadSessionSerializer
+from .stats import record_job_created, record_job_resized
+from .workspace import ensure_workspace
+from .zipstream import stream_zip
+
+
+COPY_BUFFER = 1024 * 1024
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+def _chunk_size():
+    return getattr(settings, 'ORGANIZER_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def _max_chunk_size():
+    return getattr(settings, 'ORGANIZER_UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 * 1024)
+
+
+class ChunkParser(BaseParser):
+    """Hand the raw request stream to the view instead of buffering it."""
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
+
+
+def _parts_dir(job):
+    return ensure_workspace(job.user) / 'uploads' / str(job.id) / '.parts'
+
+
+def _part_path(job, index):
+    return _parts_dir(job) / f'{index}.part'
+
+
+def _received_ranges(chunks):
+    """Merge (offset, length) pairs into sorted [start, end) ranges."""
+    ranges = []
+    for offset, length in sorted(chunks):
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], offset + length)
+        else:
+            ranges.append([offset, offset + length])
+    return ranges
+
+
+def _is_complete(ranges, size):
+    return size == 0 or ranges == [[0, size]]
+
+
+def _open_job(request, job_id):
+    """A job of the current user that is still accepting chunks."""
+    job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+    if job.queued_at is not None or Manifest.for_job(job).exists():
+        return job, Response({'detail': 'Upload already completed.'}, status=status.HTTP_409_CONFLICT)
+    return job, None
+
+
+def _session_payload(job):
+    files = list(job.chunked_files.all())
+    chunks = {}
+    for file_id, offset, length in UploadChunk.objects.filter(
+            file__job=job).values_list('file_id', 'offset', 'length'):
+        chunks.setdefault(file_id, []).append((offset, length))
+    return {
+        'job_id': job.id,
+        'chunk_size': _chunk_size(),
+        'files': [
+            {
+                'index': f.index,
+                'name': f.name,
+                'size': f.size,
+                'received': _received_ranges(chunks.get(f.id, [])),
+            }
+            for f in files
+        ],
+    }
+
+
+class UploadSessionView(APIView):
+    """POST: start a chunked upload and create its job."""
+
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        files = data['files']
+        try:
+            check_quota(request.user, sum(f['size'] for f in files))
+        except QuotaExceeded as e:
+            return Response({'detail': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        with transaction.atomic():
+            job = UploadJob.objects.create(
+                user=request.user,
+                job_name=data.get('job_name', '').strip() or 'Untitled Job',
+                status='pending',
+                total_files=len(files),
+                total_size=sum(f['size'] for f in files),
+                rename_pattern=data.get('rename_pattern', '').strip() or DEFAULT_PATTERN,
+                unpack_archives=data['unpack_archives'],
+            )
+            record_job_created(job)
+            ChunkedFile.objects.bulk_create([
+                ChunkedFile(
+                    job=job,
+                    index=index,
+                    name=safe_filename(f['name']),
+                    size=f['size'],
+                    last_modified=(
+                        datetime.fromtimestamp(f['last_modified'] / 1000, tz=dt_timezone.utc)
+                        if 'last_modified' in f else None
+                    ),
+                )
+                for index, f in enumerate(files)
+            ])
+
+        # Preallocate (sparsely) so chunks can land at any offset.
+        parts = _parts_dir(job)
+        parts.mkdir(parents=True, exist_ok=True)
+        for index, f in enumerate(files):
+            with open(_part_path(job, index), 'wb') as fh:
+                fh.truncate(f['size'])
+
+        return Response(_session_payload(job), status=status.HTTP_201_CREATED)
+
+
+class UploadStatusView(APIView):
+    """GET: received byte ranges per file, for resuming."""
+
+    def get(self, request, job_id):
+        job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+        payload = _session_payload(job)
+        payload['completed'] = Manifest.for_job(job).exists()
+        return Response(payload)
+
+
+class UploadChunkView(APIView):
+    """PUT: one byte range of one file.
+
+    The range comes from a ``Content-Range: bytes start-end/total`` header,
+    or from ``?offset=`` with the body length. Re-sending a chunk is safe.
+    """
+    parser_classes = [ChunkParser]
+
+    def put(self, request, job_id, index):
+        job, conflict = _open_job(request, job_id)
+        if conflict:
+            return conflict
+        upload = get_object_or_404(ChunkedFile, job=job, index=index)
+
+        header = request.headers.get('Content-Range')
+        if header:
+            match = _CONTENT_RANGE.match(header)
+            if not match:
+                return Response({'detail': 'Malformed Content-Range.'}, status=status.HTTP_400_BAD_REQUEST)
+            offset, last = int(match.group(1)), int(match.group(2))
+            length = last - offset + 1
+            # The session declared the size the quota was checked against.
+            if match.group(3) != '*' and int(match.group(3)) != upload.size:
+                return Response({'detail': f'File size is {upload.size}, not {match.group(3)}.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        else:
+            try:
+                offset = int(request.query_params.get('offset', 0))
+                length = int(request.headers.get('Content-Length') or 0)
+            except ValueError:
+                return Response({'detail': 'Bad offset.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if offset < 0 or length <= 0 or offset + length > upload.size:
+            return Response({'detail': 'Chunk outside the file.'},
+                            status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        if length > _max_chunk_size():
+            return Response({'detail': 'Chunk too large.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        stream = request.data
+        written = 0
+        with open(_part_path(job, index), 'r+b') as fh:
+            fh.seek(offset)
+            while written < length:
+                buf = stream.read(min(COPY_BUFFER, length - written))
+                if not buf:
+                    break
+                fh.write(buf)
+                written += len(buf)
+        if written != length:
+            return Response({'detail': f'Expected {length} bytes, got {written}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        UploadChunk.objects.update_or_create(file=upload, offset=offset, defaults={'length': length})
+        return Response({'index': index, 'offset': offset, 'length': length})
+
+
+class UploadCompleteView(APIView):
+    """POST: all chunks are in; stage the files and open the preview."""
+
+    def post(self, request, job_id):
+        job, conflict = _open_job(request, job_id)
+        if conflict:
+            return conflict
+
+        payload = _session_payload(job)
+        missing = [f for f in payload['files'] if not _is_complete(f['received'], f['size'])]
+        if missing:
+            return Response({'detail': 'Some files are incomplete.', 'files': missing},
+                            status=status.HTTP_409_CONFLICT)
+
+        try:
+            with JobIngest(job) as entries:
+                for upload in job.chunked_files.all():
+                    path = _part_path(job, upload.index)
+                    if job.unpack_archives and is_archive(upload.name):
+                        with open(path, 'rb') as fh:
+                            entries.add_archive(upload.name, fh)
+                    else:
+                        entries.add_path(upload.name, path, upload.last_modified)
+        except (ArchiveError, QuotaExceeded) as e:
+            # Same as a failed form upload: the job goes, with its chunks.
+            discard_job(job)
+            code = (status.HTTP_413_REQUEST_ENTITY_TOO_LARGE if isinstance(e, QuotaExceeded)
+                    else status.HTTP_400_BAD_REQUEST)
+            return Response({'detail': str(e)}, status=code)
+        UploadJob.objects.filter(id=job.id).update(total_files=entries.count, total_size=entries.total_size)
+        record_job_resized(job, entries.total_size - job.total_size, entries.count - job.total_files)
+        job.chunked_files.all().delete()
+        shutil.rmtree(_parts_dir(job), ignore_errors=True)
+
+        request.session['current_job_id'] = job.id
+        request.session.modified = True
+        return Response({'job_id': job.id, 'preview_url': reverse('preview')})
+
+
+# === Listings ===
+def _size_param(request, name):
+    """A size filter such as ``?min_size=10MB``; None if absent."""
+    value = request.query_params.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return parse_size(value)
+    except RuleSyntaxError as e:
+        raise ValidationError({name: str(e)})
+
+
+class JobListView(ListAPIView):
+    """GET: the user's jobs, newest first. Filters: status, name."""
+    serializer_class = JobSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        jobs = UploadJob.objects.filter(user=self.request.user).defer(
+            'error_message', 'file_errors', 'duplicates',
+        )
+        if params.get('status'):
+            jobs = jobs.filter(status=params['status'])
+        if params.get('name'):
+            jobs = jobs.filter(job_name__icontains=params['name'])
+        return jobs
+
+
+def _filter_files(request, files):
+    """Apply the file filters in the query string to `files`.
+
+    Returns the filtered queryset and the filters that were applied, as a
+    JSON-able dict. ``category`` may be repeated or comma-separated.
+    """
+    params = request.query_params
+    selection = {}
+    categories = sorted({
+        category.strip()
+        for value in params.getlist('category') for category in value.split(',') if category.strip()
+    })
+    if categories:
+        files = files.filter(category__in=categories)
+        selection['category'] = categories
+    if params.get('name'):
+        files = files.filter(
+            Q(original_name__icontains=params['name']) | Q(new_name__icontains=params['name'])
+        )
+        selection['name'] = params['name']
+    min_size = _size_param(request, 'min_size')
+    if min_size is not None:
+        files = files.filter(file_size__gte=min_size)
+        selection['min_size'] = min_size
+    max_size = _size_param(request, 'max_size')
+    if max_size is not None:
+        files = files.filter(file_size__lte=max_size)
+        selection['max_size'] = max_size
+    return files, selection
+
+
+class JobFileListView(ListAPIView):
+    """GET: a job's FileRecords. Filters: category, name, min_size, max_size."""
+    serializer_class = FileRecordSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        job = get_object_or_404(UploadJob, id=self.kwargs['job_id'], user=self.request.user)
+        files = FileRecord.objects.filter(job=job).only(
+            'id', 'original_name', 'new_name', 'category', 'file_size', 'created_at',
+        )
+        return _filter_files(self.request, files)[0]
+
+
+class JobArchiveView(APIView):
+    """GET: a ZIP of the files of a completed job that match the file filters.
+
+    Takes the same filters as the file list. The archive is streamed as it
+    is built and kept in the archive cache (see archivecache.py), so asking
+    for the same files again is served from disk. With no filters, this
+    redirects to the full download.
+    """
+
+    def get(self, request, job_id):
+        job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+        if job.status != 'completed':
+            return Response({'detail': 'The job is not organized yet.'}, status=status.HTTP_409_CONFLICT)
+        files, selection = _filter_files(request, FileRecord.objects.filter(job=job))
+        if not selection:
+            return HttpResponseRedirect(reverse('download', args=[job.id]))
+        if not files.exists():
+            return Response({'detail': 'No files match these filters.'}, status=status.HTTP_404_NOT_FOUND)
+
+        label = '+'.join(selection['category']) if list(selection) == ['category'] else 'selection'
+        filename = f'{job.job_name.replace(" ", "_")}-{label}.zip'
+        cache = ArchiveCache()
+        key = selection_key(job, selection)
+        cached = cache.get(key)
+        if cached is not None:
+            return serve_file(request, cached, filename, 'application/zip')
+
+        chunks = stream_zip(archive_members(job, files), policy=CompressionPolicy.from_settings(),
+                            workers=compression_workers())
+        response = StreamingHttpResponse(cache.fill(key, chunks), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        response['Accept-Ranges'] = 'none'
+        return response
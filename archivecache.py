@@ -0,0 +1,140 @@
+"""ZIPs of part of a job, and an on-disk LRU cache of them.
+
+`archive_members` lists the files to put in a job's archive, optionally
+only some of its FileRecords. A partial archive (one or more categories or
+a filtered set of files, see `JobArchiveView`) is streamed to the client
+while it is written into the cache. Later requests for the same selection
+of the same version of the job are then sent from disk, ranges included,
+without being recompressed. The cache lives in ``cache/archives/`` under
+MEDIA_ROOT and is bounded by ORGANIZER_ARCHIVE_CACHE_SIZE bytes. The least
+recently used archives are evicted first. Recency is the files' access
+time, set explicitly on each hit (so noatime mounts don't matter, and the
+mtime, hence the ETag, stays put). Every process on the node shares the
+cache without a lock.
+"""
+import os
+import json
+import hashlib
+import logging
+import time
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .blobstore import blob_path
+from .storage import get_storage, local_blob
+
+
+logger = logging.getLogger(__name__)
+
+
+def archive_members(job, records=None):
+    """(source path, arcname) pairs for a job's organized files.
+
+    `records` narrows the FileRecords (default: all of the job's). The
+    blob is read when there is one: uploads that shared a name share one
+    path in the upload folder, but never a blob. Server-side files are
+    read from where they were organized to, since they may have been moved.
+    With remote storage, blobs this node hasn't got are fetched first.
+    """
+    storage = get_storage()
+    records = (job.files.all() if records is None else records).order_by('id').values_list(
+        'original_path', 'organized_path', 'content_hash', 'category', 'new_name',
+    )
+    for original_path, organized_path, content_hash, category, new_name in records.iterator():
+        if content_hash and local_blob(content_hash, storage).exists():
+            original_path = str(blob_path(content_hash))
+        elif job.source_path and organized_path:
+            original_path = organized_path
+        if not os.path.exists(original_path):
+            logger.warning('Skipping missing source %s for job %s', original_path, job.id)
+            continue
+        yield original_path, f'{category}/{new_name}'
+
+
+def selection_key(job, selection):
+    """Cache key for `selection` (a JSON-able dict) of the job as it is now.
+
+    The job's completion time is part of the key, so re-applying rules
+    (which moves files between categories) never serves a stale archive.
+    """
+    version = job.completed_at.isoformat() if job.completed_at else ''
+    digest = hashlib.sha256(
+        json.dumps([version, selection], sort_keys=True).encode(),
+    ).hexdigest()
+    return f'{job.id}-{digest[:32]}'
+
+
+class ArchiveCache:
+    """Size-bounded LRU of generated archives on disk."""
+
+    def __init__(self, root=None, max_size=None):
+        self.root = Path(root or os.path.join(settings.MEDIA_ROOT, 'cache', 'archives'))
+        if max_size is None:
+            max_size = getattr(settings, 'ORGANIZER_ARCHIVE_CACHE_SIZE', 2 * 1024 ** 3)
+        self.max_size = max_size
+
+    def path(self, key):
+        return self.root / f'{key}.zip'
+
+    def get(self, key):
+        """Path of the cached archive, marking it recently used; None on a miss."""
+        path = self.path(key)
+        try:
+            os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def fill(self, key, chunks):
+        """Pass `chunks` through, keeping a copy as the archive for `key`.
+
+        The copy is only kept once the last chunk has gone out: a client
+        that disconnects leaves nothing behind. Archives bigger than the
+        whole cache are sent but not kept.
+        """
+        if self.max_size <= 0:
+            yield from chunks
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=self.root, prefix=f'.{key}.', suffix='.part')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            if size <= self.max_size:
+                os.replace(partial, self.path(key))
+                self.evict()
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
+
+    def discard(self, job_id):
+        """Drop every cached archive of a job."""
+        for path in self.root.glob(f'{job_id}-*.zip'):
+            path.unlink(missing_ok=True)
+
+    def evict(self):
+        """Delete the least recently used archives until the cache fits."""
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.endswith('.zip'):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue  # evicted by another process
+                    entries.append((st.st_atime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
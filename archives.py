@@ -0,0 +1,110 @@
+"""Archive uploads unpacked into their members.
+
+With "unpack archives" on, an uploaded .zip or .tar(.gz/.bz2/.xz) is not
+filed as one file: its members are read one at a time straight from the
+upload (a ZIP's central directory, a tar's headers as the stream reaches
+them) and each is streamed into the blob store like any other upload.
+Nothing is extracted to a scratch directory, and the archive itself is
+never stored. Directory structure is dropped; nested archives are filed
+as archives.
+"""
+import tarfile
+import zipfile
+import zlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.utils.timezone import make_aware
+
+
+READ_SIZE = 1024 * 1024
+
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# Resource forks macOS adds to ZIPs it creates.
+JUNK_PREFIXES = ('__MACOSX/',)
+
+_READ_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError)
+
+
+class ArchiveError(ValueError):
+    """An archive that can't be unpacked."""
+
+
+def is_archive(name):
+    return name.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+def unpack_default():
+    return getattr(settings, 'ORGANIZER_UNPACK_ARCHIVES', False)
+
+
+def _limits():
+    return (
+        getattr(settings, 'ORGANIZER_ARCHIVE_MAX_MEMBERS', 10000),
+        getattr(settings, 'ORGANIZER_ARCHIVE_MAX_SIZE', 10 * 1024 ** 3),
+    )
+
+
+def _chunks(fh, name):
+    try:
+        with fh:
+            while True:
+                chunk = fh.read(READ_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+    except _READ_ERRORS as e:
+        raise ArchiveError(f'Could not read {name}: {e}')
+
+
+def _zip_modified(info):
+    try:
+        return make_aware(datetime(*info.date_time))
+    except ValueError:
+        return None  # e.g. a zeroed DOS date
+
+
+def _zip_members(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            if info.flag_bits & 0x1:
+                raise ArchiveError(f'{info.filename} is encrypted')
+            yield info.filename, info.file_size, _zip_modified(info), \
+                (lambda info=info: _chunks(archive.open(info), info.filename))
+
+
+def _tar_members(fileobj):
+    # 'r|*' reads headers as the stream reaches them, with no seeking back.
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            yield info.name, info.size, datetime.fromtimestamp(info.mtime, tz=timezone.utc), \
+                (lambda info=info: _chunks(archive.extractfile(info), info.name))
+
+
+def members(fileobj, name):
+    """Yield (path, size, modified, chunks) for each file in the archive.
+
+    `modified` may be None. `chunks()` must be consumed before the next
+    member is taken. Raises ArchiveError for unreadable, encrypted or
+    oversized archives, including while a member's chunks are read.
+    """
+    max_members, max_size = _limits()
+    reader = _zip_members if name.lower().endswith(ZIP_SUFFIXES) else _tar_members
+    count = total = 0
+    try:
+        for member_name, size, modified, chunks in reader(fileobj):
+            count += 1
+            total += size
+            if count > max_members:
+                raise ArchiveError(f'{name} has more than {max_members} files')
+            if total > max_size:
+                raise ArchiveError(f'{name} unpacks to more than {max_size} bytes')
+            if not member_name.startswith(JUNK_PREFIXES):
+                yield member_name, size, modified, chunks
+    except _READ_ERRORS as e:
+        raise ArchiveError(f'Could not read {name}: {e}')
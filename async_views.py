@@ -0,0 +1,128 @@
+"""Async twins of the upload and download views, for ASGI deployments.
+
+With ORGANIZER_ASYNC_TRANSFERS on, urls.py routes ``upload`` and
+``download`` here. The ASGI handler receives the request body without a
+thread. These views then hand every blocking step (parsing and storing
+the files, reading the ZIP, compressing a streamed archive) to the
+shared I/O pool in aio.py and use the async ORM for the rest. Thousands
+of slow transfers therefore share a few threads instead of holding one
+each. The sync views in views.py stay as they are for WSGI, admin and
+management use.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.utils.http import content_disposition_header
+
+from . import views
+from .aio import iterate_io, run_db, run_io
+from .archivecache import archive_members
+from .archives import ArchiveError
+from .compression import CompressionPolicy, compression_workers
+from .fileserve import serve_file
+from .forms import UploadForm
+from .models import UploadJob
+from .naming import DEFAULT_PATTERN, PatternError, compile_pattern
+from .quota import FORM_OVERHEAD, QuotaExceeded, acheck_quota
+from .storage import get_storage, media_name
+from .workspace import ensure_workspace
+from .zipstream import stream_zip
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _user(request):
+    """The logged-in user, or None. Resolving request.user reads the session."""
+    return await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+
+
+async def _render(request, context, status=200):
+    return await sync_to_async(render)(request, 'organizer/upload.html', context, status=status)
+
+
+async def upload(request):
+    """Async `views.upload`: files are parsed and stored on the I/O pool."""
+    if request.method != 'POST':
+        return await sync_to_async(views.upload)(request)
+    user = await _user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    try:
+        await acheck_quota(user, max(0, content_length - FORM_OVERHEAD))
+    except QuotaExceeded as e:
+        return await _render(request, {'form': UploadForm(), 'error': str(e)}, status=413)
+
+    files = await run_io(request.FILES.getlist, 'files')
+    job_name = request.POST.get('job_name', '').strip() or 'Untitled Job'
+    rename_pattern = request.POST.get('rename_pattern', '').strip() or DEFAULT_PATTERN
+    unpack_archives = bool(request.POST.get('unpack_archives'))
+    initial = {'job_name': job_name, 'rename_pattern': rename_pattern, 'unpack_archives': unpack_archives}
+
+    if not files:
+        error = 'Please select at least one file to upload.'
+        return await _render(request, {'form': UploadForm(), 'error': error})
+    try:
+        compile_pattern(rename_pattern)
+        await acheck_quota(user, sum(f.size for f in files))
+    except (PatternError, QuotaExceeded) as e:
+        return await _render(request, {'form': UploadForm(initial=initial), 'error': str(e)},
+                             status=413 if isinstance(e, QuotaExceeded) else 200)
+
+    try:
+        job = await run_db(views._store_upload, user, files, job_name, rename_pattern, unpack_archives)
+    except (ArchiveError, QuotaExceeded) as e:
+        return await _render(request, {'form': UploadForm(initial=initial), 'error': str(e)},
+                             status=413 if isinstance(e, QuotaExceeded) else 200)
+    except Exception as e:
+        logger.exception('Upload failed for %s', user)
+        return await _render(request, {'form': UploadForm(), 'error': f'Upload failed: {e}'})
+    if job is None:
+        return await _render(request, {'form': UploadForm(), 'error': 'No files were saved successfully.'})
+
+    # Only the job id goes in the session (loading it may hit the database)
+    await sync_to_async(request.session.__setitem__)('current_job_id', job.id)
+    return redirect('preview')
+
+
+async def download(request, job_id):
+    """Async `views.download`: the ZIP is read, or built, on the I/O pool."""
+    user = await _user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    try:
+        job = await UploadJob.objects.aget(id=job_id, user=user)
+    except UploadJob.DoesNotExist:
+        raise Http404('No UploadJob matches the given query.')
+    if job.status != 'completed':
+        raise Http404('Archive not available')
+    workspace = await run_io(ensure_workspace, user)
+    zip_path = workspace / 'jobs' / f'{job.id}.zip'
+    safe_filename = f'{job.job_name.replace(" ", "_")}.zip'
+    storage = get_storage()
+
+    if not storage.is_local and not job.source_path and await run_io(storage.exists, media_name(zip_path)):
+        return redirect(await run_io(storage.url, media_name(zip_path), filename=safe_filename))
+
+    if await run_io(zip_path.exists):
+        return await run_io(serve_file, request, zip_path, safe_filename, 'application/zip', asynchronous=True)
+
+    if not await job.files.aexists():
+        raise Http404('Archive not available')
+
+    # The member list is read up front: a query can't follow the stream
+    # from one pool thread to the next.
+    members = await run_db(lambda: list(archive_members(job)))
+    chunks = stream_zip(members, policy=CompressionPolicy.from_settings(), workers=compression_workers())
+    response = StreamingHttpResponse(iterate_io(views._timed_stream(job, chunks)), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, safe_filename)
+    response['Accept-Ranges'] = 'none'
+    return response
@@ -0,0 +1,129 @@
+"""Content-addressed blob store shared by every user and job.
+
+Uploads are hashed while they are written, stored once under
+``MEDIA_ROOT/blobs/<aa>/<bb>/<sha256>`` and then hard-linked to wherever
+the job expects them (the upload folder, the organized tree). Identical
+files therefore take the disk space of a single copy.
+"""
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .materialize import materialize
+
+
+HASH_NAME = 'sha256'
+# Leading bytes BlobWriter keeps in memory for content sniffing.
+HEADER_BYTES = 512
+
+
+def blob_root():
+    return Path(settings.MEDIA_ROOT) / 'blobs'
+
+
+def blob_path(digest):
+    return blob_root() / digest[:2] / digest[2:4] / digest
+
+
+class BlobWriter:
+    """Stream data into the store, hashing it on the way.
+
+    Usage::
+
+        writer = BlobWriter()
+        for chunk in f.chunks():
+            writer.write(chunk)
+        digest, created = writer.commit()
+    """
+
+    def __init__(self):
+        tmpdir = blob_root() / 'tmp'
+        tmpdir.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=tmpdir)
+        self._fh = os.fdopen(fd, 'wb')
+        self._hash = hashlib.new(HASH_NAME)
+        self.size = 0
+        self.header = b''
+
+    def write(self, chunk):
+        self._fh.write(chunk)
+        self._hash.update(chunk)
+        if self.size < HEADER_BYTES:
+            self.header += chunk[:HEADER_BYTES - self.size]
+        self.size += len(chunk)
+
+    def commit(self):
+        """Publish the blob; returns (digest, created). `created` is False on a dedup hit."""
+        self._fh.close()
+        digest = self._hash.hexdigest()
+        created = _publish(self._tmp_path, digest)
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+        return digest, created
+
+    def abort(self):
+        self._fh.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+
+def _reuse(final):
+    """Mark an existing blob as just used; False if it has gone meanwhile.
+
+    Garbage collection leaves recently modified blobs alone (see
+    retention.py), which covers the moment before the upload links it.
+    """
+    try:
+        os.utime(final)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _publish(src, digest):
+    """Link `src` into the store as `digest`; returns True if it was new."""
+    final = blob_path(digest)
+    final.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        try:
+            # link() refuses to overwrite, so concurrent writers of the same
+            # content agree on a single winner without locking.
+            os.link(src, final)
+            return True
+        except FileExistsError:
+            if _reuse(final):
+                return False
+        except OSError:
+            if final.exists() and _reuse(final):
+                return False
+            os.replace(src, final)
+            return True
+
+
+def adopt_file(path, chunk_size=1024 * 1024):
+    """Hash a file that is already on disk and move it into the store.
+
+    Returns (digest, created, size). `path` no longer exists afterwards.
+    """
+    digest = hashlib.new(HASH_NAME)
+    size = 0
+    with open(path, 'rb') as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    digest = digest.hexdigest()
+    created = _publish(path, digest)
+    if os.path.exists(path):
+        os.unlink(path)
+    return digest, created, size
+
+
+def link_blob(digest, dest):
+    """Make `dest` refer to the blob without copying it where possible."""
+    return materialize(blob_path(digest), dest, strategies=('link', 'reflink', 'copy'))
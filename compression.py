@@ -0,0 +1,108 @@
+"""Per-member compression policy for job archives.
+
+Images, video, audio and archives are already compressed, so deflating
+them again burns CPU for no gain; they are STORED. Everything else is
+DEFLATED, except types we don't recognise, where a small sample is probed
+for entropy and near-random data is stored as is.
+"""
+import os
+import math
+import zlib
+from collections import Counter
+from pathlib import Path
+from zipfile import ZIP_STORED, ZIP_DEFLATED
+
+from django.conf import settings
+
+
+DEFAULT_LEVEL = 6
+PROBE_BYTES = 16 * 1024
+# Bits per byte above which a sample is treated as already compressed.
+ENTROPY_THRESHOLD = 7.5
+
+# Values are 'stored', 'deflated', 'probe' or a deflate level (0 = stored).
+CATEGORY_POLICY = {
+    'images': 'stored',
+    'videos': 'stored',
+    'audio': 'stored',
+    'archives': 'stored',
+    'documents': 'deflated',
+    'code': 'deflated',
+    'media': 'probe',
+    'others': 'probe',
+}
+
+# Extension overrides for types whose category default is wrong.
+EXTENSION_POLICY = {
+    '.svg': 'deflated',
+    '.bmp': 'deflated',
+    '.ico': 'deflated',
+    '.wav': 'deflated',
+    '.tar': 'deflated',
+    '.docx': 'stored',
+    '.xlsx': 'stored',
+    '.odt': 'stored',
+    '.pdf': 'probe',
+}
+
+
+def compression_workers():
+    """Threads used to deflate archive members in parallel."""
+    return getattr(settings, 'ORGANIZER_COMPRESSION_WORKERS', os.cpu_count() or 1)
+
+
+def entropy(sample):
+    """Shannon entropy of `sample` in bits per byte (0.0 to 8.0)."""
+    if not sample:
+        return 0.0
+    total = len(sample)
+    return -sum(n / total * math.log2(n / total) for n in Counter(sample).values())
+
+
+def looks_compressed(path, probe_bytes=PROBE_BYTES):
+    """Sample the middle of the file; high entropy means deflate won't help."""
+    with open(path, 'rb') as fh:
+        fh.seek(0, 2)
+        size = fh.tell()
+        fh.seek(max(0, size // 2 - probe_bytes // 2))
+        sample = fh.read(probe_bytes)
+    return entropy(sample) >= ENTROPY_THRESHOLD
+
+
+class CompressionPolicy:
+    """Decide STORED vs DEFLATED (and level) for each archive member.
+
+    Members are looked up by extension first, then by category, which is
+    the first folder of the arcname (``<category>/<new_name>``).
+    """
+
+    def __init__(self, categories=None, extensions=None, level=DEFAULT_LEVEL):
+        self.categories = {**CATEGORY_POLICY, **(categories or {})}
+        self.extensions = {**EXTENSION_POLICY, **(extensions or {})}
+        self.level = level
+
+    @classmethod
+    def from_settings(cls):
+        overrides = getattr(settings, 'ORGANIZER_COMPRESSION_POLICY', {})
+        return cls(
+            categories={k: v for k, v in overrides.items() if not k.startswith('.')},
+            extensions={k.lower(): v for k, v in overrides.items() if k.startswith('.')},
+            level=getattr(settings, 'ORGANIZER_COMPRESSION_LEVEL', DEFAULT_LEVEL),
+        )
+
+    def __call__(self, path, arcname):
+        ext = Path(arcname).suffix.lower()
+        category = arcname.partition('/')[0]
+        if ext in self.extensions:
+            rule = self.extensions[ext]
+        else:
+            rule = self.categories.get(category, 'probe')
+        if rule == 'probe':
+            rule = 'stored' if looks_compressed(path) else 'deflated'
+        if rule == 'stored' or rule == 0:
+            return ZIP_STORED, None
+        if rule == 'deflated':
+            return ZIP_DEFLATED, self.level
+        if isinstance(rule, int) and 1 <= rule <= zlib.Z_BEST_COMPRESSION:
+            return ZIP_DEFLATED, rule
+        raise ValueError(f'Invalid compression rule {rule!r} for {arcname}')
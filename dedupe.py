@@ -0,0 +1,225 @@
+"""Duplicate and near-duplicate detection for uploads.
+
+Runs while files are ingested, so the preview can show duplicates before
+anything is organized. Checks, cheapest first:
+
+* exact, same job:    the sha256 the blob store computes anyway, in a dict
+* exact, past jobs:   the user's FileFingerprint index, one indexed
+                      lookup on (user, content hash)
+* similar images:     a 64-bit difference hash (dHash) from Pillow,
+                      searched in a BK-tree by Hamming distance
+
+Fingerprints join the index when a job is organized (see jobs._finalize),
+so abandoned uploads never count as originals. Each process keeps the
+BK-tree of a user's indexed images until ``UserProfile.fingerprints_version``
+changes, so a job's cost doesn't grow with the user's history.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F
+from PIL import Image, UnidentifiedImageError
+
+from .blobstore import blob_path
+from .models import FileFingerprint, UploadJob, UserProfile
+
+
+logger = logging.getLogger(__name__)
+
+DHASH_SIZE = 8
+# Pillow raises these for files that aren't (complete, sane) images.
+_IMAGE_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError)
+
+ACTIONS = ('keep', 'group', 'skip')
+DUPLICATES_FOLDER = 'duplicates'
+# Users whose image trees a process keeps, least recently used dropped first.
+TREE_CACHE_USERS = 64
+
+
+def detection_enabled():
+    return getattr(settings, 'ORGANIZER_DUPLICATE_DETECTION', True)
+
+
+def similar_distance():
+    """Max differing dHash bits for two images to count as similar; 0 disables."""
+    return getattr(settings, 'ORGANIZER_SIMILAR_IMAGE_DISTANCE', 6)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def dhash(path, size=DHASH_SIZE):
+    """64-bit difference hash of an image, or None if Pillow can't read it."""
+    try:
+        with Image.open(path) as img:
+            # Let the JPEG decoder downscale while decoding.
+            img.draft('L', (size * 4, size * 4))
+            img = img.convert('L').resize((size + 1, size), Image.BILINEAR)
+    except _IMAGE_ERRORS as e:
+        logger.debug('No perceptual hash for %s: %s', path, e)
+        return None
+    pixels = list(img.getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+class BKTree:
+    """Metric tree over integers for Hamming-distance range queries."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, max_distance):
+        """[(distance, item)] for all values within `max_distance`, nearest first."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.append((distance, item))
+            # Triangle inequality: only subtrees in this band can match.
+            for d in range(distance - max_distance, distance + max_distance + 1):
+                child = children.get(d)
+                if child is not None:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+_trees = OrderedDict()  # user id -> (fingerprints_version, BKTree)
+_trees_lock = threading.Lock()
+
+
+def image_tree(user):
+    """BK-tree of `user`'s indexed images, rebuilt only when their index changed.
+
+    Items are (original name, job id). The tree is shared by every job the
+    process ingests for the user, so it must not be added to.
+    """
+    version = (
+        UserProfile.objects.filter(user=user)
+        .values_list('fingerprints_version', flat=True).first() or 0
+    )
+    with _trees_lock:
+        cached = _trees.get(user.pk)
+        if cached is not None and cached[0] == version:
+            _trees.move_to_end(user.pk)
+            return cached[1]
+    tree = BKTree()
+    indexed = (
+        FileFingerprint.objects.filter(user=user).exclude(perceptual_hash='')
+        .values_list('perceptual_hash', 'original_name', 'job_id')
+    )
+    for phash, name, job_id in indexed.iterator():
+        tree.add(int(phash, 16), (name, job_id))
+    with _trees_lock:
+        _trees[user.pk] = (version, tree)
+        _trees.move_to_end(user.pk)
+        while len(_trees) > TREE_CACHE_USERS:
+            _trees.popitem(last=False)
+    return tree
+
+
+def invalidate_fingerprints(user_id):
+    """Call after fingerprints are added to or deleted from a user's index."""
+    UserProfile.objects.filter(user_id=user_id).update(fingerprints_version=F('fingerprints_version') + 1)
+    with _trees_lock:
+        _trees.pop(user_id, None)
+
+
+class DuplicateFinder:
+    """Checks one job's incoming files against each other and the user's index."""
+
+    def __init__(self, user):
+        self.user = user
+        self.max_distance = similar_distance()
+        self.found = 0
+        self._seen = {}  # content hash -> original name, this job
+        self._tree = None  # the user's index, shared (see image_tree)
+        self._job_tree = BKTree()  # this job's images so far
+
+    def check(self, name, content_hash, size, category):
+        """Return (duplicate, perceptual_hash) for a file being ingested.
+
+        `duplicate` is None or a dict describing the original; the hash is
+        a hex string for images and '' otherwise.
+        """
+        duplicate = self._exact(name, content_hash)
+        phash = ''
+        if duplicate is None and category == 'images':
+            value = dhash(blob_path(content_hash))
+            if value is not None:
+                phash = f'{value:016x}'
+                duplicate = self._similar(name, value)
+        if duplicate is not None:
+            self.found += 1
+        return duplicate, phash
+
+    def _exact(self, name, content_hash):
+        if content_hash in self._seen:
+            return {'kind': 'exact', 'of': self._seen[content_hash], 'job_id': None, 'job_name': None}
+        self._seen[content_hash] = name
+        match = (
+            FileFingerprint.objects.filter(user=self.user, content_hash=content_hash)
+            .values_list('original_name', 'job_id', 'job__job_name').first()
+        )
+        if match is None:
+            return None
+        original, job_id, job_name = match
+        return {'kind': 'exact', 'of': original, 'job_id': job_id, 'job_name': job_name}
+
+    def _similar(self, name, value):
+        matches = []
+        if self.max_distance:
+            if self._tree is None:
+                self._tree = image_tree(self.user)
+            matches = (self._tree.search(value, self.max_distance)
+                       + self._job_tree.search(value, self.max_distance))
+        self._job_tree.add(value, (name, None))
+        if not matches:
+            return None
+        distance, (original, job_id) = min(matches, key=lambda pair: pair[0])
+        # Looked up now: the job may have been deleted since the tree was built.
+        job_name = None
+        if job_id is not None:
+            job_name = UploadJob.objects.filter(id=job_id).values_list('job_name', flat=True).first()
+        return {'kind': 'similar', 'of': original, 'job_id': job_id if job_name is not None else None,
+                'job_name': job_name, 'distance': distance}
+
+
+def fingerprints_for(job, items):
+    """Unsaved FileFingerprints for the manifest entries a job organized."""
+    return [
+        FileFingerprint(
+            user_id=job.user_id,
+            content_hash=item['content_hash'],
+            file_size=item['file_size'],
+            perceptual_hash=item.get('phash', ''),
+            job_id=job.id,
+            original_name=item['original_name'],
+        )
+        for item in items
+        if item.get('content_hash') and (item.get('duplicate') or {}).get('kind') != 'exact'
+    ]
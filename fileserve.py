@@ -0,0 +1,166 @@
+"""Serve a file from disk the way a static file server would.
+
+`serve_file` answers conditional GETs (ETag / Last-Modified, so 304 and
+412) and byte ranges, several at once as multipart/byteranges, so an
+interrupted download carries on from where it stopped. With
+ORGANIZER_SENDFILE set, Python only authorizes the request. The response
+carries an X-Accel-Redirect (nginx) or X-Sendfile (Apache mod_xsendfile,
+lighttpd) header, and the front-end server sends the bytes, handling
+ranges and conditionals itself. Async views pass ``asynchronous=True`` to
+get bodies that read the file on the I/O pool (see aio.py).
+"""
+import os
+from urllib.parse import quote
+from uuid import uuid4
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .aio import iterate_io
+
+
+READ_SIZE = 1024 * 1024
+# Requests for more ranges than this get the whole file, as from nginx,
+# so one request can't make us seek all over a large archive.
+MAX_RANGES = 16
+SENDFILE_HEADERS = ('X-Accel-Redirect', 'X-Sendfile')
+
+
+def parse_ranges(header, size):
+    """Sorted, merged (start, end) byte ranges (end inclusive) from a Range header.
+
+    Returns None if the header is to be ignored (not bytes, malformed or
+    too many ranges) and [] if none of its ranges can be satisfied.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(','):
+        first, dash, last = (bit.strip() for bit in part.partition('-'))
+        if not dash or not (first + last).isdigit():
+            return None
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        else:
+            # Suffix range: the last N bytes.
+            start, end = max(0, size - int(last)), size - 1
+        if start <= end:
+            ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Whether an If-Range header (if any) still names this version of the file."""
+    value = request.headers.get('If-Range')
+    if value is None:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def _part_header(boundary, content_type, start, end, size):
+    return (f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+
+
+def _read_ranges(path, ranges, boundary=None, content_type=None, size=None):
+    with open(path, 'rb') as fh:
+        for start, end in ranges:
+            if boundary:
+                yield _part_header(boundary, content_type, start, end, size)
+            fh.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                chunk = fh.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    raise OSError(f'{path} shrank while being sent')
+                remaining -= len(chunk)
+                yield chunk
+            if boundary:
+                yield b'\r\n'
+        if boundary:
+            yield f'--{boundary}--\r\n'.encode()
+
+
+def _sendfile(path, filename, content_type, header):
+    response = HttpResponse(content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    if header == 'X-Accel-Redirect':
+        root = getattr(settings, 'ORGANIZER_SENDFILE_ROOT', settings.MEDIA_ROOT)
+        prefix = getattr(settings, 'ORGANIZER_SENDFILE_URL', '/protected/')
+        relative = os.path.relpath(path, root).replace(os.sep, '/')
+        response[header] = prefix.rstrip('/') + '/' + quote(relative)
+    else:
+        response[header] = os.fspath(path)
+    return response
+
+
+def serve_file(request, path, filename, content_type='application/octet-stream', asynchronous=False):
+    """Response sending the file at `path` as an attachment named `filename`."""
+    header = getattr(settings, 'ORGANIZER_SENDFILE', None)
+    if header:
+        if header not in SENDFILE_HEADERS:
+            raise ValueError(f'ORGANIZER_SENDFILE must be one of {SENDFILE_HEADERS}, not {header!r}')
+        return _sendfile(path, filename, content_type, header)
+
+    st = os.stat(path)
+    size = st.st_size
+    etag = f'"{size:x}-{st.st_mtime_ns:x}"'
+    last_modified = int(st.st_mtime)
+
+    def body(ranges, *multipart):
+        chunks = _read_ranges(path, ranges, *multipart)
+        return iterate_io(chunks) if asynchronous else chunks
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        ranges = None
+        if 'Range' in request.headers and request.method in ('GET', 'HEAD') \
+                and _if_range_matches(request, etag, last_modified):
+            ranges = parse_ranges(request.headers['Range'], size)
+
+        if ranges is None and asynchronous:
+            response = StreamingHttpResponse(body([(0, size - 1)]), content_type=content_type)
+            response['Content-Length'] = size
+        elif ranges is None:
+            response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename,
+                                    content_type=content_type)
+            response['Content-Length'] = size
+        elif not ranges:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif len(ranges) == 1:
+            (start, end), = ranges
+            response = StreamingHttpResponse(body(ranges), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            boundary = uuid4().hex
+            response = StreamingHttpResponse(body(ranges, boundary, content_type, size), status=206,
+                                             content_type=f'multipart/byteranges; boundary={boundary}')
+            response['Content-Length'] = sum(
+                len(_part_header(boundary, content_type, start, end, size)) + end - start + 1 + 2
+                for start, end in ranges
+            ) + len(f'--{boundary}--\r\n')
+        if response.status_code != 416:
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
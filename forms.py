@@ -1,5 +1,7 @@
 from django import forms
+from .archives import unpack_default
 from .models import CustomRule
+from .ruleengine import RuleSyntaxError, validate_rule
 
 
 class MultipleFileInput(forms.FileInput):
@@ -16,9 +18,24 @@ class UploadForm(forms.Form):
         required=False,
         initial='{index}_{name}'
     )
+    unpack_archives = forms.BooleanField(
+        required=False,
+        initial=unpack_default
+    )
 
 
 class RuleForm(forms.ModelForm):
     class Meta:
         model = CustomRule
         fields = ['name', 'rule_type', 'match_value', 'target_folder', 'enabled']
+
+    def clean(self):
+        cleaned = super().clean()
+        rule_type = cleaned.get('rule_type')
+        match_value = cleaned.get('match_value')
+        if rule_type and match_value:
+            try:
+                validate_rule(rule_type, match_value)
+            except RuleSyntaxError as e:
+                self.add_error('match_value', str(e))
+        return cleaned
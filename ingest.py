@@ -0,0 +1,189 @@
+"""Stage incoming files into a job.
+
+Shared by the form upload, the chunked upload API and `ingest_path`: each
+file is put in the blob store, linked into ``uploads/<job>/``, classified,
+given its final (collision-free) name and appended to the job manifest.
+Files their name doesn't classify are sniffed by content (see sniff.py)
+and every file is checked for duplicates (see dedupe.py). Archives can be
+staged member by member (see archives.py); server-side files are staged
+by reference, without hashing, so they skip the duplicate check. Bytes
+skipped thanks to dedup are credited to the user's profile when the batch
+closes, and unpacked archives are held to the user's quota (see quota.py);
+per-stage timings are stored in ``job.timings['upload']``. With remote
+storage, new blobs are uploaded to it in the background while the batch
+goes on, and the manifest once the batch closes (see storage.py).
+"""
+from pathlib import Path
+
+from django.db.models import F
+
+from .archives import members as archive_members
+from .blobstore import BlobWriter, adopt_file, link_blob
+from .manifest import Manifest
+from .dedupe import DuplicateFinder, detection_enabled
+from .instrumentation import Timings
+from .models import UploadJob, UserProfile
+from .naming import NameAllocator, compile_pattern
+from .quota import JobQuota
+from .ruleengine import get_matcher
+from .sniff import CONTAINER_EXTENSIONS, sniff_blob, sniff_file, sniff_mode
+from .storage import BlobPublisher, publish
+from .workspace import ensure_workspace
+
+
+def safe_filename(name):
+    """Strip any client-supplied directories from an upload's name."""
+    return name.replace('\\', '/').split('/')[-1]
+
+
+def classify(matcher, mode, name, content_hash, size, modified, header=None, path=None):
+    """Category for a file under `matcher`, sniffing its content as `mode` allows.
+
+    The blob is sniffed when there is a `content_hash`, else the file at `path`.
+    """
+    if mode == 'off' or not (content_hash or path):
+        return matcher.classify(name, size, modified)
+    sniff_known = mode == 'all' and Path(name).suffix.lower() not in CONTAINER_EXTENSIONS
+    return matcher.classify(
+        name, size, modified,
+        sniff=lambda: sniff_blob(content_hash, header) if content_hash else sniff_file(path),
+        sniff_known=sniff_known,
+    )
+
+
+class JobIngest:
+    """Context manager that stages files into `job` and writes its manifest."""
+
+    def __init__(self, job):
+        self.job = job
+        self.updir = ensure_workspace(job.user) / 'uploads' / str(job.id)
+        self.matcher = get_matcher(job.user)
+        self.sniff_mode = sniff_mode()
+        self.duplicates = DuplicateFinder(job.user) if detection_enabled() else None
+        # Validated when the job was created; names are final from here on.
+        self.pattern = compile_pattern(job.rename_pattern)
+        # A shared target folder may already hold files from earlier jobs.
+        target = Path(job.target_path) if job.target_path else None
+        self.names = NameAllocator(
+            exists=(lambda folder, name: (target / folder / name).exists()) if target else None,
+        )
+        self.space_saved = 0
+        self.total_size = 0
+        # Kept with entries of unknown date, so renaming them later gives the same {date}.
+        self.uploaded = int(job.created_at.timestamp())
+        self.timings = Timings()
+
+    def __enter__(self):
+        self.updir.mkdir(parents=True, exist_ok=True)
+        self._manifest = Manifest.for_job(self.job)
+        self._entries = self._manifest.writer().__enter__()
+        self._blobs = BlobPublisher()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._entries.__exit__(exc_type, exc, tb)
+        if exc_type is not None:
+            self._blobs.close(wait=False)
+            return False
+        if not self._blobs.storage.is_local:
+            with self.timings.stage('publish') as published:
+                published['files'] = self._blobs.close()
+                publish(self._manifest.path)
+                publish(self._manifest.index_path)
+        if self.space_saved:
+            UserProfile.objects.filter(user_id=self.job.user_id).update(
+                total_space_saved=F('total_space_saved') + self.space_saved,
+            )
+        updates = {'timings': {**self.job.timings, 'upload': self.timings.as_dict()}}
+        if self.duplicates is not None:
+            updates['duplicates_found'] = self.duplicates.found
+        UploadJob.objects.filter(id=self.job.id).update(**updates)
+        return False
+
+    @property
+    def count(self):
+        return self._entries.count
+
+    def add_chunks(self, name, chunks, modified=None):
+        """Stage a file delivered as an iterable of byte chunks."""
+        writer = BlobWriter()
+        with self.timings.stage('store') as stored:
+            try:
+                for chunk in chunks:
+                    writer.write(chunk)
+                content_hash, created = writer.commit()
+            except Exception:
+                writer.abort()
+                raise
+            stored['files'], stored['bytes'] = 1, writer.size
+        return self._add(name, content_hash, created, writer.size, modified, writer.header)
+
+    def add_path(self, name, path, modified=None):
+        """Stage a file already assembled on disk; it is moved, not copied."""
+        with self.timings.stage('store') as stored:
+            content_hash, created, size = adopt_file(path)
+            stored['files'], stored['bytes'] = 1, size
+        return self._add(name, content_hash, created, size, modified)
+
+    def add_source(self, path, size, modified):
+        """Stage a server-side file by reference: it is neither copied nor
+        hashed, and organizing links (or moves) it from where it is."""
+        return self._add(str(path), '', False, size, modified, source_path=str(path))
+
+    def add_archive(self, name, fileobj):
+        """Stage each file inside the archive `fileobj`; returns how many.
+
+        Raises ArchiveError if the archive can't be read, and QuotaExceeded
+        once its files outgrow the owner's quota; members staged before the
+        error stay in the job.
+        """
+        quota = JobQuota(self.job)
+        added = 0
+        for member, size, modified, chunks in archive_members(fileobj, name):
+            quota.check(self.total_size + size)
+            self.add_chunks(member, chunks(), modified)
+            quota.check(self.total_size)  # in case the header understated it
+            added += 1
+        return added
+
+    def _add(self, name, content_hash, created, size, modified, header=None, source_path=None):
+        safe_name = safe_filename(name)
+        if source_path is None:
+            with self.timings.stage('link') as linked:
+                link_blob(content_hash, self.updir / safe_name)
+                linked['files'] = 1
+            self._blobs.add(content_hash)
+            if not created:
+                self.space_saved += size
+        self.total_size += size
+        with self.timings.stage('classify') as classified:
+            category = classify(self.matcher, self.sniff_mode, safe_name, content_hash, size, modified,
+                                header, source_path)
+            classified['files'] = 1
+        entry = {
+            'original_name': safe_name,
+            'category': category,
+            'file_size': size,
+            'content_hash': content_hash,
+        }
+        # Form uploads don't say when a file was modified; rename patterns
+        # then date it by the upload and date rules skip it.
+        if modified is not None:
+            entry['modified'] = int(modified.timestamp())
+        else:
+            entry['uploaded'] = self.uploaded
+        if source_path is not None:
+            entry['source_path'] = source_path
+        entry['new_name'] = self.names.claim(
+            entry['category'], self.pattern(self.count + 1, entry),
+        )
+        if self.duplicates is not None and content_hash:
+            with self.timings.stage('dedupe') as checked:
+                duplicate, phash = self.duplicates.check(safe_name, content_hash, size, entry['category'])
+                checked['files'] = 1
+            if phash:
+                entry['phash'] = phash
+            if duplicate:
+                entry['duplicate'] = duplicate
+        self._entries.add(entry)
+        return entry
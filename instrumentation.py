@@ -0,0 +1,92 @@
+"""Per-stage timers and counters for the upload/organize pipeline.
+
+A `Timings` collects wall time, file and byte counts per named stage and
+renders them with files/s and MB/s; jobs store the result in
+``UploadJob.timings`` and job_detail shows it. `profiled` runs a block
+under cProfile when ORGANIZER_PROFILE_JOBS asks for it.
+"""
+import io
+import time
+import pstats
+import logging
+import cProfile
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOP = 30
+
+
+class Timings:
+    """Accumulates per-stage metrics; stages are reported in first-use order."""
+
+    def __init__(self, initial=None):
+        self.stages = {}
+        for name, values in (initial or {}).items():
+            self.add(name, values.get('seconds', 0), values.get('files', 0), values.get('bytes', 0))
+
+    def add(self, name, seconds=0.0, files=0, bytes=0):
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'files': 0, 'bytes': 0})
+        stage['seconds'] += seconds
+        stage['files'] += files
+        stage['bytes'] += bytes
+        return stage
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block; the yielded dict takes 'files' and 'bytes' counts."""
+        counts = {'files': 0, 'bytes': 0}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.add(name, time.perf_counter() - start, counts['files'], counts['bytes'])
+
+    def as_dict(self):
+        report = {}
+        for name, stage in self.stages.items():
+            seconds = stage['seconds']
+            report[name] = {
+                'seconds': round(seconds, 4),
+                'files': stage['files'],
+                'bytes': stage['bytes'],
+                'files_per_s': round(stage['files'] / seconds, 1) if seconds and stage['files'] else None,
+                'mb_per_s': round(stage['bytes'] / seconds / 2 ** 20, 2) if seconds and stage['bytes'] else None,
+            }
+        return report
+
+    def summary(self):
+        """One line for the log, e.g. 'place 1.20s, archive 0.40s'."""
+        return ', '.join(f"{name} {stage['seconds']:.2f}s" for name, stage in self.stages.items())
+
+
+def should_profile(job_id):
+    """ORGANIZER_PROFILE_JOBS is a collection of job ids, or True for all."""
+    wanted = getattr(settings, 'ORGANIZER_PROFILE_JOBS', ())
+    return wanted is True or job_id in (wanted or ())
+
+
+@contextmanager
+def profiled(enabled, dump_path=None, label=''):
+    """Run the block under cProfile if `enabled`; log the top functions.
+
+    Raw stats go to `dump_path` (open them with ``python -m pstats`` or
+    snakeviz) when given.
+    """
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if dump_path is not None:
+            profiler.dump_stats(dump_path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        logger.info('Profile for %s (%s):\n%s', label, dump_path or 'not saved', out.getvalue())
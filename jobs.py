@@ -0,0 +1,497 @@
+"""Background organize jobs.
+
+`organize` only queues a job; the copying, FileRecord writes and ZIP
+building happen here, in a pool of local worker processes that pull
+queued jobs straight from the UploadJob table (no external broker).
+Re-applying changed rules to an organized job runs on the same queue.
+With remote storage (see storage.py) upload jobs are organized inside the
+bucket: files are copied there server-side and the ZIP is uploaded to it.
+"""
+import os
+import time
+import signal
+import socket
+import logging
+import multiprocessing
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .blobstore import blob_path
+from .compression import CompressionPolicy, compression_workers
+from .dedupe import DUPLICATES_FOLDER, fingerprints_for, invalidate_fingerprints
+from .instrumentation import Timings, profiled, should_profile
+from .manifest import Manifest
+from .materialize import STRATEGIES, materialize as place_file
+from .models import UserProfile, UploadJob, FileRecord, FileFingerprint
+from .naming import NameAllocator, render_name
+from .reorganize import plan as plan_reorganization
+from .stats import record_job_completed, record_job_reopened
+from .storage import SERVER_COPY, fetch, get_storage, local_blob, media_name, publish
+from .workspace import ensure_workspace
+from .zipstream import rename_zip, stream_zip
+
+
+logger = logging.getLogger(__name__)
+
+# How often (in files) a running job writes processed_files back.
+PROGRESS_EVERY = 25
+# Rows per INSERT when FileRecords are written.
+RECORD_BATCH_SIZE = 500
+# Server-side files moved into their target: rename, else place and unlink.
+MOVE_STRATEGIES = ('rename', 'link', 'reflink', 'copy')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(job, rerun=False, inline=None):
+    """Queue the job for the workers; its manifest must already be written.
+
+    With `rerun` the worker re-applies the user's current rules to an
+    organized job (see `reorganize_job`) instead of organizing it. `inline`
+    overrides ORGANIZER_RUN_JOBS_INLINE.
+    """
+    job.rerun = rerun
+    job.status = 'pending'
+    job.processed_files = 0
+    job.queued_at = now()
+    job.started_at = None
+    job.worker = ''
+    job.error_message = ''
+    with transaction.atomic():
+        # A rerun job stops counting as completed until it completes again,
+        # so a failed rerun leaves the stats as rebuild_stats would.
+        reopened = UploadJob.objects.filter(id=job.id, status='completed').update(status='pending')
+        job.save(update_fields=[
+            'rerun', 'status', 'processed_files', 'queued_at', 'started_at', 'worker', 'error_message',
+        ])
+        if reopened:
+            record_job_reopened(job)
+
+    if inline is None:
+        inline = _setting('ORGANIZER_RUN_JOBS_INLINE', False)
+    if inline:
+        if _claim(job.id, 'inline'):
+            job.refresh_from_db()
+            run_job(job)
+
+
+def _claim(job_id, worker_name):
+    """Atomically move a queued job to processing; False if someone beat us."""
+    return UploadJob.objects.filter(
+        id=job_id, status='pending', queued_at__isnull=False,
+    ).update(status='processing', started_at=now(), worker=worker_name) == 1
+
+
+def claim_next(worker_name):
+    """Claim the oldest queued job, or return None when the queue is empty."""
+    while True:
+        job_id = (
+            UploadJob.objects
+            .filter(status='pending', queued_at__isnull=False)
+            .order_by('queued_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        if _claim(job_id, worker_name):
+            return UploadJob.objects.select_related('user').get(id=job_id)
+
+
+def requeue_stale(max_age=None):
+    """Put jobs whose worker died mid-run back on the queue."""
+    if max_age is None:
+        max_age = _setting('ORGANIZER_JOB_STALE_AFTER', 3600)
+    cutoff = now() - timedelta(seconds=max_age)
+    return UploadJob.objects.filter(
+        status='processing', queued_at__isnull=False, started_at__lt=cutoff,
+    ).update(status='pending', worker='', processed_files=0)
+
+
+def organized_dir(job):
+    """Where a job's category folders go."""
+    if job.target_path:
+        return Path(job.target_path)
+    return ensure_workspace(job.user) / 'jobs' / str(job.id)
+
+
+def run_job(job):
+    """Run a claimed job, recording failure on the job instead of raising."""
+    profile = should_profile(job.id)
+    dump_path = ensure_workspace(job.user) / 'jobs' / f'{job.id}.prof' if profile else None
+    try:
+        with profiled(profile, dump_path, label=f'job {job.id}'):
+            if job.rerun:
+                reorganize_job(job)
+            else:
+                organize_job(job)
+    except Exception as e:
+        logger.exception('Organize job %s failed', job.id)
+        UploadJob.objects.filter(id=job.id).update(
+            status='failed',
+            error_message=f'{e}\n{traceback.format_exc()}'[:4000],
+            completed_at=now(),
+        )
+
+
+def organize_job(job):
+    """Copy the manifest's files into category folders and build the ZIP.
+
+    Files are placed on a bounded pool of ORGANIZER_IO_WORKERS threads.
+    Duplicates flagged at upload are kept, grouped or skipped according to
+    ``job.duplicate_action``. Stage timings go to ``job.timings['organize']``.
+    With ``ORGANIZER_ZIP_MODE = 'stream'`` only the FileRecords are written;
+    `download` then streams the archive from the uploaded files. Server-side
+    files (see `ingest_path`) are always placed, in ``job.target_path`` if
+    set, and never zipped.
+    """
+    workspace = ensure_workspace(job.user)
+    storage = get_storage()
+    # Upload jobs on remote storage are placed there, by server-side copies.
+    remote = not storage.is_local and not job.source_path
+
+    updir = workspace / 'uploads' / str(job.id)
+    orgdir = organized_dir(job)
+    # In stream mode the archive is built at download time straight from
+    # the blobs, so nothing is copied and no .zip is written.
+    materialize = bool(job.source_path) or _setting('ORGANIZER_ZIP_MODE', 'file') != 'stream'
+    build_zip = materialize and not job.source_path
+    consume_uploads = _setting('ORGANIZER_CONSUME_UPLOADS', True)
+    workers = max(1, _setting('ORGANIZER_IO_WORKERS', 8))
+
+    def place(idx, item):
+        """Materialize one manifest entry; returns (record, strategy)."""
+        cat = item['category']
+        new_name = render_name(job.rename_pattern, idx, item)
+        from_path = 'source_path' in item
+        src = Path(item['source_path']) if from_path else updir / item['original_name']
+        dest = orgdir / cat / new_name
+        strategy = None
+        if from_path and job.move_sources:
+            strategy = place_file(src, dest, allow_rename=True, strategies=MOVE_STRATEGIES)
+            if strategy != 'rename':
+                src.unlink()
+        elif materialize and remote:
+            strategy = storage.copy(media_name(blob_path(item['content_hash'])), media_name(dest))
+        elif materialize:
+            source = blob_path(item['content_hash']) if item.get('content_hash') else src
+            # Upload links may be used up; the user's own files never are.
+            strategy = place_file(source, dest, allow_rename=consume_uploads and not from_path and source == src)
+        elif remote:
+            # The upload folder is on whichever node took the upload; the
+            # download reads the blob, so that is what must be there.
+            if not storage.exists(media_name(blob_path(item['content_hash']))):
+                raise FileNotFoundError(f"Blob not found for {item['original_name']}")
+        elif not src.exists():
+            raise FileNotFoundError(f'Source file not found: {src}')
+        record = FileRecord(
+            job=job,
+            original_name=item['original_name'],
+            new_name=new_name,
+            category=cat,
+            file_size=item['file_size'] if 'file_size' in item else dest.stat().st_size,
+            original_path=str(src),
+            organized_path=str(dest) if materialize else None,
+            content_hash=item.get('content_hash', ''),
+        )
+        return record, strategy
+
+    # Move and organize files; records are written in bulk at the end
+    records = []
+    organized = []
+    errors = []
+    duplicates = []
+    grouped_names = NameAllocator()
+    strategies_used = set()
+    categories = set()
+    pending = deque()
+
+    def collect(limit):
+        while len(pending) > limit:
+            item, future = pending.popleft()
+            try:
+                record, strategy = future.result()
+            except Exception as e:
+                errors.append({'file': item['original_name'], 'error': str(e)})
+                continue
+            records.append(record)
+            organized.append(item)
+            strategies_used.add(strategy)
+
+    timings = Timings()
+    with timings.stage('place') as placed, ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx, item in enumerate(Manifest.for_job(job), start=1):
+            if item.get('duplicate'):
+                duplicates.append({**item['duplicate'], 'file': item['original_name'],
+                                   'action': job.duplicate_action})
+                if job.duplicate_action == 'skip':
+                    continue
+                if job.duplicate_action == 'group':
+                    new_name = grouped_names.claim(DUPLICATES_FOLDER, render_name(job.rename_pattern, idx, item))
+                    item = {**item, 'category': DUPLICATES_FOLDER, 'new_name': new_name}
+            # Category folders are created once here, not per file.
+            if materialize and not remote and item['category'] not in categories:
+                (orgdir / item['category']).mkdir(parents=True, exist_ok=True)
+                categories.add(item['category'])
+            pending.append((item, pool.submit(place, idx, item)))
+            collect(workers * 4)
+            if idx % PROGRESS_EVERY == 0:
+                UploadJob.objects.filter(id=job.id).update(processed_files=len(records))
+        collect(0)
+        placed['files'] = len(records)
+        placed['bytes'] = sum(r.file_size for r in records)
+
+    for error in errors:
+        logger.warning('Job %s: %s: %s', job.id, error['file'], error['error'])
+
+    # Create ZIP
+    zip_path = workspace / 'jobs' / f'{job.id}.zip'
+    if zip_path.exists():
+        zip_path.unlink()
+
+    if build_zip:
+        # On remote storage the archive is built from this node's blobs.
+        members = (
+            (str(local_blob(r.content_hash, storage)) if remote else r.organized_path,
+             f'{r.category}/{r.new_name}')
+            for r in records
+        )
+        # Written aside and renamed into place, so a download never sees half an archive.
+        partial = zip_path.with_name(zip_path.name + '.part')
+        with timings.stage('archive') as archived:
+            with open(partial, 'wb') as out:
+                for chunk in stream_zip(members, policy=CompressionPolicy.from_settings(),
+                                        workers=compression_workers()):
+                    out.write(chunk)
+                    archived['bytes'] += len(chunk)
+            os.replace(partial, zip_path)
+            archived['files'] = len(records)
+        if remote:
+            with timings.stage('publish') as published:
+                publish(zip_path, storage=storage)
+                published['files'], published['bytes'] = 1, zip_path.stat().st_size
+            zip_path.unlink()
+
+    strategy = '+'.join(name for name in (*STRATEGIES, SERVER_COPY) if name in strategies_used)
+    with timings.stage('finalize') as finalized:
+        _finalize(job, records, strategy, errors, fingerprints_for(job, organized), duplicates)
+        finalized['files'] = len(records)
+
+    # Written after the fact so the finalize stage can time itself.
+    UploadJob.objects.filter(id=job.id).update(timings={**job.timings, 'organize': timings.as_dict()})
+    logger.info('Job %s organized %d files: %s', job.id, len(records), timings.summary())
+
+
+def reorganize_job(job):
+    """Bring an organized job in line with the user's current rules.
+
+    Only files whose folder changed are touched: they are renamed into
+    place (through a staging folder, so two files can swap names) and
+    their ZIP members renamed without recompressing the archive. Files
+    that can't be moved keep their old place and are added to
+    ``file_errors``. Stage timings go to ``job.timings['reorganize']``.
+    On remote storage files are moved inside the bucket and the ZIP is
+    fetched, rewritten and uploaded again.
+    """
+    workspace = ensure_workspace(job.user)
+    orgdir = organized_dir(job)
+    staging = orgdir / f'.moving-{job.id}'
+    zip_path = workspace / 'jobs' / f'{job.id}.zip'
+    storage = get_storage()
+    remote = not storage.is_local and not job.source_path
+
+    if remote:
+        def exists(path):
+            return storage.exists(media_name(path))
+
+        def relocate(src, dest):
+            storage.move(media_name(src), media_name(dest))
+    else:
+        exists = Path.exists
+
+        def relocate(src, dest):
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(src, dest)
+
+    timings = Timings()
+    with timings.stage('plan'):
+        moves = plan_reorganization(job)
+
+    staged, moved, errors = [], [], []
+    with timings.stage('move') as moving:
+        for move in moves:
+            if not move.record.organized_path:
+                staged.append(move)  # stream mode: nothing on disk to move
+                continue
+            src = Path(move.record.organized_path)
+            try:
+                if exists(src):
+                    relocate(src, staging / str(move.record.id))
+            except OSError as e:
+                errors.append({'file': move.record.original_name, 'error': str(e)})
+                continue
+            staged.append(move)
+        for move in staged:
+            if move.record.organized_path:
+                src = staging / str(move.record.id)
+                dest = orgdir / move.category / move.new_name
+                try:
+                    # A rerun interrupted after this rename finds dest in place.
+                    if exists(src) or not exists(dest):
+                        relocate(src, dest)
+                except OSError as e:
+                    errors.append({'file': move.record.original_name, 'error': str(e)})
+                    continue
+            moved.append(move)
+            moving['files'] += 1
+            moving['bytes'] += move.record.file_size
+        folders = {Path(m.record.organized_path).parent for m in moved if m.record.organized_path}
+        for folder in [] if remote else [staging, *folders]:
+            try:
+                folder.rmdir()
+            except OSError:
+                pass  # not empty, or already gone
+
+    for error in errors:
+        logger.warning('Job %s: %s: %s', job.id, error['file'], error['error'])
+
+    renames = {move.old_arcname: move.arcname for move in moved}
+    if renames and fetch(zip_path, storage):
+        partial = zip_path.with_name(zip_path.name + '.part')
+        with timings.stage('archive') as archived:
+            with open(partial, 'wb') as out:
+                for chunk in rename_zip(zip_path, renames):
+                    out.write(chunk)
+                    archived['bytes'] += len(chunk)
+            os.replace(partial, zip_path)
+            archived['files'] = len(renames)
+        if remote:
+            publish(zip_path, storage=storage)
+            zip_path.unlink()
+
+    for move in moved:
+        record = move.record
+        if record.organized_path:
+            record.organized_path = str(orgdir / move.category / move.new_name)
+        record.category, record.new_name = move.category, move.new_name
+    with timings.stage('finalize') as finalized, transaction.atomic():
+        FileRecord.objects.bulk_update(
+            [move.record for move in moved], ['category', 'new_name', 'organized_path'],
+            batch_size=RECORD_BATCH_SIZE,
+        )
+        if UploadJob.objects.filter(id=job.id).exclude(status='completed').update(status='completed'):
+            record_job_completed(job)
+        UploadJob.objects.filter(id=job.id).update(
+            rerun=False,
+            processed_files=job.files.count(),
+            completed_at=now(),
+            file_errors=job.file_errors + errors,
+        )
+        finalized['files'] = len(moved)
+
+    UploadJob.objects.filter(id=job.id).update(timings={**job.timings, 'reorganize': timings.as_dict()})
+    logger.info('Job %s reorganized, %d of %d files moved: %s',
+                job.id, len(moved), len(moves), timings.summary())
+
+
+def _finalize(job, records, strategy='', errors=(), fingerprints=(), duplicates=()):
+    """Write the job's FileRecords and mark it completed in one transaction.
+
+    The organized files' fingerprints join the user's duplicate index;
+    files already in it are left alone.
+
+    Counters are bumped with F() expressions so concurrent jobs of the same
+    user can't overwrite each other's totals. Existing records are replaced,
+    which keeps a job that was requeued after a crash from doubling up.
+    """
+    with transaction.atomic():
+        FileRecord.objects.filter(job=job).delete()
+        FileRecord.objects.bulk_create(records, batch_size=RECORD_BATCH_SIZE)
+        FileFingerprint.objects.bulk_create(
+            fingerprints, batch_size=RECORD_BATCH_SIZE, ignore_conflicts=True,
+        )
+        if any(f.perceptual_hash for f in fingerprints):
+            invalidate_fingerprints(job.user_id)
+        first_completion = UploadJob.objects.filter(id=job.id).exclude(status='completed').update(
+            status='completed',
+        )
+        UploadJob.objects.filter(id=job.id).update(
+            processed_files=len(records),
+            completed_at=now(),
+            organize_strategy=strategy,
+            file_errors=list(errors),
+            duplicates=list(duplicates),
+        )
+        if first_completion:
+            # Space saved is credited at upload, on dedup hits.
+            UserProfile.objects.filter(user_id=job.user_id).update(
+                total_files_organized=F('total_files_organized') + job.total_files,
+            )
+            record_job_completed(job)
+
+
+# === Worker pool ===
+def work(worker_name, poll_interval=1.0, stop=None, once=False):
+    """Process queued jobs until `stop` is set (or the queue drains, if `once`)."""
+    while stop is None or not stop.is_set():
+        job = claim_next(worker_name)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        logger.info('%s picked up job %s', worker_name, job.id)
+        run_job(job)
+        connections.close_all()
+
+
+def _worker_main(worker_name, poll_interval, stop):
+    # Never share the parent's database connections across a fork.
+    connections.close_all()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(worker_name, poll_interval, stop)
+
+
+def run_pool(processes=None, poll_interval=1.0):
+    """Start `processes` workers and block until interrupted."""
+    if processes is None:
+        processes = _setting('ORGANIZER_JOB_WORKERS', os.cpu_count() or 1)
+    requeued = requeue_stale()
+    if requeued:
+        logger.info('Requeued %s stale jobs', requeued)
+
+    connections.close_all()
+    stop = multiprocessing.Event()
+    host = socket.gethostname()
+    workers = [
+        multiprocessing.Process(
+            target=_worker_main,
+            args=(f'{host}:{os.getpid()}:{n}', poll_interval, stop),
+            daemon=True,
+        )
+        for n in range(processes)
+    ]
+    for proc in workers:
+        proc.start()
+
+    def _shutdown(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    try:
+        for proc in workers:
+            proc.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for proc in workers:
+            proc.join()
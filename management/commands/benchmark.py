@@ -0,0 +1,337 @@
+import gc
+import json
+import math
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import django
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ...models import UploadJob, UserProfile
+from ...ruleengine import EXT_MAP, RuleSyntaxError, parse_size
+
+
+STAGES = ('upload', 'preview', 'organize', 'download')
+
+DEFAULT_SIZES = '4KB:60,256KB:30,4MB:10'
+DEFAULT_MIX = 'images:30,documents:30,code:15,audio:5,archives:5,others:15'
+
+# Leading bytes for synthetic files, so sniffing and compression see
+# something like the real thing.
+_MAGIC = {
+    'images': b'\xff\xd8\xff\xe0',
+    'audio': b'ID3\x04',
+    'videos': b'\x00\x00\x00\x18ftypisom',
+    'archives': b'PK\x03\x04',
+    'media': b'8BPS',
+}
+_TEXT = (b'The quick brown fox jumps over the lazy dog. ' * 32)
+
+
+def _weighted(spec, parse_key):
+    """'a:3,b:1' -> ([a, b], [3, 1])."""
+    keys, weights = [], []
+    for part in spec.split(','):
+        key, _, weight = part.strip().rpartition(':')
+        if not key:
+            raise CommandError(f'Expected value:weight, got {part!r}')
+        try:
+            keys.append(parse_key(key))
+            weights.append(float(weight))
+        except (RuleSyntaxError, ValueError) as e:
+            raise CommandError(f'Bad entry {part!r}: {e}')
+    return keys, weights
+
+
+def _category(name):
+    if name != 'others' and name not in EXT_MAP:
+        raise ValueError(f'unknown category; use others or one of {", ".join(EXT_MAP)}')
+    return name
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _written_bytes():
+    """Bytes this process has passed to write() so far (Linux only)."""
+    try:
+        with open('/proc/self/io') as fh:
+            for line in fh:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_kb():
+    """Highest RSS of the whole process so far; it never goes down."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _rss_kb():
+    """Current RSS in KiB (Linux only)."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return None
+
+
+class RssSampler:
+    """Highest RSS seen while the block runs, sampled on a thread.
+
+    Unlike ru_maxrss this is per stage: a stage that allocates less than
+    an earlier one reports its own peak. None where /proc isn't available.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_kb())
+
+    def __enter__(self):
+        self.peak = _rss_kb()
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, _rss_kb())
+        return False
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Workload:
+    """Deterministic synthetic files for one benchmark configuration."""
+
+    def __init__(self, files, sizes, mix, duplicates, seed):
+        self.count = files
+        self.sizes, self.size_weights = _weighted(sizes, parse_size)
+        self.categories, self.category_weights = _weighted(mix, _category)
+        self.duplicates = duplicates
+        self.seed = seed
+
+    def files(self, iteration):
+        rng = random.Random(f'{self.seed}:{iteration}')
+        made = []
+        for i in range(self.count):
+            if made and rng.random() < self.duplicates:
+                name, data = rng.choice(made)
+                made.append((f'copy{i}_{name}', data))
+                continue
+            category = rng.choices(self.categories, self.category_weights)[0]
+            size = rng.choices(self.sizes, self.size_weights)[0]
+            ext = rng.choice(EXT_MAP[category]) if category in EXT_MAP else '.bin'
+            made.append((f'file{i:06d}{ext}', self._content(rng, category, size)))
+        return [SimpleUploadedFile(name, data) for name, data in made]
+
+    @staticmethod
+    def _content(rng, category, size):
+        if category in ('documents', 'code'):
+            data = _TEXT * (size // len(_TEXT) + 1)
+            # A unique prefix keeps files distinct for the blob store.
+            return (rng.getrandbits(64).to_bytes(8, 'big') + data)[:size]
+        return (_MAGIC.get(category, b'') + rng.randbytes(size))[:size]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark upload -> preview -> organize -> download through the Django '
+        'test client on synthetic files, in a throwaway test database and media '
+        'root. Prints JSON (per-stage p50/p99 latency, throughput, queries, '
+        'bytes written, peak RSS sampled during the stage) that can be diffed '
+        'between versions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=200, help='Files per job (default: 200).')
+        parser.add_argument('--iterations', type=int, default=5, help='Jobs to run (default: 5).')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed jobs run first (default: 1).')
+        parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help=f'Size distribution as size:weight pairs (default: {DEFAULT_SIZES}).')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help=f'Category mix as category:weight pairs (default: {DEFAULT_MIX}).')
+        parser.add_argument('--duplicates', type=float, default=0.0,
+                            help='Fraction of files that repeat an earlier file (default: 0).')
+        parser.add_argument('--zip-mode', choices=['file', 'stream'], default=None,
+                            help='Override ORGANIZER_ZIP_MODE.')
+        parser.add_argument('--seed', default='1', help='Workload seed (default: 1).')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+
+    def handle(self, *args, **options):
+        if options['files'] < 1 or options['iterations'] < 1:
+            raise CommandError('--files and --iterations must be at least 1')
+        if not 0 <= options['duplicates'] < 1:
+            raise CommandError('--duplicates must be in [0, 1)')
+        workload = Workload(options['files'], options['sizes'], options['mix'],
+                            options['duplicates'], options['seed'])
+
+        media_root = tempfile.mkdtemp(prefix='organizer-bench-')
+        overrides = {
+            'MEDIA_ROOT': media_root,
+            'ORGANIZER_RUN_JOBS_INLINE': True,
+            'ALLOWED_HOSTS': ['testserver'],
+            'DEBUG': False,
+        }
+        if options['zip_mode']:
+            overrides['ORGANIZER_ZIP_MODE'] = options['zip_mode']
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(**overrides):
+                samples = self._run(workload, options['iterations'], options['warmup'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = {
+            'config': {
+                'files': options['files'],
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'sizes': options['sizes'],
+                'mix': options['mix'],
+                'duplicates': options['duplicates'],
+                'zip_mode': options['zip_mode'] or 'default',
+                'seed': options['seed'],
+            },
+            'environment': {
+                'revision': _git_revision(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'platform': platform.platform(),
+            },
+            'stages': {stage: self._summarize(samples[stage]) for stage in STAGES},
+            'process_peak_rss_kb': _peak_rss_kb(),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+            for stage, stats in report['stages'].items():
+                self.stdout.write(
+                    f"{stage:<9} p50 {stats['p50_ms']:>9.1f} ms  p99 {stats['p99_ms']:>9.1f} ms  "
+                    f"{stats['files_per_s']:>9.1f} files/s  {stats['queries_p50']:>6} queries"
+                )
+        else:
+            self.stdout.write(output)
+
+    def _run(self, workload, iterations, warmup):
+        user = User.objects.create_user('benchmark', password='benchmark')
+        UserProfile.objects.create(user=user)
+        client = Client()
+        client.force_login(user)
+        samples = {stage: [] for stage in STAGES}
+        for iteration in range(warmup + iterations):
+            files = workload.files(iteration)
+            total_bytes = sum(f.size for f in files)
+            timed = {}
+            gc.collect()
+
+            timed['upload'] = self._measure(lambda: client.post(reverse('upload'), {
+                'files': files,
+                'job_name': f'bench {iteration}',
+                'rename_pattern': '{index:04}_{name}',
+            }), expect=302)
+
+            def preview():
+                first = client.get(reverse('preview'))
+                last = client.get(reverse('preview'), {'page': 'last'})
+                return first if first.status_code != 200 else last
+            timed['preview'] = self._measure(preview, expect=200)
+
+            timed['organize'] = self._measure(lambda: client.post(reverse('organize')), expect=302)
+            job = UploadJob.objects.filter(user=user).latest('id')
+            if job.status != 'completed':
+                raise CommandError(f'Job {job.id} ended {job.status}: {job.error_message[:500]}')
+
+            def download():
+                response = client.get(reverse('download', args=[job.id]))
+                if response.status_code == 200:
+                    for _ in response.streaming_content:
+                        pass
+                    response.close()
+                return response
+            timed['download'] = self._measure(download, expect=200)
+
+            if iteration >= warmup:
+                for stage, sample in timed.items():
+                    sample.update(files=len(files), bytes=total_bytes)
+                    samples[stage].append(sample)
+        return samples
+
+    @staticmethod
+    def _measure(call, expect):
+        written = _written_bytes()
+        with CaptureQueriesContext(connection) as queries, RssSampler() as rss:
+            start = time.perf_counter()
+            response = call()
+            elapsed = time.perf_counter() - start
+        if response.status_code != expect:
+            raise CommandError(f'{response.request["PATH_INFO"]} returned {response.status_code}')
+        after = _written_bytes()
+        return {
+            'seconds': elapsed,
+            'queries': len(queries),
+            'written': None if written is None else after - written,
+            'peak_rss_kb': rss.peak,
+        }
+
+    @staticmethod
+    def _summarize(samples):
+        seconds = [s['seconds'] for s in samples]
+        total = sum(seconds)
+        written = [s['written'] for s in samples if s['written'] is not None]
+        return {
+            'runs': len(samples),
+            'p50_ms': round(percentile(seconds, 50) * 1000, 3),
+            'p99_ms': round(percentile(seconds, 99) * 1000, 3),
+            'mean_ms': round(statistics.fmean(seconds) * 1000, 3),
+            'files_per_s': round(sum(s['files'] for s in samples) / total, 1) if total else None,
+            'mb_per_s': round(sum(s['bytes'] for s in samples) / total / 2 ** 20, 2) if total else None,
+            'queries_p50': percentile([s['queries'] for s in samples], 50),
+            'queries_max': max(s['queries'] for s in samples),
+            'bytes_written_p50': percentile(written, 50) if written else None,
+            'peak_rss_kb': max((s['peak_rss_kb'] for s in samples if s['peak_rss_kb'] is not None),
+                               default=None),
+        }
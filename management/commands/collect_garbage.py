@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...retention import collect, retention
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply the ORGANIZER_RETENTION policies: remove the upload links of '
+        'organized jobs, expire old ZIPs and organized copies, delete '
+        'abandoned and failed jobs, and remove blobs nothing uses any more.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be removed without removing anything.')
+        parser.add_argument('--sweep-blobs', action='store_true',
+                            help='Also check every blob in the store, not just those of deleted jobs.')
+        parser.add_argument('--every', type=float, default=None, metavar='SECONDS',
+                            help='Keep running, collecting every SECONDS.')
+
+    def handle(self, *args, **options):
+        if options['every'] is not None and options['every'] <= 0:
+            raise CommandError('--every must be positive')
+        self.stdout.write(f'Retention (days): {retention()}')
+        while True:
+            counts = collect(dry_run=options['dry_run'], sweep=options['sweep_blobs'])
+            self.stdout.write(', '.join(f'{kind}: {count}' for kind, count in counts.items()))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
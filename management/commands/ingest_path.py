@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from ...ingest import JobIngest
+from ...jobs import enqueue
+from ...models import FileRecord, UploadJob
+from ...naming import DEFAULT_PATTERN, PatternError, compile_pattern
+from ...scanner import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, Watcher, scan
+from ...stats import record_job_created, record_job_deleted, record_job_resized
+
+
+class Command(BaseCommand):
+    help = (
+        'Organize files already on this server (e.g. an NFS mount) without '
+        'uploading them. The directory is scanned in parallel and its files '
+        'are queued as one job. They are linked (or, with --move, moved) into '
+        'category folders; nothing is copied when the target shares the '
+        'source filesystem. Files organized by an earlier run are skipped, and '
+        '--watch keeps queueing jobs for new files.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User who owns the jobs.')
+        parser.add_argument('directory', help='Server-side directory to organize.')
+        parser.add_argument('--target',
+                            help="Where category folders go (default: the job's folder in the "
+                                 "user's workspace). Keep it on the source filesystem.")
+        parser.add_argument('--move', action='store_true',
+                            help='Move files into --target instead of linking them.')
+        parser.add_argument('--name', help='Job name (default: the directory name).')
+        parser.add_argument('--rename-pattern', default=DEFAULT_PATTERN,
+                            help=f'Rename pattern (default: {DEFAULT_PATTERN}).')
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                            help=f'Directory-scanning threads (default: {DEFAULT_WORKERS}).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'Files per manifest batch (default: {DEFAULT_BATCH_SIZE}).')
+        parser.add_argument('--inline', action='store_true',
+                            help='Organize in this process instead of queueing for run_workers.')
+        parser.add_argument('--watch', action='store_true',
+                            help='Keep running and queue a job for each batch of new files.')
+        parser.add_argument('--watch-mode', choices=['auto', 'inotify', 'poll'], default='auto',
+                            help='How to notice new files (default: inotify where available). '
+                                 'Use poll on NFS.')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between polls, or of quiet before a batch is queued (default: 5).')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}")
+        root = Path(options['directory']).resolve()
+        if not root.is_dir():
+            raise CommandError(f'{root} is not a directory')
+        target = Path(options['target']).resolve() if options['target'] else None
+        if options['move'] and target is None:
+            raise CommandError('--move needs --target')
+        try:
+            compile_pattern(options['rename_pattern'])
+        except PatternError as e:
+            raise CommandError(str(e))
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1')
+
+        skip = [target] if target is not None and target.is_relative_to(root) else []
+        # Moved files leave the tree; linked ones are remembered by their records.
+        seen = set() if options['move'] else set(
+            FileRecord.objects.filter(job__user=user, job__source_path=str(root))
+            .values_list('original_path', flat=True).iterator()
+        )
+        name = options['name'] or root.name or str(root)
+
+        if not options['watch']:
+            self._ingest(user, root, target, name, scan(root, options['workers'], options['batch_size'], skip),
+                         seen, options)
+            return
+
+        watcher = Watcher(root, options['watch_mode'], options['interval'],
+                          options['workers'], options['batch_size'], skip)
+        try:
+            self._ingest(user, root, target, name, watcher.scan(), seen, options)
+            self.stdout.write(f'Watching {root} ({watcher.mode}); Ctrl+C to stop')
+            for batch in watcher.changes():
+                self._ingest(user, root, target, f'{name} ({now():%Y-%m-%d %H:%M:%S})', [batch],
+                             seen, options)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+    def _ingest(self, user, root, target, name, batches, seen, options):
+        """Stage the unseen files in `batches` as a new job and queue it."""
+        job = UploadJob.objects.create(
+            user=user,
+            job_name=name,
+            status='pending',
+            rename_pattern=options['rename_pattern'],
+            source_path=str(root),
+            target_path=str(target) if target else '',
+            move_sources=options['move'],
+        )
+        record_job_created(job)
+        with JobIngest(job) as entries:
+            for batch in batches:
+                for path, size, mtime in batch:
+                    if path in seen:
+                        continue
+                    entries.add_source(path, size, datetime.fromtimestamp(mtime, tz=timezone.utc))
+                    seen.add(path)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{entries.count} files staged')
+
+        if not entries.count:
+            job.delete()
+            record_job_deleted(job)
+            self.stdout.write('No new files.')
+            return None
+        record_job_resized(job, entries.total_size, entries.count)
+        job.total_files, job.total_size = entries.count, entries.total_size
+        job.save(update_fields=['total_files', 'total_size'])
+
+        enqueue(job, inline=True if options['inline'] else None)
+        job.refresh_from_db()
+        self.stdout.write(self.style.SUCCESS(
+            f'Job {job.id} "{job.job_name}": {job.total_files} files ({job.status})'
+        ))
+        return job
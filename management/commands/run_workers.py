@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ... import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run the local worker pool that processes queued organize jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Number of worker processes (default: ORGANIZER_JOB_WORKERS).')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait between polls when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue in this process and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            jobs.requeue_stale()
+            jobs.work('run_workers --once', once=True)
+            return
+        self.stdout.write('Starting organize workers (Ctrl+C to stop)')
+        jobs.run_pool(options['processes'], options['poll_interval'])
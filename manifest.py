@@ -0,0 +1,100 @@
+"""Server-side manifest of the files in a job.
+
+One JSON object per line (``jobs/<id>.manifest.jsonl``) with a small
+sidecar index of byte offsets, so the preview can seek to any page
+without loading the rest of the list. The session only carries the job id.
+With remote storage the files are published at the end of ingest and
+fetched by whichever node needs them next.
+"""
+import json
+from itertools import islice
+
+from .storage import fetch
+from .workspace import ensure_workspace
+
+
+# An offset is recorded every STRIDE entries.
+STRIDE = 256
+
+
+class Manifest:
+    """Sequence-like view of a job's manifest; usable with Django's Paginator."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path.with_name(path.name + '.idx')
+        self._index = None
+
+    @classmethod
+    def for_job(cls, job):
+        manifest = cls(ensure_workspace(job.user) / 'jobs' / f'{job.id}.manifest.jsonl')
+        # Written on another node? (no-op with local storage)
+        if fetch(manifest.path):
+            fetch(manifest.index_path)
+        return manifest
+
+    def exists(self):
+        return self.path.exists()
+
+    def writer(self):
+        return ManifestWriter(self)
+
+    @property
+    def index(self):
+        if self._index is None:
+            with open(self.index_path, encoding='utf-8') as fh:
+                self._index = json.load(fh)
+        return self._index
+
+    def __len__(self):
+        return self.index['count']
+
+    def count(self):
+        return len(self)
+
+    def __iter__(self):
+        with open(self.path, encoding='utf-8') as fh:
+            for line in fh:
+                yield json.loads(line)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            items = self[key:key + 1]
+            if not items:
+                raise IndexError(key)
+            return items[0]
+        start, stop, _ = key.indices(len(self))
+        if start >= stop:
+            return []
+        block = start // STRIDE
+        with open(self.path, encoding='utf-8') as fh:
+            fh.seek(self.index['offsets'][block])
+            lines = islice(fh, start - block * STRIDE, stop - block * STRIDE)
+            return [json.loads(line) for line in lines]
+
+
+class ManifestWriter:
+    """Append entries to a new manifest; the index is written on close."""
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.count = 0
+        self._offsets = []
+
+    def __enter__(self):
+        self._fh = open(self.manifest.path, 'w', encoding='utf-8')
+        return self
+
+    def add(self, entry):
+        if self.count % STRIDE == 0:
+            self._offsets.append(self._fh.tell())
+        self._fh.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._fh.close()
+        if exc_type is None:
+            with open(self.manifest.index_path, 'w', encoding='utf-8') as fh:
+                json.dump({'count': self.count, 'offsets': self._offsets}, fh)
+        self.manifest._index = None
+        return False
@@ -0,0 +1,92 @@
+"""Put a file at a new path as cheaply as the filesystem allows.
+
+Sources and destinations normally share the MEDIA_ROOT filesystem, so a
+new directory entry is enough; bytes are only copied when nothing cheaper
+works. Strategies, in the order they are tried:
+
+* ``link``    hard link (same inode, no data written)
+* ``reflink`` FICLONE copy-on-write clone (btrfs, XFS, ...)
+* ``rename``  move the source, for single-use sources only
+* ``copy``    in-kernel copy_file_range()/sendfile(), userspace as a last resort
+"""
+import os
+import errno
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+STRATEGIES = ('link', 'reflink', 'rename', 'copy')
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+
+_COPY_CHUNK = 64 * 1024 * 1024
+
+
+def _link(src, dest):
+    os.link(src, dest)
+
+
+def _reflink(src, dest):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, 'reflink not supported on this platform')
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dest)
+            raise
+    shutil.copystat(src, dest)
+
+
+def _rename(src, dest):
+    os.rename(src, dest)
+
+
+def _copy(src, dest):
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), _COPY_CHUNK):
+                    pass
+            shutil.copystat(src, dest)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    # shutil.copyfile() uses sendfile() on platforms that have it.
+    shutil.copy2(src, dest)
+
+
+_IMPLEMENTATIONS = {
+    'link': _link,
+    'reflink': _reflink,
+    'rename': _rename,
+    'copy': _copy,
+}
+
+
+def materialize(src, dest, allow_rename=False, strategies=STRATEGIES):
+    """Make `dest` hold the contents of `src`; returns the strategy used.
+
+    `rename` is only tried with ``allow_rename=True``, i.e. when nothing
+    else needs `src` afterwards. An existing `dest` is replaced.
+    """
+    src, dest = os.fspath(src), os.fspath(dest)
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    last_error = None
+    for name in strategies:
+        if name == 'rename' and not allow_rename:
+            continue
+        try:
+            _IMPLEMENTATIONS[name](src, dest)
+            return name
+        except OSError as e:
+            last_error = e
+    raise last_error or OSError(errno.EINVAL, f'No strategy could materialize {src}')
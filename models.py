@@ -6,13 +6,33 @@ from django.utils.timezone import now
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     total_files_organized = models.IntegerField(default=0)
-    total_space_saved = models.BigIntegerField(default=0)  # in bytes
+    total_space_saved = models.BigIntegerField(default=0)  # in bytes, deduplicated away
+    rules_version = models.IntegerField(default=0)  # bumped whenever custom rules change
+    fingerprints_version = models.IntegerField(default=0)  # bumped whenever the duplicate index changes
+    storage_quota = models.BigIntegerField(null=True, blank=True)  # in bytes; None = ORGANIZER_USER_QUOTA
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.user.username} Profile"
 
 
+class UserStats(models.Model):
+    """Dashboard totals, maintained incrementally by stats.py."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats')
+    total_jobs = models.IntegerField(default=0)
+    completed_jobs = models.IntegerField(default=0)
+    total_files = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)  # in bytes, all jobs
+    stored_size = models.BigIntegerField(default=0)  # in bytes, jobs stored under MEDIA_ROOT
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'user stats'
+
+    def __str__(self):
+        return f"{self.user.username} Stats"
+
+
 class CustomRule(models.Model):
     MATCH_TYPE_CHOICES = [
         ('extension', 'File Extension'),
@@ -43,6 +63,11 @@ class UploadJob(models.Model):
         ('completed', 'Completed'),
         ('failed', 'Failed'),
     ]
+    DUPLICATE_ACTION_CHOICES = [
+        ('keep', 'Keep in place'),
+        ('group', 'Group in duplicates/'),
+        ('skip', 'Skip'),
+    ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_jobs')
     job_name = models.CharField(max_length=255, default='Untitled Job')
@@ -50,29 +75,130 @@ class UploadJob(models.Model):
     total_files = models.IntegerField(default=0)
     processed_files = models.IntegerField(default=0)
     total_size = models.BigIntegerField(default=0)  # in bytes
+    rename_pattern = models.CharField(max_length=255, default='{index}_{name}')
+    unpack_archives = models.BooleanField(default=False)  # stage .zip/.tar members, not the archive
+    # Server-side ingestion (ingest_path): files stay where they are and are
+    # linked, or moved, into target_path instead of the job folder.
+    source_path = models.CharField(max_length=1024, blank=True, default='')
+    target_path = models.CharField(max_length=1024, blank=True, default='')
+    move_sources = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    error_message = models.TextField(blank=True, default='')
+    file_errors = models.JSONField(default=list, blank=True)  # [{'file': ..., 'error': ...}]
+    organize_strategy = models.CharField(max_length=50, blank=True, default='')  # e.g. 'link' or 'link+copy'
+    duplicate_action = models.CharField(max_length=10, choices=DUPLICATE_ACTION_CHOICES, default='keep')
+    duplicates_found = models.IntegerField(default=0)  # counted at upload
+    duplicates = models.JSONField(default=list, blank=True)  # [{'file', 'kind', 'of', 'job_name', 'action'}]
+    rerun = models.BooleanField(default=False)  # queued to re-apply the rules to an organized job
+    timings = models.JSONField(default=dict, blank=True)  # {'upload': {stage: metrics}, 'organize': {...}}
+    # Set by retention.py once uploads/<id>/, and later the ZIP and organized
+    # copies, have been removed; downloads are then built from the blobs.
+    staging_purged = models.BooleanField(default=False)
+    archive_expired_at = models.DateTimeField(null=True, blank=True)
     zip_file = models.FileField(upload_to='jobs/', null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status', 'created_at'], name='job_user_status_created'),
+            models.Index(fields=['user', 'created_at'], name='job_user_created'),
+        ]
 
     def __str__(self):
         return f"{self.job_name} - {self.status}"
 
+    @property
+    def progress_percent(self):
+        if not self.total_files:
+            return 100 if self.status == 'completed' else 0
+        return min(100, round(self.processed_files * 100 / self.total_files))
+
 
 class FileRecord(models.Model):
     job = models.ForeignKey(UploadJob, on_delete=models.CASCADE, related_name='files')
-    original_name = models.CharField(max_length=255)
+    original_name = models.CharField(max_length=255, db_index=True)
     new_name = models.CharField(max_length=255)
     category = models.CharField(max_length=50)
     file_size = models.BigIntegerField()  # in bytes
-    original_path = models.CharField(max_length=500)
-    organized_path = models.CharField(max_length=500, null=True, blank=True)
+    original_path = models.CharField(max_length=1024)
+    organized_path = models.CharField(max_length=1024, null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)  # sha256 of the blob
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['job', 'category', 'created_at'], name='file_job_category_created'),
+            models.Index(fields=['job', 'created_at'], name='file_job_created'),
+        ]
 
     def __str__(self):
         return f"{self.original_name} → {self.new_name}"
+
+
+class ContentSignature(models.Model):
+    """Cached content-sniffing verdict for a blob (see sniff.py)."""
+    content_hash = models.CharField(max_length=64, unique=True)  # sha256 of the blob
+    category = models.CharField(max_length=50, blank=True, default='')  # '' = not recognised
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} → {self.category or '?'}"
+
+
+class FileFingerprint(models.Model):
+    """A distinct file a user has organized, indexed for duplicate checks (see dedupe.py)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fingerprints')
+    content_hash = models.CharField(max_length=64)  # sha256 of the blob
+    file_size = models.BigIntegerField()  # in bytes
+    perceptual_hash = models.CharField(max_length=16, blank=True, default='')  # dHash in hex, images only
+    job = models.ForeignKey(UploadJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    original_name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_hash'], name='unique_user_fingerprint'),
+        ]
+
+    def __str__(self):
+        return f"{self.original_name} ({self.content_hash[:12]})"
+
+
+class ChunkedFile(models.Model):
+    """A file being sent in chunks through the resumable upload API."""
+    job = models.ForeignKey(UploadJob, on_delete=models.CASCADE, related_name='chunked_files')
+    index = models.IntegerField()  # position in the job, 0-based
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()  # in bytes
+    last_modified = models.DateTimeField(null=True, blank=True)  # as reported by the client
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['index']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='unique_chunked_file_index'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.job_id}#{self.index})"
+
+
+class UploadChunk(models.Model):
+    file = models.ForeignKey(ChunkedFile, on_delete=models.CASCADE, related_name='chunks')
+    offset = models.BigIntegerField()
+    length = models.BigIntegerField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['offset']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'offset'], name='unique_upload_chunk_offset'),
+        ]
+
+    def __str__(self):
+        return f"{self.file.name} @{self.offset}+{self.length}"
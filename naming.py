@@ -0,0 +1,167 @@
+"""Rename patterns.
+
+A pattern is a str.format template over these tokens:
+
+    {index}     position in the job, 1-based; {index:04} zero-pads
+    {name}      original file name
+    {stem}      name without its extension
+    {ext}       extension including the dot ('' if none)
+    {category}  folder the file is sorted into
+    {date}      modified date (upload date if unknown); {date:%Y%m%d}
+    {size}      size in bytes
+    {hash}      first 8 hex digits of the content hash ({sha256} for all)
+
+Patterns are parsed and checked once by `compile_pattern`, which returns a
+function per pattern, so rendering a file is a join over prepared parts.
+`NameAllocator` then makes names unique per folder.
+"""
+import string
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import PurePosixPath
+
+
+DEFAULT_PATTERN = '{index}_{name}'
+
+TOKENS = ('index', 'name', 'stem', 'ext', 'category', 'date', 'size', 'hash', 'sha256')
+_CONVERSIONS = {'s': str, 'r': repr, 'a': ascii}
+
+_SAMPLE = {
+    'original_name': 'sample.txt',
+    'category': 'documents',
+    'file_size': 1024,
+    'content_hash': '0' * 64,
+    'modified': 0,
+}
+
+
+class PatternError(ValueError):
+    """A rename pattern that can't be compiled."""
+
+
+def _token_values(index, item):
+    name = item['original_name']
+    path = PurePosixPath(name)
+    modified = item.get('modified', item.get('uploaded'))
+    content_hash = item.get('content_hash', '')
+    return {
+        'index': index,
+        'name': name,
+        'stem': path.stem if path.suffix else name,
+        'ext': path.suffix,
+        'category': item.get('category', ''),
+        'date': datetime.fromtimestamp(modified).date() if modified is not None else date.today(),
+        'size': item.get('file_size', 0),
+        'hash': content_hash[:8],
+        'sha256': content_hash,
+    }
+
+
+def _safe_name(name):
+    name = name.replace('/', '_').replace('\\', '_').strip()
+    return '' if name in ('', '.', '..') else name
+
+
+class RenamePattern:
+    """A compiled rename pattern; call it with (index, manifest entry)."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self._parts = []
+        try:
+            parsed = list(string.Formatter().parse(pattern))
+        except ValueError as e:
+            raise PatternError(f'Invalid pattern: {e}')
+        for literal, field, spec, conversion in parsed:
+            if field is None:
+                self._parts.append((literal, None, '', None))
+                continue
+            if field not in TOKENS:
+                raise PatternError(
+                    f'Unknown token {{{field}}}; use one of '
+                    + ', '.join(f'{{{t}}}' for t in TOKENS)
+                )
+            if '{' in spec:
+                raise PatternError('Nested {…} in a format spec is not supported')
+            self._parts.append((literal, field, spec, conversion))
+        self.tokens = frozenset(field for _, field, _, _ in self._parts if field)
+        if not self.tokens:
+            raise PatternError('The pattern must contain at least one {token}')
+        try:
+            self(1, _SAMPLE)
+        except (ValueError, TypeError) as e:
+            raise PatternError(f'Invalid pattern: {e}')
+
+    def __call__(self, index, item):
+        values = _token_values(index, item)
+        out = []
+        for literal, field, spec, conversion in self._parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion:
+                value = _CONVERSIONS[conversion](value)
+            out.append(format(value, spec))
+        return _safe_name(''.join(out)) or f"{index}_{item['original_name']}"
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(pattern):
+    """Compiled `pattern`; raises PatternError if it is invalid."""
+    return RenamePattern(pattern)
+
+
+def render_name(pattern, index, item):
+    """New file name for the `index`-th (1-based) manifest entry.
+
+    Entries staged since names were resolved at upload carry their final
+    `new_name`; older ones are rendered here, falling back to the default
+    pattern if theirs is invalid.
+    """
+    if item.get('new_name'):
+        return item['new_name']
+    try:
+        return compile_pattern(pattern)(index, item)
+    except PatternError:
+        return compile_pattern(DEFAULT_PATTERN)(index, item)
+
+
+class NameAllocator:
+    """Hands out names that are unique per folder ('a.txt', 'a_2.txt', ...).
+
+    Names are compared case-insensitively so archives extract cleanly on
+    case-insensitive filesystems. Each claim is a set lookup; a per-name
+    counter means repeated collisions don't rescan earlier suffixes.
+    `exists(folder, name)`, if given, reports names already taken outside
+    the allocator, e.g. files already in a shared target folder.
+    """
+
+    def __init__(self, exists=None):
+        self._taken = set()
+        self._next_suffix = {}
+        self._exists = exists
+
+    def _free(self, folder, name, key):
+        return key not in self._taken and not (self._exists and self._exists(folder, name))
+
+    def is_free(self, folder, name):
+        return self._free(folder, name, (folder, name.casefold()))
+
+    def claim(self, folder, name):
+        key = (folder, name.casefold())
+        if self._free(folder, name, key):
+            self._taken.add(key)
+            return name
+        path = PurePosixPath(name)
+        stem, ext = (path.stem, path.suffix) if path.suffix else (name, '')
+        n = self._next_suffix.get(key, 2)
+        while True:
+            candidate = f'{stem}_{n}{ext}'
+            candidate_key = (folder, candidate.casefold())
+            n += 1
+            if self._free(folder, candidate, candidate_key):
+                break
+        self._next_suffix[key] = n
+        self._taken.add(candidate_key)
+        return candidate
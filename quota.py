@@ -0,0 +1,84 @@
+"""Per-user storage quotas.
+
+A user's usage is the size of the jobs whose files are stored under
+MEDIA_ROOT, UserStats.stored_size; server-side jobs (see ingest_path)
+don't count. stats.py keeps it current as jobs are created, resized and
+deleted (retention.py deletes jobs the same way), so checking a quota is
+one row read, never a walk over the workspace. Quotas are checked before
+an upload's bytes reach the blob store: when a chunked upload session
+declares its files, before any chunk is sent, and for a form upload from
+its Content-Length (by then CsrfViewMiddleware has already spooled the
+body to temporary files). Archives being unpacked are checked member by
+member with `JobQuota`, since only then is their size known.
+`acheck_quota` is the same check for async views, through the async ORM.
+Users free space by deleting jobs (see retention.discard_job).
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+
+from .models import UserProfile, UserStats
+from .stats import get_stats, rebuild_stats
+
+
+# Allowance for multipart boundaries and form fields when a form upload
+# is checked by its Content-Length, before the files are stored.
+FORM_OVERHEAD = 64 * 1024
+
+
+class QuotaExceeded(Exception):
+    """Storing the upload would take the user over their quota."""
+
+
+def quota_for(user):
+    """The user's quota in bytes, or None for no limit."""
+    quota = UserProfile.objects.filter(user=user).values_list('storage_quota', flat=True).first()
+    if quota is None:
+        quota = getattr(settings, 'ORGANIZER_USER_QUOTA', None)
+    return quota
+
+
+def usage(user):
+    return get_stats(user).stored_size
+
+
+def _check(quota, used, incoming):
+    if used + incoming > quota:
+        raise QuotaExceeded(
+            f'This upload needs {filesizeformat(incoming)} but only '
+            f'{filesizeformat(max(0, quota - used))} of your {filesizeformat(quota)} quota is left.'
+        )
+
+
+def check_quota(user, incoming):
+    """Raise QuotaExceeded unless `incoming` more bytes fit in the user's quota."""
+    quota = quota_for(user)
+    if quota is not None:
+        _check(quota, usage(user), incoming)
+
+
+class JobQuota:
+    """Checks the bytes staged into a job against its owner's quota as they grow.
+
+    The job's declared size was counted in the owner's usage when it was
+    created, so it is left out of the baseline.
+    """
+
+    def __init__(self, job):
+        self.quota = quota_for(job.user)
+        self.used = usage(job.user) - job.total_size if self.quota is not None else 0
+
+    def check(self, staged):
+        """Raise QuotaExceeded unless the job can hold `staged` bytes in all."""
+        if self.quota is not None:
+            _check(self.quota, self.used, staged)
+
+
+async def acheck_quota(user, incoming):
+    quota = await UserProfile.objects.filter(user=user).values_list('storage_quota', flat=True).afirst()
+    if quota is None:
+        quota = getattr(settings, 'ORGANIZER_USER_QUOTA', None)
+    if quota is None:
+        return
+    stats = await UserStats.objects.filter(user=user).afirst() or await sync_to_async(rebuild_stats)(user.pk)
+    _check(quota, stats.stored_size, incoming)
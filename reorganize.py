@@ -0,0 +1,95 @@
+"""Re-apply a user's current rules to a job that is already organized.
+
+`plan` reclassifies every organized file and returns only the ones whose
+folder or name would change; the worker (see jobs.reorganize_job) then
+moves just those files and renames their ZIP members. Files keep their
+names, unless the pattern names their folder or the name is taken in the
+folder they move to; those are rendered again and made unique.
+"""
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+from .dedupe import DUPLICATES_FOLDER
+from .ingest import classify
+from .manifest import Manifest
+from .naming import NameAllocator, PatternError, compile_pattern, render_name
+from .ruleengine import get_matcher
+from .sniff import sniff_mode
+
+
+class Move:
+    """A FileRecord whose destination changed."""
+
+    __slots__ = ('record', 'category', 'new_name')
+
+    def __init__(self, record, category, new_name):
+        self.record = record
+        self.category = category
+        self.new_name = new_name
+
+    @property
+    def old_arcname(self):
+        return f'{self.record.category}/{self.record.new_name}'
+
+    @property
+    def arcname(self):
+        return f'{self.category}/{self.new_name}'
+
+
+def _entries(job, records):
+    """(index, manifest entry, record) for each of the job's FileRecords.
+
+    Entries are matched to records on (name, content hash) in manifest
+    order. Without a manifest the records themselves stand in, dated by
+    when they were organized.
+    """
+    manifest = Manifest.for_job(job)
+    if not manifest.exists():
+        for idx, record in enumerate(records, start=1):
+            yield idx, {
+                'original_name': record.original_name,
+                'file_size': record.file_size,
+                'content_hash': record.content_hash,
+                'modified': int(record.created_at.timestamp()),
+            }, record
+        return
+    by_key = defaultdict(deque)
+    for record in records:
+        by_key[record.original_name, record.content_hash].append(record)
+    for idx, entry in enumerate(manifest, start=1):
+        matches = by_key.get((entry['original_name'], entry.get('content_hash', '')))
+        if matches:
+            yield idx, entry, matches.popleft()
+
+
+def plan(job):
+    """The `Move`s needed to bring `job` in line with its owner's rules."""
+    matcher = get_matcher(job.user)
+    mode = sniff_mode()
+    records = list(job.files.order_by('id'))
+    changed = []
+    for idx, entry, record in _entries(job, records):
+        if record.category == DUPLICATES_FOLDER and entry.get('duplicate'):
+            continue
+        modified = datetime.fromtimestamp(entry['modified'], tz=timezone.utc) if 'modified' in entry else None
+        category = classify(matcher, mode, record.original_name, record.content_hash,
+                            record.file_size, modified, path=record.organized_path or record.original_path)
+        if category != record.category:
+            changed.append((idx, entry, record, category))
+
+    names = NameAllocator()
+    moving = {record.id for _, _, record, _ in changed}
+    for record in records:
+        if record.id not in moving:
+            names.claim(record.category, record.new_name)
+    try:
+        renames = 'category' in compile_pattern(job.rename_pattern).tokens
+    except PatternError:
+        renames = False
+    moves = []
+    for idx, entry, record, category in changed:
+        name = record.new_name
+        if renames or not names.is_free(category, name):
+            name = render_name(job.rename_pattern, idx, {**entry, 'category': category, 'new_name': None})
+        moves.append(Move(record, category, names.claim(category, name)))
+    return moves
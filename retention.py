@@ -0,0 +1,245 @@
+"""Retention: deleting what jobs no longer need, and jobs nobody wants.
+
+`collect` applies ORGANIZER_RETENTION, the number of days to keep each kind
+of data (None keeps it forever):
+
+* ``staging``: the ``uploads/<id>/`` links of organized jobs. Organizing
+  reads the blobs, so these are only needed until then.
+* ``archives``: ``jobs/<id>.zip`` and the ``jobs/<id>/`` tree of organized
+  jobs. Downloads are then streamed from the blobs, as with
+  ORGANIZER_ZIP_MODE = 'stream', and re-applying rules just relabels.
+* ``abandoned``: jobs uploaded but never organized. The job is deleted.
+* ``failed``: failed jobs, deleted likewise.
+
+Deleting a job gives its bytes back to the owner's quota (see quota.py);
+`discard_job` does that for a single job, when its owner deletes it.
+Blobs that only deleted jobs used go too. A blob is garbage once nothing
+links to it (link count 1), no FileRecord names it and it is at least
+SWEEP_MIN_AGE old: uploads touch the blobs they reuse before linking them.
+`sweep_blobs` checks the whole store that way, for blobs orphaned by
+crashes and those that were too young. The target folders of server-side
+jobs (ingest_path) are never touched.
+"""
+import os
+import shutil
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from .archivecache import ArchiveCache
+from .blobstore import blob_path, blob_root
+from .jobs import organized_dir
+from .manifest import Manifest
+from .models import FileRecord, UploadJob
+from .stats import record_job_deleted
+from .storage import get_storage, media_name
+from .workspace import ensure_workspace
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION = {'staging': 0, 'archives': 30, 'abandoned': 2, 'failed': 30}
+# Blobs and temporary files younger than this are left to the uploads
+# that may still be linking them.
+SWEEP_MIN_AGE = 3600
+SWEEP_BATCH_SIZE = 500
+
+
+def retention():
+    return {**DEFAULT_RETENTION, **getattr(settings, 'ORGANIZER_RETENTION', {})}
+
+
+class Collector:
+    """One pass of garbage collection; counts what it removed (or would, in a dry run)."""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.storage = get_storage()
+        self.counts = Counter(dict.fromkeys(
+            ['staging', 'archives', 'abandoned', 'failed', 'blobs', 'bytes_freed'], 0,
+        ))
+
+    # --- Removing files ---
+    def _remove(self, path):
+        """Delete a file or tree, counting the bytes actually freed (last links only)."""
+        if not os.path.lexists(path):
+            return
+        if os.path.isdir(path) and not os.path.islink(path):
+            for folder, _, names in os.walk(path):
+                for name in names:
+                    self._count(os.path.join(folder, name))
+            if not self.dry_run:
+                shutil.rmtree(path, ignore_errors=True)
+        else:
+            self._count(path)
+            if not self.dry_run:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def _count(self, path):
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return
+        if st.st_nlink == 1:
+            self.counts['bytes_freed'] += st.st_size
+
+    def _remove_remote(self, paths):
+        if self.storage.is_local or self.dry_run:
+            return
+        for path in paths:
+            self.storage.delete(media_name(path))
+
+    # --- Jobs ---
+    def purge_staging(self, job):
+        self._remove(ensure_workspace(job.user) / 'uploads' / str(job.id))
+        if not self.dry_run:
+            UploadJob.objects.filter(id=job.id).update(staging_purged=True)
+        self.counts['staging'] += 1
+
+    def expire_archive(self, job):
+        jobs_dir = ensure_workspace(job.user) / 'jobs'
+        zip_path = jobs_dir / f'{job.id}.zip'
+        organized = list(job.files.exclude(organized_path=None).values_list('organized_path', flat=True))
+        self._remove(zip_path)
+        self._remove(jobs_dir / str(job.id))
+        self._remove_remote([zip_path, *organized])
+        if not self.dry_run:
+            with transaction.atomic():
+                job.files.update(organized_path=None)
+                UploadJob.objects.filter(id=job.id).update(archive_expired_at=now())
+        self.counts['archives'] += 1
+
+    def delete_job(self, job, reason):
+        """Delete the job and its files; returns the content hashes it used."""
+        jobs_dir = ensure_workspace(job.user) / 'jobs'
+        manifest = Manifest.for_job(job)
+        hashes = set(job.files.exclude(content_hash='').values_list('content_hash', flat=True))
+        if manifest.exists():
+            hashes.update(entry['content_hash'] for entry in manifest if entry.get('content_hash'))
+        organized = list(job.files.exclude(organized_path=None).values_list('organized_path', flat=True))
+
+        published = [manifest.path, manifest.index_path, jobs_dir / f'{job.id}.zip']
+        for path in published + [jobs_dir / f'{job.id}.prof',
+                                 ensure_workspace(job.user) / 'uploads' / str(job.id)]:
+            self._remove(path)
+        if not job.source_path:
+            self._remove(organized_dir(job))
+            self._remove_remote(organized)
+        self._remove_remote(published)
+        if not self.dry_run:
+            ArchiveCache().discard(job.id)
+            with transaction.atomic():
+                job.delete()
+                record_job_deleted(job)
+        self.counts[reason] += 1
+        return hashes
+
+    # --- Blobs ---
+    def collect_blobs(self, digests):
+        """Delete the blobs among `digests` that nothing uses any more."""
+        cutoff = time.time() - SWEEP_MIN_AGE
+        digests = iter(digests)
+        while True:
+            batch = list(islice(digests, SWEEP_BATCH_SIZE))
+            if not batch:
+                return
+            unlinked = []
+            for digest in batch:
+                try:
+                    st = os.stat(blob_path(digest))
+                except FileNotFoundError:
+                    continue
+                # A young blob may belong to an upload that hasn't linked it yet.
+                if st.st_nlink == 1 and st.st_mtime < cutoff:
+                    unlinked.append(digest)
+            used = set(
+                FileRecord.objects.filter(content_hash__in=unlinked).values_list('content_hash', flat=True)
+            )
+            for digest in unlinked:
+                if digest not in used:
+                    self._remove(blob_path(digest))
+                    self._remove_remote([blob_path(digest)])
+                    self.counts['blobs'] += 1
+
+    def sweep_blobs(self):
+        """Check the whole blob store, and clear out stale temporary files."""
+        cutoff = time.time() - SWEEP_MIN_AGE
+        root = blob_root()
+
+        def old_files(folder):
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                            yield entry
+            except FileNotFoundError:
+                return
+
+        for entry in old_files(root / 'tmp'):
+            self._remove(entry.path)
+
+        def digests():
+            for first in sorted(os.listdir(root)) if root.exists() else ():
+                if len(first) != 2:
+                    continue
+                for second in sorted(os.listdir(root / first)):
+                    yield from (entry.name for entry in old_files(root / first / second))
+
+        self.collect_blobs(digests())
+
+    # --- Policies ---
+    def run(self, at=None, sweep=False):
+        at = at or now()
+        days = retention()
+
+        def older_than(name):
+            return None if days[name] is None else at - timedelta(days=days[name])
+
+        garbage = set()
+        cutoff = older_than('abandoned')
+        if cutoff is not None:
+            for job in UploadJob.objects.filter(status='pending', queued_at__isnull=True,
+                                                created_at__lt=cutoff).select_related('user').iterator():
+                garbage |= self.delete_job(job, 'abandoned')
+        cutoff = older_than('failed')
+        if cutoff is not None:
+            for job in UploadJob.objects.filter(status='failed', completed_at__lt=cutoff) \
+                    .select_related('user').iterator():
+                garbage |= self.delete_job(job, 'failed')
+
+        organized = UploadJob.objects.filter(status='completed', source_path='').select_related('user')
+        cutoff = older_than('staging')
+        if cutoff is not None:
+            for job in organized.filter(staging_purged=False, completed_at__lt=cutoff).iterator():
+                self.purge_staging(job)
+        cutoff = older_than('archives')
+        if cutoff is not None:
+            for job in organized.filter(archive_expired_at__isnull=True, completed_at__lt=cutoff).iterator():
+                self.expire_archive(job)
+
+        self.collect_blobs(garbage)
+        if sweep:
+            self.sweep_blobs()
+        logger.info('Garbage collection%s: %s', ' (dry run)' if self.dry_run else '', self.counts)
+        return self.counts
+
+
+def discard_job(job):
+    """Delete one job now, with its files and the blobs only it used."""
+    collector = Collector()
+    collector.collect_blobs(collector.delete_job(job, 'deleted'))
+    return collector.counts
+
+
+def collect(dry_run=False, sweep=False, at=None):
+    """Apply the retention policies once; returns what was removed, by kind."""
+    return Collector(dry_run).run(at, sweep)
@@ -0,0 +1,328 @@
+"""Compile a user's CustomRules and EXT_MAP into a single classifier.
+
+Every enabled rule gets a rank (its position on the rules page; the top
+rule wins). Rules are then grouped by kind into structures that answer
+"best rank for this file" in one step each:
+
+* extension rules and EXT_MAP  -> one dict lookup
+* name rules                   -> one combined, anchored regex
+* size / date ranges           -> non-overlapping segments + bisect
+* month-name date rules        -> one dict lookup
+
+so classifying a file costs a handful of lookups no matter how many rules
+the user has. Compiled matchers are cached per process and invalidated by
+bumping ``UserProfile.rules_version``.
+"""
+import re
+import bisect
+import fnmatch
+import calendar
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.db.models import F
+
+from .models import CustomRule, UserProfile
+
+
+EXT_MAP = {
+    'images': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico'],
+    'documents': ['.pdf', '.doc', '.docx', '.txt', '.odt', '.rtf', '.xlsx', '.csv'],
+    'videos': ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv'],
+    'audio': ['.mp3', '.wav', '.m4a', '.flac', '.aac', '.wma'],
+    'archives': ['.zip', '.tar', '.gz', '.rar', '.7z', '.bz2'],
+    'code': ['.py', '.js', '.html', '.css', '.java', '.cpp', '.c', '.go', '.rs'],
+    'media': ['.psd', '.ai', '.sketch', '.fig'],
+}
+
+EXT_INDEX = {ext: cat for cat, exts in EXT_MAP.items() for ext in exts}
+
+DEFAULT_CATEGORY = 'others'
+
+_SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2,
+               'G': 1024 ** 3, 'GB': 1024 ** 3, 'T': 1024 ** 4, 'TB': 1024 ** 4}
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?B?)\s*$', re.IGNORECASE)
+_MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+_REGEX_META = set('^$()+|\\{}')
+
+# Unbounded ends of size/date ranges.
+_LOW = float('-inf')
+_HIGH = float('inf')
+
+
+class RuleSyntaxError(ValueError):
+    """A rule's match_value can't be understood."""
+
+
+def safe_folder(name):
+    """Turn a rule's target_folder into a single safe directory name."""
+    name = re.sub(r'[\\/]+', '-', name.strip()).strip('.- ')
+    return name[:50] or DEFAULT_CATEGORY
+
+
+def _strip_prefix(value, prefix):
+    value = value.strip()
+    if value.lower().startswith(prefix + ':'):
+        value = value[len(prefix) + 1:].strip()
+    return value
+
+
+def parse_size(value):
+    match = _SIZE_RE.match(value)
+    if not match:
+        raise RuleSyntaxError(f'Not a size: {value!r}')
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.upper()])
+
+
+def parse_size_range(value):
+    """'>10MB', '<=1GB', '1MB-10MB' or '1MB..10MB' -> half-open [low, high)."""
+    value = _strip_prefix(value, 'size')
+    for op in ('>=', '<=', '>', '<'):
+        if value.startswith(op):
+            size = parse_size(value[len(op):])
+            return {
+                '>=': (size, _HIGH),
+                '>': (size + 1, _HIGH),
+                '<=': (_LOW, size + 1),
+                '<': (_LOW, size),
+            }[op]
+    for sep in ('..', '-'):
+        if sep in value:
+            low, high = value.split(sep, 1)
+            return parse_size(low), parse_size(high) + 1
+    size = parse_size(value)
+    return size, size + 1
+
+
+def _parse_period(value):
+    """'2024', '2024-03' or '2024-03-15' -> (start, end) as UTC timestamps."""
+    parts = value.strip().split('-')
+    try:
+        numbers = [int(p) for p in parts]
+        if len(numbers) == 1:
+            start = datetime(numbers[0], 1, 1)
+            end = datetime(numbers[0] + 1, 1, 1)
+        elif len(numbers) == 2:
+            start = datetime(numbers[0], numbers[1], 1)
+            end = datetime(numbers[0] + numbers[1] // 12, numbers[1] % 12 + 1, 1)
+        elif len(numbers) == 3:
+            start = datetime(*numbers)
+            end = start + timedelta(days=1)
+        else:
+            raise ValueError
+    except ValueError:
+        raise RuleSyntaxError(f'Not a date: {value!r}')
+    return (start.replace(tzinfo=dt_timezone.utc).timestamp(),
+            end.replace(tzinfo=dt_timezone.utc).timestamp())
+
+
+def parse_date_rule(value):
+    """Return ('month', n) for month names, else ('range', (low, high))."""
+    value = _strip_prefix(value, 'date')
+    if value.lower() in _MONTHS:
+        return 'month', _MONTHS[value.lower()]
+    for op in ('>=', '<=', '>', '<'):
+        if value.startswith(op):
+            start, end = _parse_period(value[len(op):])
+            return 'range', {
+                '>=': (start, _HIGH),
+                '>': (end, _HIGH),
+                '<=': (_LOW, end),
+                '<': (_LOW, start),
+            }[op]
+    if '..' in value:
+        low, high = value.split('..', 1)
+        return 'range', (_parse_period(low)[0], _parse_period(high)[1])
+    return 'range', _parse_period(value)
+
+
+def name_pattern(value):
+    """Regex source for a name rule; globs ('invoice*') match the whole name."""
+    value = _strip_prefix(value, 'name')
+    if value.lower().startswith('re:'):
+        source = value[3:]
+    elif any(c in value for c in '*?[') and not _REGEX_META & set(value):
+        return fnmatch.translate(value)
+    else:
+        source = value
+    try:
+        re.compile(source)
+    except re.error:
+        source = re.escape(source)
+    return f'.*?(?:{source})'
+
+
+def extensions(value):
+    value = _strip_prefix(value, 'ext')
+    for ext in re.split(r'[\s,;]+', value):
+        ext = ext.strip().lstrip('*').lower()
+        if ext:
+            yield ext if ext.startswith('.') else f'.{ext}'
+
+
+def validate_rule(rule_type, match_value):
+    """Raise RuleSyntaxError if `match_value` can't be compiled for `rule_type`."""
+    if rule_type == 'extension':
+        if not list(extensions(match_value)):
+            raise RuleSyntaxError('Give at least one extension, e.g. .pdf')
+    elif rule_type == 'name':
+        try:
+            re.compile(name_pattern(match_value))
+        except re.error as e:
+            raise RuleSyntaxError(f'Invalid pattern: {e}')
+    elif rule_type == 'size':
+        parse_size_range(match_value)
+    elif rule_type == 'date':
+        parse_date_rule(match_value)
+
+
+class _Segments:
+    """Map a number to the best-ranked interval covering it, via bisect."""
+
+    def __init__(self, intervals):
+        # intervals: [(low, high, rank, category)]; split into elementary
+        # segments and keep the winning rule for each one.
+        bounds = sorted({b for low, high, _, _ in intervals for b in (low, high)})
+        self.starts = []
+        self.winners = []
+        for low, high in zip(bounds, bounds[1:]):
+            best = None
+            for ilow, ihigh, rank, category in intervals:
+                if ilow <= low and high <= ihigh and (best is None or rank < best[0]):
+                    best = (rank, category)
+            self.starts.append(low)
+            self.winners.append(best)
+        self.end = bounds[-1] if bounds else _LOW
+
+    def lookup(self, value):
+        if value is None or value >= self.end:
+            return None
+        i = bisect.bisect_right(self.starts, value) - 1
+        return self.winners[i] if i >= 0 else None
+
+
+class CompiledRules:
+    """A user's enabled rules plus EXT_MAP, compiled for fast lookups."""
+
+    def __init__(self, rules=()):
+        self.extensions = {ext: (_HIGH, cat) for ext, cat in EXT_INDEX.items()}
+        self.months = {}
+        self.errors = {}
+        name_rules, sizes, dates = [], [], []
+
+        for rank, rule in enumerate(rules):
+            folder = safe_folder(rule.target_folder)
+            try:
+                if rule.rule_type == 'extension':
+                    for ext in extensions(rule.match_value):
+                        if self.extensions.get(ext, (_HIGH,))[0] > rank:
+                            self.extensions[ext] = (rank, folder)
+                elif rule.rule_type == 'name':
+                    name_rules.append((rank, folder, name_pattern(rule.match_value)))
+                elif rule.rule_type == 'size':
+                    sizes.append((*parse_size_range(rule.match_value), rank, folder))
+                elif rule.rule_type == 'date':
+                    kind, value = parse_date_rule(rule.match_value)
+                    if kind == 'month':
+                        self.months.setdefault(value, (rank, folder))
+                    else:
+                        dates.append((*value, rank, folder))
+            except RuleSyntaxError as e:
+                self.errors[rule.pk] = str(e)
+
+        self.sizes = _Segments(sizes)
+        self.dates = _Segments(dates)
+        self._compile_names(name_rules)
+
+    def _compile_names(self, name_rules):
+        # One alternation, anchored at the start so alternatives are tried
+        # in rank order; `lastgroup` says which rule matched. Patterns with
+        # backreferences can't be renumbered and are matched separately.
+        self.name_groups = {}
+        self.name_fallback = []
+        self.names = None
+        combinable = []
+        for rank, folder, source in name_rules:
+            if re.search(r'\\[1-9]|\(\?P=', source):
+                self._add_name_fallback(rank, folder, source)
+            else:
+                combinable.append((rank, folder, source))
+        alternatives = []
+        for i, (rank, folder, source) in enumerate(combinable):
+            self.name_groups[f'r{i}'] = (rank, folder)
+            alternatives.append(f'(?P<r{i}>{source})')
+        if alternatives:
+            try:
+                self.names = re.compile('|'.join(alternatives), re.IGNORECASE | re.DOTALL)
+            except re.error:
+                # e.g. inline global flags; fall back to one regex per rule.
+                self.name_groups = {}
+                for rank, folder, source in combinable:
+                    self._add_name_fallback(rank, folder, source)
+
+    def _add_name_fallback(self, rank, folder, source):
+        self.name_fallback.append((rank, folder, re.compile(source, re.IGNORECASE | re.DOTALL)))
+
+    def _match_name(self, filename):
+        best = None
+        if self.names is not None:
+            match = self.names.match(filename)
+            if match:
+                best = self.name_groups[match.lastgroup]
+        for rank, folder, regex in self.name_fallback:
+            if (best is None or rank < best[0]) and regex.match(filename):
+                best = (rank, folder)
+        return best
+
+    def classify(self, filename, size=None, modified=None, sniff=None, sniff_known=False):
+        """Category (folder) for a file; `modified` is a datetime, or None
+        when the file's time isn't known, in which case date rules don't apply.
+
+        `sniff()`, if given, returns a category from the file's content or
+        None. It is only called when no user rule matched and EXT_MAP didn't
+        know the extension (with ``sniff_known``, also when only EXT_MAP
+        matched), so names remain the fast path.
+        """
+        candidates = [
+            self.extensions.get(Path(filename).suffix.lower()),
+            self._match_name(filename),
+            self.sizes.lookup(size),
+        ]
+        if modified is not None:
+            candidates += [self.dates.lookup(modified.timestamp()), self.months.get(modified.month)]
+        best = min((c for c in candidates if c is not None), default=None)
+        if sniff is not None and (best is None or (sniff_known and best[0] == _HIGH)):
+            sniffed = sniff()
+            if sniffed:
+                return sniffed
+        return best[1] if best is not None else DEFAULT_CATEGORY
+
+
+# === Per-user cache ===
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_matcher(user):
+    """Compiled rules for `user`, rebuilt only when their rules changed."""
+    version = (
+        UserProfile.objects.filter(user=user)
+        .values_list('rules_version', flat=True).first() or 0
+    )
+    cached = _cache.get(user.pk)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    matcher = CompiledRules(CustomRule.objects.filter(user=user, enabled=True))
+    with _cache_lock:
+        _cache[user.pk] = (version, matcher)
+    return matcher
+
+
+def invalidate_rules(user):
+    """Call after any change to `user`'s rules."""
+    UserProfile.objects.filter(user=user).update(rules_version=F('rules_version') + 1)
+    with _cache_lock:
+        _cache.pop(user.pk, None)
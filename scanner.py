@@ -0,0 +1,218 @@
+"""Find files under a server-side directory for `ingest_path`.
+
+`scan` walks the tree with os.scandir on a pool of threads, one directory
+per task, so slow metadata round trips (NFS) overlap; files come back in
+batches as directories finish, in no particular order. A `Watcher` does
+the same first scan and then reports files that appear later, through
+inotify on Linux or by rescanning every few seconds. Use polling on NFS:
+inotify only sees changes made by this host.
+"""
+import os
+import errno
+import ctypes
+import ctypes.util
+import select
+import stat
+import struct
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 16
+DEFAULT_BATCH_SIZE = 1000
+
+# linux/inotify.h
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_EVENT = struct.Struct('iIII')
+
+
+def _scan_dir(path, skip):
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path not in skip:
+                            dirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, st.st_size, st.st_mtime))
+                except OSError as e:
+                    logger.warning('Skipping %s: %s', entry.path, e)
+    except OSError as e:
+        logger.warning('Cannot scan %s: %s', path, e)
+    return files, dirs
+
+
+def scan(root, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, skip=(), on_dir=None):
+    """Yield lists of (path, size, mtime) for the regular files under `root`.
+
+    Symlinks are not followed and directories in `skip` are not entered.
+    `on_dir(path)` is called (on a worker thread) before each directory
+    is listed.
+    """
+    skip = {os.fspath(path) for path in skip}
+
+    def task(path):
+        if on_dir is not None:
+            on_dir(path)
+        return _scan_dir(path, skip)
+
+    batch = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(task, os.fspath(root))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                pending.update(pool.submit(task, path) for path in dirs)
+                batch.extend(files)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                del batch[:batch_size]
+    if batch:
+        yield batch
+
+
+class Inotify:
+    """Just enough of inotify(7), through ctypes, to watch directories."""
+
+    MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    def add(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            # ENOSPC means fs.inotify.max_user_watches is too low.
+            logger.warning('Cannot watch %s: %s', path, os.strerror(ctypes.get_errno()))
+            return
+        with self._lock:
+            self._dirs[wd] = path
+
+    def read(self, timeout):
+        """(path, mask) pairs, waiting up to `timeout` seconds for the first.
+
+        `path` is None for a queue overflow: events were lost.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            with self._lock:
+                directory = self._dirs.pop(wd, None) if mask & _IN_IGNORED else self._dirs.get(wd)
+            if mask & _IN_Q_OVERFLOW:
+                events.append((None, mask))
+            elif directory is not None and name:
+                events.append((os.path.join(directory, os.fsdecode(name)), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """Scan `root`, then keep reporting files that appear under it.
+
+    `mode` is 'inotify', 'poll' or 'auto' (inotify where available). Paths
+    already reported are remembered, so nothing is reported twice.
+    """
+
+    def __init__(self, root, mode='auto', interval=5.0, workers=DEFAULT_WORKERS,
+                 batch_size=DEFAULT_BATCH_SIZE, skip=()):
+        self.root = os.fspath(root)
+        self.interval = interval
+        self.workers = workers
+        self.batch_size = batch_size
+        self.skip = {os.fspath(path) for path in skip}
+        self._known = set()
+        self._inotify = None
+        if mode in ('auto', 'inotify'):
+            try:
+                self._inotify = Inotify()
+            except OSError:
+                if mode == 'inotify':
+                    raise
+        self.mode = 'inotify' if self._inotify else 'poll'
+
+    def _scan(self, root, settled_before=None):
+        on_dir = self._inotify.add if self._inotify else None
+        for batch in scan(root, self.workers, self.batch_size, self.skip, on_dir):
+            fresh = [
+                entry for entry in batch
+                if entry[0] not in self._known
+                and (settled_before is None or entry[2] < settled_before)
+            ]
+            self._known.update(path for path, _, _ in fresh)
+            if fresh:
+                yield fresh
+
+    def scan(self):
+        """Yield batches of the files there now; watching starts as each directory is listed."""
+        yield from self._scan(self.root)
+
+    def changes(self):
+        """Yield batches of files that appeared since, forever."""
+        if self._inotify is None:
+            while True:
+                time.sleep(self.interval)
+                # Files modified within the last interval may still be being written.
+                yield from self._scan(self.root, settled_before=time.time() - self.interval)
+
+        batch = []
+        while True:
+            events = self._inotify.read(self.interval if not batch else 1.0)
+            if not events and batch:
+                yield batch
+                batch = []
+                continue
+            for path, mask in events:
+                if path is None:
+                    logger.warning('inotify queue overflowed; rescanning %s', self.root)
+                    yield from self._scan(self.root)
+                elif mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO) and path not in self.skip:
+                        yield from self._scan(path)
+                elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO) and path not in self._known:
+                    try:
+                        st = os.stat(path, follow_symlinks=False)
+                    except OSError:
+                        continue  # gone again already
+                    if not stat.S_ISREG(st.st_mode):
+                        continue
+                    self._known.add(path)
+                    batch.append((path, st.st_size, st.st_mtime))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
@@ -0,0 +1,53 @@
+from django.urls import reverse
+from rest_framework import serializers
+
+from .archives import unpack_default
+from .models import FileRecord, UploadJob
+from .naming import PatternError, compile_pattern
+
+
+class UploadFileSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=0)
+    last_modified = serializers.IntegerField(min_value=0, required=False)  # ms since epoch
+
+
+class UploadSessionSerializer(serializers.Serializer):
+    job_name = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    rename_pattern = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    unpack_archives = serializers.BooleanField(default=unpack_default)
+    files = UploadFileSerializer(many=True, allow_empty=False)
+
+    def validate_rename_pattern(self, value):
+        if value.strip():
+            try:
+                compile_pattern(value.strip())
+            except PatternError as e:
+                raise serializers.ValidationError(str(e))
+        return value
+
+
+class JobSerializer(serializers.ModelSerializer):
+    progress_percent = serializers.IntegerField(read_only=True)
+    url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadJob
+        fields = [
+            'id', 'job_name', 'status', 'total_files', 'processed_files', 'total_size',
+            'progress_percent', 'duplicates_found', 'created_at', 'completed_at',
+            'url', 'download_url',
+        ]
+
+    def get_url(self, job):
+        return reverse('job_detail', args=[job.id])
+
+    def get_download_url(self, job):
+        return reverse('download', args=[job.id]) if job.status == 'completed' else None
+
+
+class FileRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FileRecord
+        fields = ['id', 'original_name', 'new_name', 'category', 'file_size', 'created_at']
@@ -47,6 +47,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'bulk_organiser.wsgi.application'
+ASGI_APPLICATION = 'bulk_organiser.asgi.application'
 
 DATABASES = {
     'default': {
@@ -82,3 +83,89 @@ REST_FRAMEWORK = {
 # Login redirect
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
+
+# Organize job queue
+ORGANIZER_JOB_WORKERS = os.cpu_count() or 1
+ORGANIZER_JOB_STALE_AFTER = 3600  # seconds before a 'processing' job is requeued
+ORGANIZER_RUN_JOBS_INLINE = False  # run jobs inside the request (dev/tests only)
+
+# 'file' copies into jobs/<id>/ and writes jobs/<id>.zip; 'stream' builds the
+# ZIP on the fly from the uploads at download time.
+ORGANIZER_ZIP_MODE = 'file'
+
+# Archive compression: images/videos/audio/archives are STORED, the rest
+# DEFLATED. Override per category or '.ext' with 'stored', 'deflated',
+# 'probe' (entropy sample) or a deflate level 1-9.
+ORGANIZER_COMPRESSION_LEVEL = 6
+ORGANIZER_COMPRESSION_POLICY = {}
+ORGANIZER_COMPRESSION_WORKERS = os.cpu_count() or 1
+
+# Chunked upload API: size the client is told to use, and the most we accept.
+ORGANIZER_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+ORGANIZER_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Let organize move (rename) an upload into place when linking and cloning
+# are not possible; uploads are not needed once a job is organized.
+ORGANIZER_CONSUME_UPLOADS = True
+
+# Threads placing files during organize; match to the storage's queue depth.
+ORGANIZER_IO_WORKERS = 8
+
+# Content sniffing of uploads: 'off', 'unknown' (only files their name
+# doesn't classify) or 'all' (also let content override EXT_MAP).
+ORGANIZER_CONTENT_SNIFFING = 'unknown'
+
+# Flag duplicate uploads (same content, or images within this many dHash
+# bits of each other; 0 = exact duplicates only) against the user's history.
+ORGANIZER_DUPLICATE_DETECTION = True
+ORGANIZER_SIMILAR_IMAGE_DISTANCE = 6
+
+# Job ids to run under cProfile (or True for every job). The stats are
+# written next to the job's ZIP as jobs/<id>.prof and the top functions logged.
+ORGANIZER_PROFILE_JOBS = []
+
+# Unpack uploaded .zip/.tar(.gz/.bz2/.xz) files into their members by
+# default (the upload form has a checkbox); caps guard against zip bombs.
+ORGANIZER_UNPACK_ARCHIVES = False
+ORGANIZER_ARCHIVE_MAX_MEMBERS = 10000
+ORGANIZER_ARCHIVE_MAX_SIZE = 10 * 1024 ** 3
+
+# Where blobs, manifests, organized files and ZIPs live. The default is
+# MEDIA_ROOT; point 'organizer' at an S3-compatible bucket to share jobs
+# between web nodes and workers (needs boto3), e.g.
+#   'BACKEND': 'organizer.storage.S3Storage',
+#   'OPTIONS': {'bucket': 'organizer', 'endpoint_url': 'http://minio:9000',
+#               'addressing_style': 'path', 'max_connections': 32,
+#               'multipart_chunksize': 16 * 1024 * 1024, 'max_concurrency': 8},
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'organizer': {'BACKEND': 'organizer.storage.LocalStorage'},
+}
+# Threads uploading a batch's new blobs to remote storage during ingest.
+ORGANIZER_STORAGE_WORKERS = 8
+
+# Let the front-end server send ZIP downloads: 'X-Accel-Redirect' (nginx,
+# with an internal location aliasing ORGANIZER_SENDFILE_ROOT at
+# ORGANIZER_SENDFILE_URL) or 'X-Sendfile' (Apache mod_xsendfile, lighttpd).
+ORGANIZER_SENDFILE = None
+ORGANIZER_SENDFILE_ROOT = MEDIA_ROOT
+ORGANIZER_SENDFILE_URL = '/protected/'
+
+# Disk budget (bytes) for cached ZIPs of part of a job (a category, or the
+# files a filter selects); least recently used first out. 0 disables it.
+ORGANIZER_ARCHIVE_CACHE_SIZE = 2 * 1024 ** 3
+
+# Days to keep, per kind of data, before collect_garbage removes it (None
+# keeps it): 'staging' (upload links of organized jobs), 'archives' (ZIPs
+# and organized copies; downloads are then streamed), 'abandoned' (jobs
+# never organized) and 'failed' jobs.
+ORGANIZER_RETENTION = {'staging': 0, 'archives': 30, 'abandoned': 2, 'failed': 30}
+# Default per-user limit in bytes on the size of their jobs (None = no
+# limit); UserProfile.storage_quota overrides it per user.
+ORGANIZER_USER_QUOTA = None
+
+# Under an ASGI server, route upload and download to the async views, which
+# share ORGANIZER_ASYNC_IO_THREADS threads for their file I/O.
+ORGANIZER_ASYNC_TRANSFERS = False
+ORGANIZER_ASYNC_IO_THREADS = 32
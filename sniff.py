@@ -0,0 +1,170 @@
+"""Classify files by their leading bytes.
+
+Used for files that their name doesn't classify: extensionless uploads,
+unknown extensions and (optionally) files whose extension may be lying.
+Signatures are compiled into one prefix trie over the header, with
+wildcard edges for bytes that vary (RIFF sizes, ZIP header fields), and
+the longest matching signature wins, so a .docx (a ZIP whose first member
+is ``[Content_Types].xml``) beats plain ZIP. Verdicts are cached per
+content hash in ContentSignature, so the same bytes are sniffed once.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .blobstore import HEADER_BYTES, blob_path
+from .models import ContentSignature
+
+
+MODES = ('off', 'unknown', 'all')
+
+# Formats built on another format's container (Illustrator files are PDFs,
+# Sketch/Figma files are ZIPs); their extension is trusted even in 'all' mode.
+CONTAINER_EXTENSIONS = {'.ai', '.sketch', '.fig', '.epub', '.jar', '.apk'}
+
+# (((offset, magic), ...), category); every part must match.
+SIGNATURES = [
+    # images
+    (((0, b'\xff\xd8\xff'),), 'images'),
+    (((0, b'\x89PNG\r\n\x1a\n'),), 'images'),
+    (((0, b'GIF87a'),), 'images'),
+    (((0, b'GIF89a'),), 'images'),
+    (((0, b'BM'),), 'images'),
+    (((0, b'\x00\x00\x01\x00'),), 'images'),
+    (((0, b'II*\x00'),), 'images'),
+    (((0, b'MM\x00*'),), 'images'),
+    (((0, b'RIFF'), (8, b'WEBP')), 'images'),
+    (((4, b'ftypheic'),), 'images'),
+    (((4, b'ftypavif'),), 'images'),
+    # documents
+    (((0, b'%PDF-'),), 'documents'),
+    (((0, b'{\\rtf'),), 'documents'),
+    (((0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),), 'documents'),  # OLE2: .doc/.xls
+    (((0, b'PK\x03\x04'), (30, b'[Content_Types].xml')), 'documents'),  # OOXML
+    (((0, b'PK\x03\x04'), (30, b'mimetypeapplication/vnd.oasis.opendocument')), 'documents'),
+    # videos
+    (((4, b'ftyp'),), 'videos'),  # MP4/MOV family unless a brand below says otherwise
+    (((0, b'\x1a\x45\xdf\xa3'),), 'videos'),  # Matroska/WebM
+    (((0, b'RIFF'), (8, b'AVI ')), 'videos'),
+    (((0, b'FLV\x01'),), 'videos'),
+    (((0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'),), 'videos'),  # ASF/WMV
+    # audio
+    (((0, b'ID3'),), 'audio'),
+    (((0, b'\xff\xfb'),), 'audio'),
+    (((0, b'\xff\xf3'),), 'audio'),
+    (((0, b'\xff\xf2'),), 'audio'),
+    (((0, b'fLaC'),), 'audio'),
+    (((0, b'OggS'),), 'audio'),
+    (((0, b'RIFF'), (8, b'WAVE')), 'audio'),
+    (((4, b'ftypM4A '),), 'audio'),
+    # archives
+    (((0, b'PK\x03\x04'),), 'archives'),
+    (((0, b'PK\x05\x06'),), 'archives'),  # empty zip
+    (((0, b'\x1f\x8b'),), 'archives'),
+    (((0, b'BZh'),), 'archives'),
+    (((0, b'7z\xbc\xaf\x27\x1c'),), 'archives'),
+    (((0, b'Rar!\x1a\x07'),), 'archives'),
+    (((0, b'\xfd7zXZ\x00'),), 'archives'),
+    (((0, b'\x28\xb5\x2f\xfd'),), 'archives'),  # zstd
+    (((257, b'ustar'),), 'archives'),
+    # design files
+    (((0, b'8BPS'),), 'media'),
+    # scripts
+    (((0, b'#!'),), 'code'),
+]
+
+_ANY = None
+
+
+class _Node:
+    __slots__ = ('children', 'category')
+
+    def __init__(self):
+        self.children = {}
+        self.category = None
+
+
+class SignatureTrie:
+    """Longest-match lookup of a header against byte signatures."""
+
+    def __init__(self, signatures=SIGNATURES):
+        self.root = _Node()
+        for parts, category in signatures:
+            self.add(parts, category)
+
+    def add(self, parts, category):
+        length = max(offset + len(magic) for offset, magic in parts)
+        pattern = [_ANY] * length
+        for offset, magic in parts:
+            pattern[offset:offset + len(magic)] = magic
+        node = self.root
+        for byte in pattern:
+            node = node.children.setdefault(byte, _Node())
+        node.category = category
+
+    def match(self, header):
+        """Category of the longest signature `header` starts with, or None."""
+        best_depth, best = -1, None
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node.category is not None and depth > best_depth:
+                best_depth, best = depth, node.category
+            if depth == len(header):
+                continue
+            for key in (header[depth], _ANY):
+                child = node.children.get(key)
+                if child is not None:
+                    stack.append((child, depth + 1))
+        return best
+
+
+TRIE = SignatureTrie()
+
+
+def sniff_mode():
+    """How much content sniffing ingest does.
+
+    'off'; 'unknown' sniffs files that no rule and no EXT_MAP extension
+    classifies; 'all' also checks files classified by EXT_MAP alone and
+    lets recognised content override their extension.
+    """
+    mode = getattr(settings, 'ORGANIZER_CONTENT_SNIFFING', 'unknown')
+    if mode not in MODES:
+        raise ValueError(f'ORGANIZER_CONTENT_SNIFFING must be one of {MODES}, not {mode!r}')
+    return mode
+
+
+def read_header(path, size=HEADER_BYTES):
+    with open(path, 'rb') as fh:
+        return fh.read(size)
+
+
+def sniff_file(path):
+    """Category for a file that isn't in the blob store, or None; not cached."""
+    try:
+        return TRIE.match(read_header(path))
+    except OSError:
+        return None
+
+
+def sniff_blob(content_hash, header=None):
+    """Category for the blob's content, or None; cached per content hash.
+
+    `header` is the blob's first bytes if the caller already has them;
+    otherwise they are read from the store.
+    """
+    cached = (
+        ContentSignature.objects.filter(content_hash=content_hash)
+        .values_list('category', flat=True).first()
+    )
+    if cached is not None:
+        return cached or None
+    if header is None:
+        header = read_header(blob_path(content_hash))
+    category = TRIE.match(header[:HEADER_BYTES])
+    try:
+        with transaction.atomic():
+            ContentSignature.objects.create(content_hash=content_hash, category=category or '')
+    except IntegrityError:
+        pass  # another upload of the same bytes got there first
+    return category
@@ -0,0 +1,82 @@
+"""Per-user dashboard statistics.
+
+Each user has one UserStats row that is bumped with F() expressions
+whenever one of their jobs is created, completed or deleted, so the
+dashboard reads a single row however long the job history gets.
+`rebuild_stats` recomputes a row from UploadJob in one aggregate query;
+it fills in missing rows and repairs drift (e.g. after bulk deletes).
+`stored_size` leaves out server-side jobs (see ingest_path), whose files
+stay where they are; it is what quotas count.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from .models import UploadJob, UserStats
+
+
+def rebuild_stats(user_id):
+    """Recompute `user_id`'s totals from their jobs and store them."""
+    totals = UploadJob.objects.filter(user_id=user_id).aggregate(
+        total_jobs=Count('id'),
+        completed_jobs=Count('id', filter=Q(status='completed')),
+        total_files=Coalesce(Sum('total_files'), 0),
+        # Before total_size, which would otherwise shadow the field here.
+        stored_size=Coalesce(Sum('total_size', filter=Q(source_path='')), 0),
+        total_size=Coalesce(Sum('total_size'), 0),
+    )
+    stats, _ = UserStats.objects.update_or_create(user_id=user_id, defaults=totals)
+    return stats
+
+
+def get_stats(user):
+    """The user's UserStats row, built on first use."""
+    return UserStats.objects.filter(user=user).first() or rebuild_stats(user.pk)
+
+
+def _bump(user_id, **deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        updated_at=now(), **{field: F(field) + delta for field, delta in deltas.items()},
+    )
+    if not updated:
+        # No row yet: the rebuild already sees the change being recorded.
+        rebuild_stats(user_id)
+
+
+def _stored(job, size):
+    return 0 if job.source_path else size
+
+
+def record_job_created(job):
+    _bump(job.user_id, total_jobs=1, total_files=job.total_files, total_size=job.total_size,
+          stored_size=_stored(job, job.total_size))
+
+
+def record_job_resized(job, size_delta, files_delta=0):
+    """Call when a job's total_size or total_files is corrected after creation."""
+    _bump(job.user_id, total_size=size_delta, total_files=files_delta,
+          stored_size=_stored(job, size_delta))
+
+
+def record_job_completed(job):
+    """Call whenever a job moves into 'completed'."""
+    _bump(job.user_id, completed_jobs=1)
+
+
+def record_job_reopened(job):
+    """Call whenever a job moves out of 'completed' (it was queued again)."""
+    _bump(job.user_id, completed_jobs=-1)
+
+
+def record_job_deleted(job):
+    _bump(
+        job.user_id,
+        total_jobs=-1,
+        completed_jobs=-1 if job.status == 'completed' else 0,
+        total_files=-job.total_files,
+        total_size=-job.total_size,
+        stored_size=_stored(job, -job.total_size),
+    )
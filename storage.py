@@ -0,0 +1,312 @@
+"""Shared storage for blobs, manifests, organized files and archives.
+
+Objects are named by their path relative to MEDIA_ROOT (``blobs/aa/bb/<sha256>``,
+``users/<id>/jobs/<job>.zip``, ...) and go through Django's Storage API,
+using the ``organizer`` entry of settings.STORAGES:
+
+* `LocalStorage` (the default) is MEDIA_ROOT itself. Nothing is
+  published or fetched, and organizing works on paths with hard links.
+* `S3Storage` is an S3-compatible bucket (AWS, MinIO, Ceph, ...), so any
+  web node or worker can pick up any job. Blobs and manifests are
+  uploaded once at ingest. Organizing copies blobs inside the bucket
+  (CopyObject / UploadPartCopy), so no file bytes pass through the app
+  server. Downloads are redirected to presigned URLs. Each node keeps a
+  local blob store as a cache. Needs boto3.
+
+Upload staging, job manifests and ZIPs are still written locally first;
+`publish` and `fetch` move them between a node and the bucket.
+"""
+import os
+import threading
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.core.files.storage.handler import InvalidStorageError
+from django.utils.deconstruct import deconstructible
+from django.utils.http import content_disposition_header
+
+from .blobstore import blob_path
+from .materialize import materialize
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+
+STORAGE_ALIAS = 'organizer'
+# organize_strategy for files copied inside remote storage.
+SERVER_COPY = 'server-copy'
+
+_LOCAL_STRATEGIES = ('link', 'reflink', 'copy')
+_default = None
+
+
+def get_storage():
+    """The configured organizer storage (MEDIA_ROOT if none is configured)."""
+    global _default
+    try:
+        return storages[STORAGE_ALIAS]
+    except InvalidStorageError:
+        if _default is None or _default.location != os.path.abspath(settings.MEDIA_ROOT):
+            _default = LocalStorage()
+        return _default
+
+
+def media_name(path):
+    """Storage name of a path under MEDIA_ROOT."""
+    return Path(path).relative_to(settings.MEDIA_ROOT).as_posix()
+
+
+def publish(path, skip_existing=False, storage=None):
+    """Upload the local file at `path` to remote storage (no-op when local)."""
+    storage = storage or get_storage()
+    if storage.is_local:
+        return
+    name = media_name(path)
+    if skip_existing and storage.exists(name):
+        return
+    storage.put_file(path, name)
+
+
+def fetch(path, storage=None):
+    """Make sure `path` exists locally, downloading it if storage is remote.
+
+    Returns whether it now exists.
+    """
+    path = Path(path)
+    if path.exists():
+        return True
+    storage = storage or get_storage()
+    if storage.is_local:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, partial = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    os.close(fd)
+    try:
+        storage.get_file(media_name(path), partial)
+        os.replace(partial, path)
+    except FileNotFoundError:
+        return False
+    finally:
+        if os.path.exists(partial):
+            os.unlink(partial)
+    return True
+
+
+def local_blob(digest, storage=None):
+    """Path of a blob in this node's store, fetched from storage if missing."""
+    path = blob_path(digest)
+    fetch(path, storage)
+    return path
+
+
+class BlobPublisher:
+    """Uploads a job's new blobs on a thread pool while ingest carries on.
+
+    Each blob is uploaded at most once per publisher and skipped if the
+    bucket already has it. Does nothing with local storage.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or get_storage()
+        self._pool = None
+        if not self.storage.is_local:
+            self._pool = ThreadPoolExecutor(max_workers=getattr(settings, 'ORGANIZER_STORAGE_WORKERS', 8))
+        self._futures = {}
+
+    def add(self, digest):
+        if self._pool is not None and digest not in self._futures:
+            self._futures[digest] = self._pool.submit(publish, blob_path(digest), True, self.storage)
+
+    def close(self, wait=True):
+        """Wait for the uploads (raising the first failure); returns how many."""
+        if self._pool is None:
+            return 0
+        try:
+            if wait:
+                for future in self._futures.values():
+                    future.result()
+        finally:
+            self._pool.shutdown(wait=wait, cancel_futures=not wait)
+        return len(self._futures)
+
+
+@deconstructible
+class LocalStorage(FileSystemStorage):
+    """MEDIA_ROOT, with the copy/transfer helpers `S3Storage` has."""
+
+    is_local = True
+
+    def copy(self, src, dest):
+        dest_path = Path(self.path(dest))
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        return materialize(self.path(src), dest_path, strategies=_LOCAL_STRATEGIES)
+
+    def move(self, src, dest):
+        dest_path = Path(self.path(dest))
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.path(src), dest_path)
+
+    def put_file(self, path, name):
+        if os.path.abspath(path) != self.path(name):
+            Path(self.path(name)).parent.mkdir(parents=True, exist_ok=True)
+            materialize(path, self.path(name), strategies=_LOCAL_STRATEGIES)
+
+    def get_file(self, name, path):
+        if not self.exists(name):
+            raise FileNotFoundError(name)
+        materialize(self.path(name), path, strategies=_LOCAL_STRATEGIES)
+
+
+@deconstructible
+class S3Storage(Storage):
+    """An S3-compatible bucket.
+
+    One client per process holds a pool of up to `max_connections` HTTP
+    connections shared by every thread. Objects over `multipart_threshold`
+    are uploaded, downloaded and copied in `multipart_chunksize` parts,
+    `max_concurrency` at a time. For MinIO and the like, pass
+    ``endpoint_url`` and ``addressing_style='path'``.
+    """
+
+    is_local = False
+
+    def __init__(self, bucket=None, prefix='', endpoint_url=None, region_name=None,
+                 access_key=None, secret_key=None, addressing_style=None,
+                 max_connections=32, multipart_threshold=16 * 1024 * 1024,
+                 multipart_chunksize=16 * 1024 * 1024, max_concurrency=8, url_expiry=3600):
+        if boto3 is None:
+            raise ImproperlyConfigured('S3Storage needs boto3 (pip install boto3)')
+        if not bucket:
+            raise ImproperlyConfigured('S3Storage needs a bucket')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.url_expiry = url_expiry
+        self._client_kwargs = {
+            'endpoint_url': endpoint_url,
+            'region_name': region_name,
+            'aws_access_key_id': access_key,
+            'aws_secret_access_key': secret_key,
+            'config': Config(
+                max_pool_connections=max_connections,
+                retries={'max_attempts': 5, 'mode': 'adaptive'},
+                s3={'addressing_style': addressing_style} if addressing_style else None,
+            ),
+        }
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+        )
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Clients are thread-safe but must not cross a fork (see run_workers).
+        if self._client is None or self._client_pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    self._client = boto3.session.Session().client('s3', **self._client_kwargs)
+                    self._client_pid = os.getpid()
+        return self._client
+
+    def _key(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(name)
+            raise
+
+    # --- Storage API ---
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError('S3Storage files are read-only; use save()')
+        data = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        try:
+            self.client.download_fileobj(self.bucket, self._key(name), data, Config=self.transfer)
+        except ClientError as e:
+            data.close()
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(name)
+            raise
+        data.seek(0)
+        return File(data, name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        self.client.upload_fileobj(content, self.bucket, self._key(name), Config=self.transfer)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Names are content hashes or job paths: saving again replaces.
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def exists(self, name):
+        try:
+            self._head(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, name):
+        return self._head(name)['ContentLength']
+
+    def get_modified_time(self, name):
+        return self._head(name)['LastModified']
+
+    def listdir(self, path):
+        prefix = self._key(path).rstrip('/') + '/' if path else (f'{self.prefix}/' if self.prefix else '')
+        dirs, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            dirs.extend(p['Prefix'][len(prefix):].rstrip('/') for p in page.get('CommonPrefixes', ()))
+            files.extend(o['Key'][len(prefix):] for o in page.get('Contents', ()))
+        return dirs, files
+
+    def url(self, name, filename=None):
+        params = {'Bucket': self.bucket, 'Key': self._key(name)}
+        if filename:
+            params['ResponseContentDisposition'] = content_disposition_header(True, filename)
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expiry)
+
+    # --- Transfers ---
+    def copy(self, src, dest):
+        """Copy inside the bucket; large objects are copied part by part."""
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(src)}, self.bucket,
+                         self._key(dest), Config=self.transfer)
+        return SERVER_COPY
+
+    def move(self, src, dest):
+        self.copy(src, dest)
+        self.delete(src)
+
+    def put_file(self, path, name):
+        self.client.upload_file(os.fspath(path), self.bucket, self._key(name), Config=self.transfer)
+
+    def get_file(self, name, path):
+        try:
+            self.client.download_file(self.bucket, self._key(name), os.fspath(path), Config=self.transfer)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(name)
+            raise
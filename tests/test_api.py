@@ -0,0 +1,81 @@
+import json
+import os
+
+from django.test import override_settings
+from django.urls import reverse
+
+from ..models import ChunkedFile, UploadJob
+from ..stats import get_stats
+from ..workspace import ensure_workspace
+from .utils import OrganizerTestCase
+
+
+class ChunkedUploadTests(OrganizerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def start(self, files, **options):
+        response = self.client.post(reverse('api_upload_session'), json.dumps({
+            'job_name': 'api', 'files': [{'name': name, 'size': len(data)} for name, data in files.items()],
+            **options,
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['job_id']
+
+    def put(self, job_id, index, data, content_range=None, offset=None):
+        url = reverse('api_upload_chunk', args=[job_id, index])
+        if offset is not None:
+            url += f'?offset={offset}'
+        headers = {'HTTP_CONTENT_RANGE': content_range} if content_range else {}
+        return self.client.put(url, data, content_type='application/octet-stream', **headers)
+
+    def test_chunks_in_any_order_are_assembled(self):
+        data = os.urandom(2500)
+        job_id = self.start({'big.bin': data})
+        self.assertEqual(self.put(job_id, 0, data[1000:2000], 'bytes 1000-1999/2500').status_code, 200)
+        self.assertEqual(self.put(job_id, 0, data[2000:], offset=2000).status_code, 200)
+
+        response = self.client.post(reverse('api_upload_complete', args=[job_id]))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['files'][0]['received'], [[1000, 2500]])
+
+        self.put(job_id, 0, data[:1000], 'bytes 0-999/*')
+        self.put(job_id, 0, data[:1000], 'bytes 0-999/2500')  # resent: harmless
+        response = self.client.post(reverse('api_upload_complete', args=[job_id]))
+        self.assertEqual(response.status_code, 200)
+        upload = ensure_workspace(self.user) / 'uploads' / str(job_id) / 'big.bin'
+        self.assertEqual(upload.read_bytes(), data)
+        self.assertFalse(ChunkedFile.objects.filter(job_id=job_id).exists())
+
+    def test_ranges_must_fit_the_declared_file(self):
+        job_id = self.start({'a.txt': b'x' * 100})
+        self.assertEqual(self.put(job_id, 0, b'x' * 10, 'bytes 95-104/100').status_code, 416)
+        self.assertEqual(self.put(job_id, 0, b'x' * 10, 'bytes 0-9/5000').status_code, 400)
+        self.assertEqual(self.put(job_id, 0, b'x' * 10, 'bytes=0-9').status_code, 400)
+        self.assertEqual(self.put(job_id, 0, b'x' * 5, 'bytes 0-9/100').status_code, 400)
+
+    @override_settings(ORGANIZER_UPLOAD_MAX_CHUNK_SIZE=10)
+    def test_oversized_chunk_is_refused(self):
+        job_id = self.start({'a.txt': b'x' * 100})
+        self.assertEqual(self.put(job_id, 0, b'x' * 20, 'bytes 0-19/100').status_code, 413)
+
+    def test_bad_archive_removes_the_job(self):
+        data = b'not really a zip'
+        job_id = self.start({'bad.zip': data}, unpack_archives=True)
+        self.put(job_id, 0, data, f'bytes 0-{len(data) - 1}/{len(data)}')
+
+        response = self.client.post(reverse('api_upload_complete', args=[job_id]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadJob.objects.filter(id=job_id).exists())
+        self.assertFalse((ensure_workspace(self.user) / 'uploads' / str(job_id)).exists())
+        stats = get_stats(self.user)
+        self.assertEqual((stats.total_jobs, stats.total_size), (0, 0))
+
+    @override_settings(ORGANIZER_USER_QUOTA=1000)
+    def test_session_over_quota_is_refused(self):
+        response = self.client.post(reverse('api_upload_session'), json.dumps({
+            'files': [{'name': 'a.bin', 'size': 2000}],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 413)
@@ -0,0 +1,104 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+from django.utils.timezone import now
+
+from ..archivecache import ArchiveCache, selection_key
+from ..jobs import enqueue
+from ..models import UploadJob
+from .utils import OrganizerTestCase
+
+
+class ArchiveCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def fill(self, cache, key, size):
+        return b''.join(cache.fill(key, [b'x' * size]))
+
+    def test_fill_then_hit(self):
+        cache = ArchiveCache(self.root, max_size=1000)
+        self.assertIsNone(cache.get('1-a'))
+        self.assertEqual(self.fill(cache, '1-a', 10), b'x' * 10)
+        self.assertEqual(cache.get('1-a').read_bytes(), b'x' * 10)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ArchiveCache(self.root, max_size=250)
+        self.fill(cache, '1-a', 100)
+        self.fill(cache, '1-b', 100)
+        # Make 'a' the most recently used, whatever the clock resolution.
+        os.utime(cache.path('1-b'), (1, os.stat(cache.path('1-b')).st_mtime))
+        mtime = os.stat(cache.path('1-a')).st_mtime_ns
+        cache.get('1-a')
+        self.assertEqual(os.stat(cache.path('1-a')).st_mtime_ns, mtime)  # the ETag stays put
+
+        self.fill(cache, '2-c', 100)
+        self.assertIsNone(cache.get('1-b'))
+        self.assertIsNotNone(cache.get('1-a'))
+        self.assertIsNotNone(cache.get('2-c'))
+
+    def test_oversized_and_abandoned_archives_are_not_kept(self):
+        cache = ArchiveCache(self.root, max_size=50)
+        self.fill(cache, '1-big', 100)
+        self.assertIsNone(cache.get('1-big'))
+
+        chunks = cache.fill('1-cut', iter([b'a', b'b']))
+        next(chunks)
+        chunks.close()  # client went away
+        self.assertIsNone(cache.get('1-cut'))
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_discard_drops_one_job(self):
+        cache = ArchiveCache(self.root, max_size=1000)
+        for key in ('1-a', '1-b', '12-a'):
+            self.fill(cache, key, 1)
+        cache.discard(1)
+        self.assertEqual(os.listdir(self.root), ['12-a.zip'])
+
+    def test_disabled_cache_passes_through(self):
+        cache = ArchiveCache(self.root, max_size=0)
+        self.assertEqual(self.fill(cache, '1-a', 5), b'xxxxx')
+        self.assertEqual(os.listdir(self.root), [])
+
+
+class PartialArchiveTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_RUN_JOBS_INLINE': True}
+
+    def test_selection_is_cached_per_job_version(self):
+        job = self.make_job({'a.txt': b'a' * 100, 'b.jpg': b'\xff\xd8\xff', 'c.py': b'print()'})
+        enqueue(job)
+        job.refresh_from_db()
+        self.client.force_login(self.user)
+        url = reverse('api_job_archive', args=[job.id]) + '?category=documents,code'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        names = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))).namelist()
+        self.assertEqual(names, ['documents/1_a.txt', 'code/3_c.py'])
+        key = selection_key(job, {'category': ['code', 'documents']})
+        self.assertIsNotNone(ArchiveCache().get(key))
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-1')
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (206, b'PK'))
+
+        UploadJob.objects.filter(id=job.id).update(completed_at=now() + timedelta(seconds=1))
+        job.refresh_from_db()
+        self.assertNotEqual(selection_key(job, {'category': ['code', 'documents']}), key)
+
+    def test_no_filters_redirects_and_no_match_is_404(self):
+        job = self.make_job({'a.txt': b'a'})
+        self.client.force_login(self.user)
+        url = reverse('api_job_archive', args=[job.id])
+        self.assertEqual(self.client.get(url).status_code, 409)
+        enqueue(job)
+        self.assertRedirects(self.client.get(url), reverse('download', args=[job.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.get(url + '?category=videos').status_code, 404)
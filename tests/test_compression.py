@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+from django.test import SimpleTestCase, override_settings
+
+from ..compression import CompressionPolicy, entropy
+
+
+class CompressionPolicyTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write(self, data):
+        path = os.path.join(self.tmp, 'file')
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def test_category_defaults(self):
+        policy = CompressionPolicy()
+        self.assertEqual(policy('unused', 'images/a.jpg'), (ZIP_STORED, None))
+        self.assertEqual(policy('unused', 'documents/a.txt'), (ZIP_DEFLATED, 6))
+
+    def test_extension_overrides_category(self):
+        policy = CompressionPolicy()
+        self.assertEqual(policy('unused', 'images/a.svg'), (ZIP_DEFLATED, 6))
+        self.assertEqual(policy('unused', 'documents/a.docx'), (ZIP_STORED, None))
+
+    def test_level_zero_means_stored(self):
+        policy = CompressionPolicy(extensions={'.log': 0}, categories={'code': 0})
+        self.assertEqual(policy('unused', 'documents/app.log'), (ZIP_STORED, None))
+        self.assertEqual(policy('unused', 'code/main.py'), (ZIP_STORED, None))
+
+    def test_numeric_levels(self):
+        policy = CompressionPolicy(extensions={'.csv': 9})
+        self.assertEqual(policy('unused', 'documents/data.csv'), (ZIP_DEFLATED, 9))
+        with self.assertRaises(ValueError):
+            CompressionPolicy(extensions={'.csv': 12})('unused', 'documents/data.csv')
+
+    def test_probe_stores_random_data(self):
+        policy = CompressionPolicy()
+        self.assertEqual(policy(self.write(os.urandom(20000)), 'others/x.bin'), (ZIP_STORED, None))
+        self.assertEqual(policy(self.write(b'abc' * 10000), 'others/x.bin'), (ZIP_DEFLATED, 6))
+        self.assertEqual(entropy(b''), 0.0)
+
+    @override_settings(ORGANIZER_COMPRESSION_POLICY={'.LOG': 0, 'documents': 'stored'},
+                       ORGANIZER_COMPRESSION_LEVEL=1)
+    def test_from_settings(self):
+        policy = CompressionPolicy.from_settings()
+        self.assertEqual(policy('unused', 'others/a.log'), (ZIP_STORED, None))
+        self.assertEqual(policy('unused', 'documents/a.txt'), (ZIP_STORED, None))
+        self.assertEqual(policy('unused', 'code/a.py'), (ZIP_DEFLATED, 1))
@@ -0,0 +1,78 @@
+import io
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from .. import dedupe
+from ..dedupe import DuplicateFinder, image_tree, invalidate_fingerprints
+from ..jobs import enqueue
+from ..manifest import Manifest
+from ..models import UserProfile
+from .utils import OrganizerTestCase
+
+
+def png(shade=0):
+    """A horizontal gradient; `shade` nudges a few pixels without changing its dHash much."""
+    img = Image.new('L', (64, 64))
+    img.putdata([min(255, x * 4 + (shade if y < 4 else 0)) for y in range(64) for x in range(64)])
+    buf = io.BytesIO()
+    img.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+class DuplicateTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_RUN_JOBS_INLINE': True}
+
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.create(user=self.user)
+        # Trees are cached per user id, which the next test reuses.
+        dedupe._trees.clear()
+        self.addCleanup(dedupe._trees.clear)
+
+    def organized(self, files, **fields):
+        job = self.make_job(files, **fields)
+        enqueue(job)
+        return job
+
+    def duplicates(self, job):
+        return {entry['original_name']: entry.get('duplicate') for entry in Manifest.for_job(job)}
+
+    def test_exact_duplicate_of_an_earlier_job(self):
+        first = self.organized({'a.txt': b'same'}, job_name='first')
+        job = self.make_job({'b.txt': b'same', 'c.txt': b'other'})
+        self.assertEqual(self.duplicates(job), {
+            'b.txt': {'kind': 'exact', 'of': 'a.txt', 'job_id': first.id, 'job_name': 'first'},
+            'c.txt': None,
+        })
+
+    def test_exact_check_is_one_query_whatever_the_history(self):
+        self.organized({f'{n}.txt': str(n).encode() for n in range(20)})
+        finder = DuplicateFinder(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            finder.check('new.txt', '0' * 64, 3, 'documents')
+        self.assertEqual(len(queries), 1)
+
+    def test_similar_image_of_a_deleted_job(self):
+        first = self.organized({'a.png': png()})
+        first.delete()
+        job = self.make_job({'b.png': png(shade=3)})
+        duplicate = self.duplicates(job)['b.png']
+        self.assertEqual((duplicate['kind'], duplicate['of'], duplicate['job_id']), ('similar', 'a.png', None))
+
+    def test_image_tree_is_cached_until_the_index_changes(self):
+        self.organized({'a.png': png()})
+        tree = image_tree(self.user)
+        self.assertIs(image_tree(self.user), tree)
+
+        # Checking a job's images leaves the shared tree alone.
+        self.make_job({'b.png': png(shade=3)})
+        self.assertIs(image_tree(self.user), tree)
+        self.assertEqual(len(tree.search(0, 64)), 1)
+
+        self.organized({'c.png': png(shade=200)})
+        self.assertIsNot(image_tree(self.user), tree)
+        tree = image_tree(self.user)
+        invalidate_fingerprints(self.user.pk)
+        self.assertIsNot(image_tree(self.user), tree)
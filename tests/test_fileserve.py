@@ -0,0 +1,113 @@
+import asyncio
+import os
+import shutil
+import tempfile
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..fileserve import MAX_RANGES, parse_ranges, serve_file
+
+
+class ParseRangesTests(SimpleTestCase):
+
+    def test_ranges(self):
+        self.assertEqual(parse_ranges('bytes=0-99', 1000), [(0, 99)])
+        self.assertEqual(parse_ranges('bytes=900-', 1000), [(900, 999)])
+        self.assertEqual(parse_ranges('bytes=-100', 1000), [(900, 999)])
+        self.assertEqual(parse_ranges('bytes=-5000', 1000), [(0, 999)])
+        self.assertEqual(parse_ranges('bytes=990-2000', 1000), [(990, 999)])
+
+    def test_overlapping_and_adjacent_ranges_are_merged(self):
+        self.assertEqual(parse_ranges('bytes=50-99, 0-49,200-300,250-260', 1000), [(0, 99), (200, 300)])
+
+    def test_ignored_headers(self):
+        for header in ('items=0-1', 'bytes=', 'bytes=a-b', 'bytes=5-1', 'bytes=0-1;x',
+                       'bytes=' + ','.join(f'{n * 10}-{n * 10 + 1}' for n in range(MAX_RANGES + 1))):
+            self.assertIsNone(parse_ranges(header, 1000), header)
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_ranges('bytes=1000-', 1000), [])
+        self.assertEqual(parse_ranges('bytes=-0', 1000), [])
+
+
+class ServeFileTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.path = os.path.join(tmp, 'job.zip')
+        self.data = bytes(range(256)) * 40
+        with open(self.path, 'wb') as fh:
+            fh.write(self.data)
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        return serve_file(self.factory.get('/', **headers), self.path, 'Job "1".zip', 'application/zip')
+
+    def body(self, response):
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_single_range(self):
+        response = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(self.body(response), self.data[100:200])
+
+    def test_multiple_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=0-9,-10')
+        self.assertEqual(response.status_code, 206)
+        body = self.body(response)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        boundary = response['Content-Type'].split('boundary=')[1]
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[1].split(b'\r\n\r\n', 1)[1], self.data[:10] + b'\r\n')
+        self.assertIn(f'bytes {len(self.data) - 10}-{len(self.data) - 1}/'.encode(), parts[2])
+        self.assertEqual(parts[-1], b'--\r\n')
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_conditionals(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other", ' + etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_MATCH='"other"').status_code, 412)
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_etag_changes_with_the_file(self):
+        etag = self.get()['ETag']
+        with open(self.path, 'ab') as fh:
+            fh.write(b'more')
+        self.assertNotEqual(self.get()['ETag'], etag)
+
+    @override_settings(ORGANIZER_SENDFILE='X-Accel-Redirect', ORGANIZER_SENDFILE_URL='/protected/')
+    def test_sendfile_offload(self):
+        with override_settings(ORGANIZER_SENDFILE_ROOT=os.path.dirname(self.path)):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/job.zip')
+        self.assertEqual(response.content, b'')
+
+    def test_asynchronous_body(self):
+        response = serve_file(self.factory.get('/', HTTP_RANGE='bytes=5-14'), self.path, 'a.zip',
+                              asynchronous=True)
+
+        async def collect():
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(asyncio.run(collect()), self.data[5:15])
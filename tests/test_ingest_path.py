@@ -0,0 +1,59 @@
+import errno
+import os
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+
+from .. import materialize
+from ..models import UploadJob
+from .utils import OrganizerTestCase
+
+
+def _refuse(src, dest):
+    raise OSError(errno.EPERM, 'Operation not permitted')
+
+
+class IngestPathTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_CONSUME_UPLOADS': True}
+
+    def setUp(self):
+        super().setUp()
+        self.source = Path(tempfile.mkdtemp(dir=self.media_root))
+        self.target = Path(self.media_root) / 'organized'
+        (self.source / 'sub').mkdir()
+        (self.source / 'notes.txt').write_text('notes')
+        (self.source / 'sub' / 'photo.jpg').write_bytes(b'\xff\xd8\xff photo')
+
+    def ingest(self, *args):
+        call_command('ingest_path', self.user.username, str(self.source), '--target', str(self.target),
+                     '--inline', *args, stdout=StringIO())
+        return UploadJob.objects.latest('id')
+
+    def test_files_are_linked_into_the_target(self):
+        job = self.ingest()
+        self.assertEqual(job.status, 'completed')
+        placed = self.target / 'documents' / '1_notes.txt'
+        self.assertEqual(os.stat(placed).st_ino, os.stat(self.source / 'notes.txt').st_ino)
+        self.assertTrue((self.source / 'sub' / 'photo.jpg').exists())
+
+    def test_sources_are_copied_not_moved_when_links_fail(self):
+        with mock.patch.dict(materialize._IMPLEMENTATIONS, {'link': _refuse, 'reflink': _refuse}):
+            job = self.ingest()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.organize_strategy, 'copy')
+        self.assertEqual((self.source / 'notes.txt').read_text(), 'notes')
+        self.assertEqual((self.target / 'documents' / '1_notes.txt').read_text(), 'notes')
+
+    def test_move_takes_the_files(self):
+        self.ingest('--move')
+        self.assertFalse((self.source / 'notes.txt').exists())
+        self.assertEqual(len(list(self.target.rglob('*.*'))), 2)
+
+    def test_a_second_run_only_picks_up_new_files(self):
+        self.ingest()
+        (self.source / 'more.txt').write_text('more')
+        job = self.ingest()
+        self.assertEqual(list(job.files.values_list('original_name', flat=True)), ['more.txt'])
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.urls import reverse
+from django.utils.timezone import now
+
+from .. import jobs
+from ..jobs import _claim, claim_next, enqueue, requeue_stale, run_job
+from ..models import UploadJob
+from .utils import OrganizerTestCase
+
+
+class JobQueueTests(OrganizerTestCase):
+
+    def test_claim_takes_oldest_queued_job_once(self):
+        first = self.make_job({'a.txt': b'a'})
+        second = self.make_job({'b.txt': b'b'})
+        enqueue(second, inline=False)
+        enqueue(first, inline=False)
+
+        self.assertEqual(claim_next('w1').id, second.id)
+        self.assertEqual(claim_next('w2').id, first.id)
+        self.assertIsNone(claim_next('w3'))
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.worker), ('processing', 'w1'))
+
+    def test_unqueued_or_claimed_jobs_cannot_be_claimed(self):
+        job = self.make_job({'a.txt': b'a'})
+        self.assertFalse(_claim(job.id, 'w1'))
+        enqueue(job, inline=False)
+        self.assertTrue(_claim(job.id, 'w1'))
+        self.assertFalse(_claim(job.id, 'w2'))
+
+    def test_stale_jobs_are_requeued(self):
+        stale = self.make_job({'a.txt': b'a'})
+        fresh = self.make_job({'b.txt': b'b'})
+        for job in (stale, fresh):
+            enqueue(job, inline=False)
+            _claim(job.id, 'w1')
+        UploadJob.objects.filter(id=stale.id).update(started_at=now() - timedelta(hours=2))
+
+        self.assertEqual(requeue_stale(max_age=3600), 1)
+        self.assertEqual(claim_next('w2').id, stale.id)
+
+    def test_failure_is_recorded_on_the_job(self):
+        job = self.make_job({'a.txt': b'a'})
+        enqueue(job, inline=False)
+        job = claim_next('w1')
+        with mock.patch.object(jobs, 'organize_job', side_effect=OSError('disk full')), \
+                self.assertLogs(jobs.logger, 'ERROR'):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('disk full', job.error_message)
+        self.assertIsNotNone(job.completed_at)
+
+    def test_inline_job_is_organized(self):
+        job = self.make_job({'a.txt': b'hello', 'b.jpg': b'\xff\xd8\xff'})
+        enqueue(job, inline=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(sorted(job.files.values_list('category', flat=True)), ['documents', 'images'])
+
+
+class OrganizeViewTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_RUN_JOBS_INLINE': False}
+
+    def test_job_is_queued_only_once(self):
+        job = self.make_job({'a.txt': b'a'})
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['current_job_id'] = job.id
+        session.save()
+
+        self.client.post(reverse('organize'))
+        queued_at = UploadJob.objects.get(id=job.id).queued_at
+        self.assertIsNotNone(queued_at)
+
+        session = self.client.session
+        session['current_job_id'] = job.id
+        session.save()
+        response = self.client.post(reverse('organize'))
+        self.assertRedirects(response, reverse('job_detail', args=[job.id]), fetch_redirect_response=False)
+        self.assertEqual(UploadJob.objects.get(id=job.id).queued_at, queued_at)
@@ -0,0 +1,60 @@
+from django.test import SimpleTestCase
+
+from ..naming import NameAllocator, PatternError, compile_pattern, render_name
+
+
+ITEM = {
+    'original_name': 'Holiday Photo.JPG',
+    'category': 'images',
+    'file_size': 2048,
+    'content_hash': '0123456789abcdef' * 4,
+    'modified': 1700000000,
+}
+
+
+class NameAllocatorTests(SimpleTestCase):
+
+    def test_collisions_get_numbered_suffixes(self):
+        names = NameAllocator()
+        self.assertEqual(names.claim('docs', 'a.txt'), 'a.txt')
+        self.assertEqual(names.claim('docs', 'a.txt'), 'a_2.txt')
+        self.assertEqual(names.claim('docs', 'a.txt'), 'a_3.txt')
+        self.assertEqual(names.claim('images', 'a.txt'), 'a.txt')
+
+    def test_names_differing_only_in_case_collide(self):
+        names = NameAllocator()
+        names.claim('docs', 'Readme')
+        self.assertEqual(names.claim('docs', 'README'), 'README_2')
+
+    def test_suffixed_name_already_taken_is_skipped(self):
+        names = NameAllocator()
+        names.claim('docs', 'a_2.txt')
+        names.claim('docs', 'a.txt')
+        self.assertEqual(names.claim('docs', 'a.txt'), 'a_3.txt')
+        self.assertEqual(names.claim('docs', 'a_2.txt'), 'a_2_2.txt')
+
+    def test_existing_files_count_as_taken(self):
+        on_disk = {('docs', 'a.txt'), ('docs', 'a_2.txt')}
+        names = NameAllocator(exists=lambda folder, name: (folder, name) in on_disk)
+        self.assertEqual(names.claim('docs', 'a.txt'), 'a_3.txt')
+        self.assertEqual(names.claim('docs', 'b.txt'), 'b.txt')
+
+
+class RenamePatternTests(SimpleTestCase):
+
+    def test_tokens(self):
+        pattern = compile_pattern('{index:03}-{category}-{stem}{ext}-{hash}-{size}')
+        self.assertEqual(pattern(7, ITEM), '007-images-Holiday Photo.JPG-01234567-2048')
+
+    def test_unsafe_results_fall_back(self):
+        self.assertEqual(compile_pattern('{stem}/{ext}')(1, ITEM), 'Holiday Photo_.JPG')
+        self.assertEqual(compile_pattern('{category:.0}')(3, ITEM), '3_Holiday Photo.JPG')
+
+    def test_invalid_patterns(self):
+        for pattern in ('{nope}', 'static', '{index', '{size:%Y}'):
+            with self.assertRaises(PatternError, msg=pattern):
+                compile_pattern(pattern)
+
+    def test_render_prefers_resolved_name(self):
+        self.assertEqual(render_name('{index}_{name}', 4, {**ITEM, 'new_name': 'kept.jpg'}), 'kept.jpg')
+        self.assertEqual(render_name('{bad}', 4, ITEM), '4_Holiday Photo.JPG')
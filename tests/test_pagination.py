@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.contrib.admin.sites import site
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils.timezone import now
+
+from ..models import FileRecord, UploadJob
+from ..pagination import decode_cursor, encode_cursor
+from .utils import OrganizerTestCase
+
+
+class KeysetPaginationTests(OrganizerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        base = now()
+        # Pairs of jobs share a timestamp, so ties have to be broken by id.
+        self.jobs = [
+            UploadJob.objects.create(user=self.user, job_name=f'job {n}') for n in range(5)
+        ]
+        for n, job in enumerate(self.jobs):
+            UploadJob.objects.filter(id=job.id).update(created_at=base - timedelta(minutes=n // 2))
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [job['id'] for job in response.json()['results']]
+            url = response.json()['next']
+        return seen
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        expected = list(UploadJob.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk(reverse('api_jobs') + '?page_size=2'), expected)
+
+    def test_rows_added_meanwhile_do_not_shift_pages(self):
+        first = self.client.get(reverse('api_jobs') + '?page_size=2').json()
+        UploadJob.objects.create(user=self.user, job_name='newer')
+        rest = self.walk(first['next'])
+        ids = [job['id'] for job in first['results']] + rest
+        self.assertEqual(sorted(ids), sorted(job.id for job in self.jobs))
+
+    def test_cursor_round_trip_and_bad_cursor(self):
+        job = UploadJob.objects.get(id=self.jobs[0].id)
+        self.assertEqual(decode_cursor(encode_cursor(job.created_at, job.id)), (job.created_at, job.id))
+        with self.assertRaises(ValueError):
+            decode_cursor('not a cursor')
+        self.assertEqual(self.client.get(reverse('api_jobs') + '?cursor=garbage').status_code, 404)
+
+    def test_other_users_jobs_are_not_listed(self):
+        other = self.user.__class__.objects.create_user('bob', 'bob@example.com', 'pw')
+        UploadJob.objects.create(user=other, job_name='not yours')
+        self.assertNotIn('not yours', str(self.client.get(reverse('api_jobs')).json()))
+
+
+class FileRecordSearchTests(OrganizerTestCase):
+
+    def test_admin_search_by_name_prefix_or_hash(self):
+        job = UploadJob.objects.create(user=self.user, job_name='job')
+        digest = 'ab' * 32
+        report = FileRecord.objects.create(job=job, original_name='Report.pdf', new_name='1_Report.pdf',
+                                           category='documents', file_size=1, original_path='x',
+                                           content_hash=digest)
+        FileRecord.objects.create(job=job, original_name='photo.jpg', new_name='2_photo.jpg',
+                                  category='images', file_size=1, original_path='y')
+        file_admin = site._registry[FileRecord]
+        request = RequestFactory().get('/')
+
+        def search(term):
+            results, _ = file_admin.get_search_results(request, FileRecord.objects.all(), term)
+            return list(results)
+
+        self.assertEqual(search('report'), [report])
+        self.assertEqual(search('1_rep'), [report])
+        self.assertEqual(search(digest.upper()), [report])
+        self.assertEqual(search('port'), [])
@@ -0,0 +1,55 @@
+from datetime import date
+from unittest import mock
+
+from .. import naming
+from ..jobs import enqueue
+from ..models import CustomRule
+from ..reorganize import plan
+from ..ruleengine import invalidate_rules
+from .utils import OrganizerTestCase
+
+
+class PlanTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_RUN_JOBS_INLINE': True}
+
+    def setUp(self):
+        super().setUp()
+        # Rules are cached per user id, which the next test reuses.
+        invalidate_rules(self.user)
+        self.addCleanup(invalidate_rules, self.user)
+
+    def organized(self, files, pattern):
+        job = self.make_job(files, rename_pattern=pattern)
+        enqueue(job)
+        return job
+
+    def add_rule(self, extension, folder):
+        CustomRule.objects.create(user=self.user, name=folder, rule_type='extension',
+                                  match_value=extension, target_folder=folder)
+        invalidate_rules(self.user)
+
+    def test_moved_files_keep_their_names(self):
+        job = self.organized({'a.txt': b'a', 'b.jpg': b'\xff\xd8\xff'}, '{date:%Y%m%d}_{name}')
+        name = job.files.get(original_name='a.txt').new_name
+        self.add_rule('.txt', 'notes')
+
+        later = mock.Mock(wraps=date, today=mock.Mock(return_value=date(2000, 1, 1)))
+        with mock.patch.object(naming, 'date', later):
+            move, = plan(job)
+        self.assertEqual((move.category, move.new_name), ('notes', name))
+
+    def test_folder_in_the_pattern_is_rendered_again(self):
+        job = self.organized({'a.txt': b'a'}, '{category}_{name}')
+        self.add_rule('.txt', 'notes')
+        move, = plan(job)
+        self.assertEqual(move.arcname, 'notes/notes_a.txt')
+
+    def test_taken_name_is_made_unique(self):
+        job = self.organized({'a.txt': b'a', 'a.zz': b'b'}, '{stem}')
+        self.assertEqual(
+            sorted(job.files.values_list('category', 'new_name')),
+            [('documents', 'a'), ('others', 'a')],
+        )
+        self.add_rule('.zz', 'documents')
+        move, = plan(job)
+        self.assertEqual(move.arcname, 'documents/a_2')
@@ -0,0 +1,164 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils.timezone import now
+
+from ..blobstore import blob_path
+from ..jobs import enqueue
+from ..models import UploadJob
+from ..retention import SWEEP_MIN_AGE, collect, discard_job
+from ..stats import get_stats, rebuild_stats
+from ..workspace import ensure_workspace
+from .utils import OrganizerTestCase
+
+
+def zipped(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def age(digest):
+    old = time.time() - SWEEP_MIN_AGE - 60
+    os.utime(blob_path(digest), (old, old))
+
+
+class QuotaTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_USER_QUOTA': 1000}
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def upload(self, name, data, **fields):
+        return self.client.post(reverse('upload'), {
+            'files': [SimpleUploadedFile(name, data)], 'job_name': 'quota', **fields,
+        })
+
+    def assertNoJobs(self):
+        self.assertFalse(UploadJob.objects.exists())
+        self.assertEqual(get_stats(self.user).total_size, 0)
+        self.assertEqual(list((ensure_workspace(self.user) / 'uploads').iterdir()), [])
+
+    def test_upload_over_quota_is_refused(self):
+        self.assertEqual(self.upload('big.bin', b'x' * 1500).status_code, 413)
+        self.assertFalse(UploadJob.objects.exists())
+
+    def test_unpacked_archive_over_quota_is_removed(self):
+        archive = zipped({'a.txt': b'\0' * 600, 'b.txt': b'\0' * 600})
+        self.assertLess(len(archive), 1000)
+        response = self.upload('files.zip', archive, unpack_archives='on')
+        self.assertEqual(response.status_code, 413)
+        self.assertNoJobs()
+
+    def test_unpacked_archive_within_quota_is_kept(self):
+        response = self.upload('files.zip', zipped({'a.txt': b'\0' * 600}), unpack_archives='on')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(get_stats(self.user).total_size, 600)
+
+    def test_api_unpacked_archive_over_quota_is_removed(self):
+        archive = zipped({'a.txt': b'\0' * 600, 'b.txt': b'\0' * 600})
+        response = self.client.post(reverse('api_upload_session'), json.dumps({
+            'job_name': 'api', 'unpack_archives': True,
+            'files': [{'name': 'files.zip', 'size': len(archive)}],
+        }), content_type='application/json')
+        job_id = response.json()['job_id']
+        self.client.put(reverse('api_upload_chunk', args=[job_id, 0]), archive,
+                        content_type='application/octet-stream')
+        response = self.client.post(reverse('api_upload_complete', args=[job_id]))
+        self.assertEqual(response.status_code, 413)
+        self.assertNoJobs()
+
+    def test_deleting_a_job_frees_its_quota(self):
+        job = self.make_job({'a.txt': b'a' * 800})
+        self.assertEqual(self.upload('b.txt', b'b' * 500).status_code, 413)
+
+        response = self.client.post(reverse('delete_job', args=[job.id]))
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertNoJobs()
+        self.assertEqual(self.upload('b.txt', b'b' * 500).status_code, 302)
+
+    def test_server_side_jobs_are_not_counted(self):
+        source = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, source, ignore_errors=True)
+        (source / 'big.bin').write_bytes(b'x' * 5000)
+        call_command('ingest_path', self.user.username, str(source), '--target', str(source / 'organized'),
+                     '--inline', stdout=StringIO())
+        stats = get_stats(self.user)
+        self.assertEqual((stats.total_size, stats.stored_size), (5000, 0))
+        self.assertEqual(self.upload('b.txt', b'b' * 500).status_code, 302)
+        self.assertEqual(rebuild_stats(self.user.pk).stored_size, 500)
+
+    def test_queued_job_cannot_be_deleted(self):
+        job = self.make_job({'a.txt': b'a'})
+        enqueue(job, inline=False)
+        self.client.post(reverse('delete_job', args=[job.id]))
+        self.assertTrue(UploadJob.objects.filter(id=job.id).exists())
+
+
+class RetentionTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_RUN_JOBS_INLINE': True}
+
+    def assertMatchesRebuild(self):
+        stats = get_stats(self.user)
+        fields = ('total_jobs', 'completed_jobs', 'total_files', 'total_size', 'stored_size')
+        counted = [getattr(stats, field) for field in fields]
+        stats = rebuild_stats(self.user.pk)
+        self.assertEqual(counted, [getattr(stats, field) for field in fields])
+
+    def test_policies_apply_by_age(self):
+        workspace = ensure_workspace(self.user)
+        organized = self.make_job({'a.txt': b'organized'})
+        enqueue(organized)
+        self.make_job({'b.txt': b'abandoned'})
+        failed = self.make_job({'c.txt': b'failed'})
+        UploadJob.objects.filter(id=failed.id).update(status='failed', completed_at=now())
+
+        counts = collect(at=now() + timedelta(days=1))
+        self.assertEqual((counts['staging'], counts['archives'], counts['abandoned'], counts['failed']),
+                         (1, 0, 0, 0))
+        self.assertFalse((workspace / 'uploads' / str(organized.id)).exists())
+        self.assertTrue((workspace / 'jobs' / f'{organized.id}.zip').exists())
+
+        counts = collect(at=now() + timedelta(days=31))
+        self.assertEqual((counts['archives'], counts['abandoned'], counts['failed']), (1, 1, 1))
+        self.assertFalse((workspace / 'jobs' / f'{organized.id}.zip').exists())
+        self.assertEqual(list(UploadJob.objects.values_list('id', flat=True)), [organized.id])
+        self.assertMatchesRebuild()
+
+    def test_young_blobs_are_left_to_the_sweep(self):
+        data = b'shared by a new upload'
+        digest = hashlib.sha256(data).hexdigest()
+        job = self.make_job({'a.txt': data})
+
+        discard_job(job)
+        self.assertTrue(blob_path(digest).exists())
+
+        age(digest)
+        self.assertEqual(collect(sweep=True)['blobs'], 1)
+        self.assertFalse(blob_path(digest).exists())
+
+    def test_reused_blob_is_made_young(self):
+        data = b'uploaded twice'
+        digest = hashlib.sha256(data).hexdigest()
+        first = self.make_job({'a.txt': data})
+        age(digest)
+        second = self.make_job({'b.txt': data})
+
+        discard_job(first)
+        discard_job(second)
+        self.assertTrue(blob_path(digest).exists())
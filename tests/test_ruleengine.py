@@ -0,0 +1,130 @@
+from datetime import datetime, timezone
+
+from django.contrib.admin.sites import site
+from django.test import RequestFactory, SimpleTestCase
+
+from ..manifest import Manifest
+from ..models import CustomRule, UserProfile
+from ..ruleengine import (
+    CompiledRules, RuleSyntaxError, get_matcher, parse_date_rule, parse_size,
+    parse_size_range, safe_folder,
+)
+from .utils import OrganizerTestCase
+
+
+def rules(*specs):
+    """CustomRules from (rule_type, match_value, target_folder), top rule first."""
+    return [
+        CustomRule(pk=n, name=f'rule {n}', rule_type=rule_type, match_value=value, target_folder=folder)
+        for n, (rule_type, value, folder) in enumerate(specs, start=1)
+    ]
+
+
+MARCH_2024 = datetime(2024, 3, 15, 12, tzinfo=timezone.utc)
+
+
+class ParsingTests(SimpleTestCase):
+
+    def test_sizes(self):
+        self.assertEqual(parse_size('1.5KB'), 1536)
+        self.assertEqual(parse_size('2 m'), 2 * 1024 ** 2)
+        self.assertEqual(parse_size_range('>10MB'), (10 * 1024 ** 2 + 1, float('inf')))
+        self.assertEqual(parse_size_range('size: <=1KB'), (float('-inf'), 1025))
+        self.assertEqual(parse_size_range('1KB..2KB'), (1024, 2049))
+        with self.assertRaises(RuleSyntaxError):
+            parse_size('lots')
+
+    def test_dates(self):
+        self.assertEqual(parse_date_rule('March'), ('month', 3))
+        self.assertEqual(parse_date_rule('date: mar'), ('month', 3))
+        kind, (low, high) = parse_date_rule('2024-03')
+        self.assertEqual(kind, 'range')
+        self.assertLessEqual(low, MARCH_2024.timestamp())
+        self.assertLess(MARCH_2024.timestamp(), high)
+        self.assertEqual(parse_date_rule('<2024')[1][1], datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+        with self.assertRaises(RuleSyntaxError):
+            parse_date_rule('2024-13')
+
+    def test_safe_folder(self):
+        self.assertEqual(safe_folder('../tax/2024'), 'tax-2024')
+        self.assertEqual(safe_folder('...'), 'others')
+
+
+class ClassifyTests(SimpleTestCase):
+
+    def test_builtin_extensions(self):
+        matcher = CompiledRules()
+        self.assertEqual(matcher.classify('photo.JPG'), 'images')
+        self.assertEqual(matcher.classify('mystery.xyz'), 'others')
+
+    def test_top_rule_wins_across_kinds(self):
+        matcher = CompiledRules(rules(
+            ('name', 'invoice*', 'invoices'),
+            ('size', '>1MB', 'big'),
+            ('extension', 'pdf, .txt', 'papers'),
+        ))
+        self.assertEqual(matcher.classify('invoice-7.pdf', 5 * 1024 ** 2), 'invoices')
+        self.assertEqual(matcher.classify('report.pdf', 5 * 1024 ** 2), 'big')
+        self.assertEqual(matcher.classify('report.pdf', 10), 'papers')
+        self.assertEqual(matcher.classify('photo.jpg', 10), 'images')
+
+    def test_user_extension_rule_beats_builtin(self):
+        matcher = CompiledRules(rules(('extension', '.jpg', 'photos')))
+        self.assertEqual(matcher.classify('a.jpg'), 'photos')
+
+    def test_name_patterns(self):
+        matcher = CompiledRules(rules(
+            ('name', r're:^(\w)\1', 'doubled'),
+            ('name', 'draft', 'drafts'),
+            ('name', '(', 'literal'),
+        ))
+        self.assertEqual(matcher.classify('aab.txt'), 'doubled')
+        self.assertEqual(matcher.classify('my DRAFT.txt'), 'drafts')
+        self.assertEqual(matcher.classify('x(1).bin'), 'literal')
+
+    def test_date_rules_need_a_modified_time(self):
+        matcher = CompiledRules(rules(('date', 'March', 'spring'), ('date', '2024', 'last-year')))
+        self.assertEqual(matcher.classify('a.txt', 1, MARCH_2024), 'spring')
+        self.assertEqual(matcher.classify('a.txt', 1, MARCH_2024.replace(month=6)), 'last-year')
+        self.assertEqual(matcher.classify('a.txt', 1, None), 'documents')
+
+    def test_overlapping_size_ranges(self):
+        matcher = CompiledRules(rules(('size', '1KB-2KB', 'small'), ('size', '<1MB', 'medium')))
+        self.assertEqual(matcher.classify('a.bin', 1500), 'small')
+        self.assertEqual(matcher.classify('a.bin', 100), 'medium')
+        self.assertEqual(matcher.classify('a.bin', 1024 ** 2), 'others')
+
+    def test_invalid_rules_are_reported_not_raised(self):
+        matcher = CompiledRules(rules(('size', 'huge', 'x'), ('extension', '.pdf', 'pdfs')))
+        self.assertIn(1, matcher.errors)
+        self.assertEqual(matcher.classify('a.pdf'), 'pdfs')
+
+    def test_sniff_only_when_nothing_matched(self):
+        matcher = CompiledRules()
+        self.assertEqual(matcher.classify('blob', sniff=lambda: 'images'), 'images')
+        self.assertEqual(matcher.classify('a.txt', sniff=lambda: 'images'), 'documents')
+        self.assertEqual(matcher.classify('a.txt', sniff=lambda: 'images', sniff_known=True), 'images')
+
+
+class UserRuleTests(OrganizerTestCase):
+
+    def test_uploads_without_a_time_skip_date_rules(self):
+        CustomRule.objects.create(user=self.user, name='this year', rule_type='date',
+                                  match_value='>=2000', target_folder='recent')
+        job = self.make_job({'a.txt': b'a'})
+        entry, = Manifest.for_job(job)
+        self.assertEqual(entry['category'], 'documents')
+        self.assertNotIn('modified', entry)
+
+    def test_admin_changes_invalidate_compiled_rules(self):
+        UserProfile.objects.create(user=self.user)
+        self.assertEqual(get_matcher(self.user).classify('a.pdf'), 'documents')
+        rule_admin = site._registry[CustomRule]
+        request = RequestFactory().post('/')
+        rule = CustomRule(user=self.user, name='pdfs', rule_type='extension',
+                          match_value='.pdf', target_folder='pdfs')
+
+        rule_admin.save_model(request, rule, None, False)
+        self.assertEqual(get_matcher(self.user).classify('a.pdf'), 'pdfs')
+        rule_admin.delete_model(request, rule)
+        self.assertEqual(get_matcher(self.user).classify('a.pdf'), 'documents')
@@ -0,0 +1,47 @@
+from unittest import mock
+
+from .. import jobs
+from ..jobs import enqueue
+from ..models import UserProfile, UserStats
+from ..stats import get_stats, rebuild_stats
+from .utils import OrganizerTestCase
+
+
+class StatsTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_RUN_JOBS_INLINE': True}
+
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.create(user=self.user)
+
+    def assertMatchesRebuild(self):
+        stats = get_stats(self.user)
+        counted = (stats.total_jobs, stats.completed_jobs, stats.total_files, stats.total_size)
+        stats = rebuild_stats(self.user.pk)
+        self.assertEqual(counted, (stats.total_jobs, stats.completed_jobs, stats.total_files, stats.total_size))
+
+    def test_counters_follow_organize_and_reruns(self):
+        job = self.make_job({'a.txt': b'aa', 'b.jpg': b'\xff\xd8\xff'})
+        enqueue(job)
+        self.assertEqual(get_stats(self.user).completed_jobs, 1)
+        self.assertMatchesRebuild()
+
+        with mock.patch.object(jobs, 'reorganize_job', side_effect=OSError('boom')), \
+                self.assertLogs(jobs.logger, 'ERROR'):
+            enqueue(job, rerun=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(get_stats(self.user).completed_jobs, 0)
+        self.assertMatchesRebuild()
+
+        enqueue(job, rerun=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(get_stats(self.user).completed_jobs, 1)
+        self.assertMatchesRebuild()
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_files_organized, 2)
+
+    def test_stats_row_is_built_on_first_use(self):
+        self.make_job({'a.txt': b'aa'})
+        UserStats.objects.all().delete()
+        self.assertEqual(get_stats(self.user).total_files, 1)
@@ -0,0 +1,250 @@
+"""Storage tests against an in-memory stand-in for an S3 bucket.
+
+boto3 is optional, so the client is stubbed: `FakeS3Client` implements
+the calls S3Storage makes, on a dict of keys shared by every client.
+"""
+import io
+import os
+import shutil
+import zipfile
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+
+from .. import storage
+from ..blobstore import blob_path, blob_root
+from ..jobs import enqueue
+from ..workspace import ensure_workspace
+from .utils import OrganizerTestCase
+
+
+class FakeClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = []
+
+    def _get(self, bucket, key):
+        try:
+            return self.objects[bucket, key]
+        except KeyError:
+            raise FakeClientError('404')
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self._get(Bucket, Key)),
+                'LastModified': datetime(2024, 1, 1, tzinfo=timezone.utc)}
+
+    def upload_file(self, Filename, Bucket, Key, Config=None):
+        self.calls.append(('upload_file', Key))
+        with open(Filename, 'rb') as fh:
+            self.objects[Bucket, Key] = fh.read()
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, Config=None):
+        self.objects[Bucket, Key] = Fileobj.read()
+
+    def download_file(self, Bucket, Key, Filename, Config=None):
+        data = self._get(Bucket, Key)
+        with open(Filename, 'wb') as fh:
+            fh.write(data)
+
+    def download_fileobj(self, Bucket, Key, Fileobj, Config=None):
+        Fileobj.write(self._get(Bucket, Key))
+
+    def copy(self, CopySource, Bucket, Key, Config=None):
+        self.calls.append(('copy', Key))
+        self.objects[Bucket, Key] = self._get(CopySource['Bucket'], CopySource['Key'])
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        self.presigned = Params
+        return f'https://bucket.example/{Params["Key"]}?signed'
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, Delimiter):
+                keys = sorted(key[len(Prefix):] for bucket, key in client.objects
+                              if bucket == Bucket and key.startswith(Prefix))
+                yield {
+                    'CommonPrefixes': [{'Prefix': Prefix + d} for d in
+                                       sorted({k.split('/')[0] + '/' for k in keys if '/' in k})],
+                    'Contents': [{'Key': Prefix + k} for k in keys if '/' not in k],
+                }
+        return Paginator()
+
+
+class FakeS3Mixin:
+    """Patches boto3 out of storage.py for the duration of each test."""
+
+    def setUp(self):
+        super().setUp()
+        self.objects = {}
+        self.clients = []
+
+        def client(service, **kwargs):
+            self.clients.append(FakeS3Client(self.objects))
+            return self.clients[-1]
+
+        boto3 = mock.Mock()
+        boto3.session.Session.return_value.client.side_effect = client
+        patcher = mock.patch.multiple(
+            storage, create=True, boto3=boto3, Config=mock.Mock(), TransferConfig=mock.Mock(),
+            ClientError=FakeClientError,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def bucket_keys(self):
+        return sorted(key for _, key in self.objects)
+
+
+class S3StorageTests(FakeS3Mixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.s3 = storage.S3Storage(bucket='files', prefix='/organizer/')
+
+    def test_needs_a_bucket(self):
+        with self.assertRaises(ImproperlyConfigured):
+            storage.S3Storage()
+
+    def test_storage_api(self):
+        self.assertEqual(self.s3.save('a/b.txt', ContentFile(b'hello')), 'a/b.txt')
+        self.assertEqual(self.bucket_keys(), ['organizer/a/b.txt'])
+        self.assertTrue(self.s3.exists('a/b.txt'))
+        self.assertEqual(self.s3.size('a/b.txt'), 5)
+        with self.s3.open('a/b.txt') as fh:
+            self.assertEqual(fh.read(), b'hello')
+        self.s3.save('top.txt', ContentFile(b''))
+        self.assertEqual(self.s3.listdir(''), (['a'], ['top.txt']))
+        self.s3.delete('a/b.txt')
+        self.assertFalse(self.s3.exists('a/b.txt'))
+        with self.assertRaises(FileNotFoundError):
+            self.s3.open('a/b.txt')
+
+    def test_copy_and_move_stay_in_the_bucket(self):
+        self.s3.save('src', ContentFile(b'data'))
+        self.assertEqual(self.s3.copy('src', 'dest'), storage.SERVER_COPY)
+        self.s3.move('dest', 'moved')
+        self.assertEqual(self.bucket_keys(), ['organizer/moved', 'organizer/src'])
+
+    def test_missing_object_download(self):
+        with self.assertRaises(FileNotFoundError):
+            self.s3.get_file('nope', os.devnull)
+
+    def test_presigned_url_escapes_the_filename(self):
+        name = 'My "report" – 2024.zip'
+        url = self.s3.url('users/1/jobs/1.zip', filename=name)
+        self.assertEqual(url, 'https://bucket.example/organizer/users/1/jobs/1.zip?signed')
+        params = self.clients[0].presigned
+        self.assertEqual(params['ResponseContentDisposition'], content_disposition_header(True, name))
+        self.assertNotIn('"report"', params['ResponseContentDisposition'])
+
+    def test_one_client_per_process(self):
+        self.assertIs(self.s3.client, self.s3.client)
+        with mock.patch.object(storage.os, 'getpid', return_value=-1):
+            self.assertIsNot(self.s3.client, self.clients[0])
+
+
+class TransferTests(FakeS3Mixin, OrganizerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.s3 = storage.S3Storage(bucket='files')
+
+    def test_publish_and_fetch(self):
+        path = ensure_workspace(self.user) / 'jobs' / 'x.txt'
+        path.write_bytes(b'x')
+        storage.publish(path, storage=self.s3)
+        self.assertEqual(self.bucket_keys(), [f'users/{self.user.id}/jobs/x.txt'])
+
+        path.unlink()
+        self.assertTrue(storage.fetch(path, storage=self.s3))
+        self.assertEqual(path.read_bytes(), b'x')
+        self.assertFalse(storage.fetch(path.with_name('missing'), storage=self.s3))
+        self.assertEqual(os.listdir(path.parent), ['x.txt'])
+
+    def test_local_storage_publishes_nothing(self):
+        path = ensure_workspace(self.user) / 'jobs' / 'x.txt'
+        self.assertFalse(storage.fetch(path))
+        path.write_bytes(b'x')
+        storage.publish(path)
+        self.assertTrue(storage.get_storage().is_local)
+
+    def test_blob_publisher_uploads_each_blob_once(self):
+        digests = []
+        for data in (b'one', b'two'):
+            digest = data.hex().ljust(64, '0')
+            blob_path(digest).parent.mkdir(parents=True, exist_ok=True)
+            blob_path(digest).write_bytes(data)
+            digests.append(digest)
+        self.s3.put_file(blob_path(digests[1]), storage.media_name(blob_path(digests[1])))
+
+        publisher = storage.BlobPublisher(self.s3)
+        for digest in digests + digests:
+            publisher.add(digest)
+        self.assertEqual(publisher.close(), 2)
+        uploads = [key for call, key in self.clients[0].calls if call == 'upload_file']
+        self.assertEqual(uploads.count(storage.media_name(blob_path(digests[0]))), 1)
+        self.assertEqual(uploads.count(storage.media_name(blob_path(digests[1]))), 1)  # the put_file above
+
+
+class RemoteJobTests(FakeS3Mixin, OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_RUN_JOBS_INLINE': True}
+
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            storage.STORAGE_ALIAS: {'BACKEND': f'{storage.__name__}.S3Storage', 'OPTIONS': {'bucket': 'files'}},
+        })
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_job_is_organized_inside_the_bucket(self):
+        job = self.make_job({'a.txt': b'hello', 'b.jpg': b'\xff\xd8\xff'})
+        self.assertEqual(sum(key.startswith('blobs/') for key in self.bucket_keys()), 2)
+        enqueue(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.organize_strategy), ('completed', storage.SERVER_COPY))
+        jobs = f'users/{self.user.id}/jobs'
+        self.assertIn(f'{jobs}/{job.id}/documents/1_a.txt', self.bucket_keys())
+        self.assertIn(f'{jobs}/{job.id}.zip', self.bucket_keys())
+        self.assertFalse((ensure_workspace(self.user) / 'jobs' / f'{job.id}.zip').exists())
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('download', args=[job.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(f'https://bucket.example/{jobs}/{job.id}.zip'))
+
+    @override_settings(ORGANIZER_ZIP_MODE='stream')
+    def test_stream_job_runs_on_a_node_without_the_upload(self):
+        job = self.make_job({'a.txt': b'hello', 'b.jpg': b'\xff\xd8\xff'})
+        # Another node: neither the upload links nor the blobs are here.
+        shutil.rmtree(ensure_workspace(self.user) / 'uploads')
+        shutil.rmtree(blob_root())
+        enqueue(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.file_errors), ('completed', []))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('download', args=[job.id]))
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as zf:
+            self.assertEqual(zf.read('documents/1_a.txt'), b'hello')
+            self.assertEqual(len(zf.namelist()), 2)
@@ -0,0 +1,93 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from ..jobs import enqueue
+from ..workspace import ensure_workspace
+from ..zipstream import ZipStream, rename_zip, stream_zip
+from .utils import OrganizerTestCase
+
+
+class ZipStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.files = {
+            'documents/notes.txt': b'hello world\n' * 1000,
+            'images/photo.jpg': os.urandom(70000),
+            'others/empty.bin': b'',
+            'documents/résumé.txt': 'ünïcode'.encode(),
+        }
+        self.members = []
+        for n, (arcname, data) in enumerate(self.files.items()):
+            path = os.path.join(self.tmp, str(n))
+            with open(path, 'wb') as fh:
+                fh.write(data)
+            self.members.append((path, arcname))
+
+    def read(self, chunks):
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(archive.testzip())
+        return archive
+
+    def test_round_trip(self):
+        archive = self.read(stream_zip(self.members, chunk_size=4096))
+        self.assertEqual(archive.namelist(), list(self.files))
+        for arcname, data in self.files.items():
+            self.assertEqual(archive.read(arcname), data)
+
+    def test_policy_and_parallel_compression_keep_order(self):
+        def policy(path, arcname):
+            return (ZIP_STORED, None) if arcname.startswith('images/') else (ZIP_DEFLATED, 9)
+
+        archive = self.read(stream_zip(self.members, policy=policy, workers=3, chunk_size=4096))
+        self.assertEqual(archive.namelist(), list(self.files))
+        methods = {info.filename: info.compress_type for info in archive.infolist()}
+        self.assertEqual(methods['images/photo.jpg'], ZIP_STORED)
+        self.assertEqual(methods['documents/notes.txt'], ZIP_DEFLATED)
+        self.assertEqual(archive.read('documents/notes.txt'), self.files['documents/notes.txt'])
+
+    def test_stream_of_unknown_size_uses_zip64_descriptor(self):
+        zs = ZipStream()
+        data = b'x' * 100000
+        archive = self.read([*zs.add_stream(io.BytesIO(data), 'stream.txt'), *zs.finish()])
+        self.assertEqual(archive.read('stream.txt'), data)
+
+    def test_empty_archive(self):
+        self.assertEqual(self.read(stream_zip([])).namelist(), [])
+
+    def test_rename_copies_members_unchanged(self):
+        path = os.path.join(self.tmp, 'job.zip')
+        with open(path, 'wb') as out:
+            out.writelines(stream_zip(self.members))
+        renamed = self.read(rename_zip(path, {'documents/notes.txt': 'code/notes.txt'}))
+        self.assertEqual(renamed.namelist()[0], 'code/notes.txt')
+        self.assertEqual(renamed.read('code/notes.txt'), self.files['documents/notes.txt'])
+        with zipfile.ZipFile(path) as original:
+            self.assertEqual(renamed.getinfo('code/notes.txt').compress_size,
+                             original.getinfo('documents/notes.txt').compress_size)
+
+
+class DownloadTests(OrganizerTestCase):
+    settings_overrides = {'ORGANIZER_RUN_JOBS_INLINE': True}
+
+    def test_archive_is_only_served_for_completed_jobs(self):
+        job = self.make_job({'a.txt': b'hello'})
+        zip_path = ensure_workspace(self.user) / 'jobs' / f'{job.id}.zip'
+        zip_path.write_bytes(b'PK half an archive')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('download', args=[job.id])).status_code, 404)
+
+        enqueue(job)
+        self.assertFalse(zip_path.with_name(zip_path.name + '.part').exists())
+        response = self.client.get(reverse('download', args=[job.id]))
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['documents/1_a.txt'])
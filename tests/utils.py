@@ -0,0 +1,37 @@
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from ..ingest import JobIngest
+from ..models import UploadJob
+from ..stats import record_job_created
+
+
+class OrganizerTestCase(TestCase):
+    """A user and an empty MEDIA_ROOT of their own for each test."""
+
+    settings_overrides = {}
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root, ALLOWED_HOSTS=['*'], **self.settings_overrides,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+
+    def make_job(self, files, user=None, **fields):
+        """A pending job holding `files`, a {name: bytes} dict, as an upload would."""
+        job = UploadJob.objects.create(
+            user=user or self.user, job_name=fields.pop('job_name', 'Test'),
+            total_files=len(files), total_size=sum(map(len, files.values())), **fields,
+        )
+        record_job_created(job)
+        with JobIngest(job) as entries:
+            for name, data in files.items():
+                entries.add_chunks(name, [data])
+        return job
@@ -3,10 +3,32 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from organizer import api as organizer_api
+from organizer import async_views as organizer_async_views
+from organizer import views as organizer_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('organizer.urls')),
+    path('job/<int:job_id>/progress/', organizer_views.job_progress, name='job_progress'),
+    path('job/<int:job_id>/rerun/', organizer_views.rerun_job, name='rerun_job'),
+    path('job/<int:job_id>/delete/', organizer_views.delete_job, name='delete_job'),
+    path('api/uploads/', organizer_api.UploadSessionView.as_view(), name='api_upload_session'),
+    path('api/uploads/<int:job_id>/', organizer_api.UploadStatusView.as_view(), name='api_upload_status'),
+    path('api/uploads/<int:job_id>/files/<int:index>/', organizer_api.UploadChunkView.as_view(), name='api_upload_chunk'),
+    path('api/uploads/<int:job_id>/complete/', organizer_api.UploadCompleteView.as_view(), name='api_upload_complete'),
+    path('api/jobs/', organizer_api.JobListView.as_view(), name='api_jobs'),
+    path('api/jobs/<int:job_id>/files/', organizer_api.JobFileListView.as_view(), name='api_job_files'),
+    path('api/jobs/<int:job_id>/archive/', organizer_api.JobArchiveView.as_view(), name='api_job_archive'),
 ]
 
+# Under ASGI, serve the long transfers from async views (they take the
+# names, so reverse() is unchanged); the sync ones remain for WSGI.
+if getattr(settings, 'ORGANIZER_ASYNC_TRANSFERS', False):
+    urlpatterns = [
+        path('upload/', organizer_async_views.upload, name='upload'),
+        path('download/<int:job_id>/', organizer_async_views.download, name='download'),
+    ] + urlpatterns
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,52 +1,42 @@
-import os
-import shutil
-import zipfile
-import json
-from uuid import uuid4
-from pathlib import Path
-from datetime import datetime
+import logging
 
+from django.core.paginator import Paginator
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.http import FileResponse, JsonResponse, Http404
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.views.decorators.http import require_POST, require_GET
-from django.db.models import Sum, Count, Q
-from django.utils.timezone import now
-from django.conf import settings
-
-from .models import UserProfile, CustomRule, UploadJob, FileRecord
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.http import content_disposition_header, urlencode
+
+from .models import UserProfile, CustomRule, UploadJob
+from .archivecache import archive_members
+from .archives import ArchiveError, is_archive
+from .compression import CompressionPolicy, compression_workers
+from .dedupe import ACTIONS as DUPLICATE_ACTIONS
+from .fileserve import serve_file
 from .forms import UploadForm, RuleForm
+from .ingest import JobIngest
+from .instrumentation import Timings
+from .jobs import enqueue
+from .manifest import Manifest
+from .naming import DEFAULT_PATTERN, PatternError, compile_pattern, render_name
+from .pagination import encode_cursor
+from .quota import FORM_OVERHEAD, QuotaExceeded, check_quota
+from .retention import discard_job
+from .ruleengine import invalidate_rules
+from .stats import get_stats, record_job_created, record_job_deleted, record_job_resized
+from .storage import get_storage, media_name
+from .workspace import ensure_workspace
+from .zipstream import stream_zip
 
 
-EXT_MAP = {
-    'images': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico'],
-    'documents': ['.pdf', '.doc', '.docx', '.txt', '.odt', '.rtf', '.xlsx', '.csv'],
-    'videos': ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv'],
-    'audio': ['.mp3', '.wav', '.m4a', '.flac', '.aac', '.wma'],
-    'archives': ['.zip', '.tar', '.gz', '.rar', '.7z', '.bz2'],
-    'code': ['.py', '.js', '.html', '.css', '.java', '.cpp', '.c', '.go', '.rs'],
-    'media': ['.psd', '.ai', '.sketch', '.fig'],
-}
-
-
-def _ensure_workspace(user):
-    """Create or get user's workspace directory."""
-    base = Path(settings.MEDIA_ROOT) / f'users/{user.id}'
-    (base / 'uploads').mkdir(parents=True, exist_ok=True)
-    (base / 'organized').mkdir(parents=True, exist_ok=True)
-    (base / 'jobs').mkdir(parents=True, exist_ok=True)
-    return base
+logger = logging.getLogger(__name__)
 
-
-def _classify(filename):
-    """Auto-classify file by extension."""
-    ext = Path(filename).suffix.lower()
-    for cat, exts in EXT_MAP.items():
-        if ext in exts:
-            return cat
-    return 'others'
+PREVIEW_PAGE_SIZE = 100
+RECENT_JOBS = 10
 
 
 def _format_size(size_bytes):
@@ -118,87 +108,141 @@ def dashboard(request):
     except:
         profile = UserProfile.objects.create(user=request.user)
     
-    all_jobs = UploadJob.objects.filter(user=request.user).order_by('-created_at')
-    completed_jobs = all_jobs.filter(status='completed')[:10]
+    # One row past the page says whether "Load more" has anything to load
+    completed_jobs = list(
+        UploadJob.objects.filter(user=request.user, status='completed')
+        .order_by('-created_at', '-id')[:RECENT_JOBS + 1]
+    )
+    jobs_next = None
+    if len(completed_jobs) > RECENT_JOBS:
+        completed_jobs = completed_jobs[:RECENT_JOBS]
+        last = completed_jobs[-1]
+        jobs_next = reverse('api_jobs') + '?' + urlencode({
+            'status': 'completed',
+            'page_size': RECENT_JOBS,
+            'cursor': encode_cursor(last.created_at, last.pk),
+        })
     
+    # One row, kept current as jobs are created and completed
+    user_stats = get_stats(request.user)
     stats = {
-        'total_jobs': all_jobs.count(),
-        'completed_jobs': all_jobs.filter(status='completed').count(),
-        'total_files': sum(j.total_files for j in all_jobs),
-        'total_space': _format_size(sum(j.total_size for j in all_jobs)),
+        'total_jobs': user_stats.total_jobs,
+        'completed_jobs': user_stats.completed_jobs,
+        'total_files': user_stats.total_files,
+        'total_space': _format_size(user_stats.total_size),
     }
     
     return render(request, 'organizer/dashboard.html', {
         'jobs': completed_jobs,
+        'jobs_next': jobs_next,
         'stats': stats,
         'profile': profile,
     })
 
 
+def _store_upload(user, files, job_name, rename_pattern, unpack_archives):
+    """Create a job holding the uploaded `files`; None if none could be stored.
+
+    Raises ArchiveError for an unreadable archive and QuotaExceeded when
+    unpacked archives outgrow the user's quota, after removing the job.
+    Shared with the async `upload` (async_views.py), which runs it on the
+    I/O pool.
+    """
+    job = UploadJob.objects.create(
+        user=user,
+        job_name=job_name,
+        status='pending',
+        total_files=len(files),
+        total_size=sum(f.size for f in files),
+        rename_pattern=rename_pattern,
+        unpack_archives=unpack_archives,
+    )
+    record_job_created(job)
+
+    # Save uploaded files; the per-file list lives in the job manifest
+    try:
+        with JobIngest(job) as entries:
+            for f in files:
+                if unpack_archives and is_archive(f.name):
+                    entries.add_archive(f.name, f)
+                else:
+                    entries.add_chunks(f.name, f.chunks())
+    except (ArchiveError, QuotaExceeded):
+        discard_job(job)
+        raise
+
+    # Unpacked archives change the file count and size
+    if entries.count != job.total_files or entries.total_size != job.total_size:
+        record_job_resized(job, entries.total_size - job.total_size, entries.count - job.total_files)
+        job.total_files, job.total_size = entries.count, entries.total_size
+        job.save(update_fields=['total_files', 'total_size'])
+
+    if not entries.count:
+        job.delete()
+        record_job_deleted(job)
+        return None
+    return job
+
+
 @login_required
 def upload(request):
     """Upload files and create a new job."""
-    workspace = _ensure_workspace(request.user)
     error = None
     
     if request.method == 'POST':
+        # Turn away uploads that can't fit before their files are stored. The
+        # body has been read already (CsrfViewMiddleware reads request.POST);
+        # only the chunked API (api.py) refuses before the bytes are sent.
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        try:
+            check_quota(request.user, max(0, content_length - FORM_OVERHEAD))
+        except QuotaExceeded as e:
+            return render(request, 'organizer/upload.html', {'form': UploadForm(), 'error': str(e)}, status=413)
+
         # Don't validate files field since we handle it manually
         files = request.FILES.getlist('files')
         job_name = request.POST.get('job_name', '').strip() or 'Untitled Job'
-        rename_pattern = request.POST.get('rename_pattern', '').strip() or '{index}_{name}'
+        rename_pattern = request.POST.get('rename_pattern', '').strip() or DEFAULT_PATTERN
+        unpack_archives = bool(request.POST.get('unpack_archives'))
         
         if not files or len(files) == 0:
             error = 'Please select at least one file to upload.'
             form = UploadForm()
             return render(request, 'organizer/upload.html', {'form': form, 'error': error})
         
+        # Check the pattern and quota before any file is touched
         try:
-            # Create job
-            total_size = sum(f.size for f in files)
-            job = UploadJob.objects.create(
-                user=request.user,
-                job_name=job_name,
-                status='pending',
-                total_files=len(files),
-                total_size=total_size,
-            )
-            
-            # Save uploaded files
-            updir = workspace / 'uploads' / str(job.id)
-            updir.mkdir(parents=True, exist_ok=True)
-            file_data = []
-            
-            for f in files:
-                safe_name = f.name.replace('\\', '/').split('/')[-1]
-                dest = updir / safe_name
-                file_size = 0
-                
-                with open(dest, 'wb+') as out:
-                    for chunk in f.chunks():
-                        out.write(chunk)
-                        file_size += len(chunk)
-                
-                category = _classify(safe_name)
-                file_data.append({
-                    'original_name': safe_name,
-                    'category': category,
-                    'file_size': file_size,
-                })
+            compile_pattern(rename_pattern)
+            check_quota(request.user, sum(f.size for f in files))
+        except (PatternError, QuotaExceeded) as e:
+            form = UploadForm(initial={'job_name': job_name, 'rename_pattern': rename_pattern,
+                                       'unpack_archives': unpack_archives})
+            return render(request, 'organizer/upload.html', {'form': form, 'error': str(e)},
+                          status=413 if isinstance(e, QuotaExceeded) else 200)
+        
+        try:
+            try:
+                job = _store_upload(request.user, files, job_name, rename_pattern, unpack_archives)
+            except (ArchiveError, QuotaExceeded) as e:
+                form = UploadForm(initial={'job_name': job_name, 'rename_pattern': rename_pattern,
+                                           'unpack_archives': unpack_archives})
+                return render(request, 'organizer/upload.html', {'form': form, 'error': str(e)},
+                              status=413 if isinstance(e, QuotaExceeded) else 200)
             
-            if not file_data:
-                job.delete()
+            if job is None:
                 error = 'No files were saved successfully.'
-                return render(request, 'organizer/upload.html', {'form': form, 'error': error})
+                return render(request, 'organizer/upload.html', {'form': UploadForm(), 'error': error})
             
-            # Store in session for preview
+            # Only the job id goes in the session
             request.session['current_job_id'] = job.id
-            request.session['file_data'] = file_data
-            request.session['rename_pattern'] = rename_pattern
             request.session.modified = True
             
             return redirect('preview')
         except Exception as e:
-            print(f"Upload error: {e}")
+            logger.exception('Upload failed for %s', request.user)
             error = f'Upload failed: {str(e)}'
             form = UploadForm()
             return render(request, 'organizer/upload.html', {'form': form, 'error': error})
@@ -210,193 +254,157 @@ def upload(request):
 
 @login_required
 def preview(request):
-    """Preview file organization before applying."""
+    """Preview file organization before applying, one page at a time."""
     job_id = request.session.get('current_job_id')
-    file_data = request.session.get('file_data', [])
-    pattern = request.session.get('rename_pattern', '{index}_{name}')
-    
-    if not job_id or not file_data:
+    if not job_id:
         return redirect('upload')
     
     job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+    manifest = Manifest.for_job(job)
+    if not manifest.exists():
+        return redirect('upload')
     
-    # Generate preview with new names
-    preview_list = []
-    for idx, item in enumerate(file_data, start=1):
-        try:
-            new_name = pattern.format(index=idx, name=item['original_name'])
-        except KeyError:
-            new_name = f"{idx}_{item['original_name']}"
-        
-        preview_list.append({
-            **item,
-            'index': idx,
-            'new_name': new_name,
-        })
-    
-    request.session['preview'] = preview_list
-    request.session.modified = True
+    page = Paginator(manifest, PREVIEW_PAGE_SIZE).get_page(request.GET.get('page'))
+    preview_list = [
+        {**item, 'index': idx, 'new_name': render_name(job.rename_pattern, idx, item)}
+        for idx, item in enumerate(page.object_list, start=page.start_index())
+    ]
     
     return render(request, 'organizer/preview.html', {
         'job': job,
         'preview': preview_list,
-        'pattern': pattern,
+        'page_obj': page,
+        'pattern': job.rename_pattern,
     })
 
 
 @login_required
 @require_POST
 def organize(request):
-    """Apply organization and create ZIP."""
+    """Queue the organize job; the worker pool copies files and builds the ZIP."""
     job_id = request.session.get('current_job_id')
-    preview_list = request.session.get('preview', [])
     
     if not job_id:
-        print("No job_id in session")
         return redirect('upload')
     
-    if not preview_list:
-        print("No preview_list in session")
+    job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+    if not Manifest.for_job(job).exists():
         return redirect('upload')
+    # Only an upload that was never queued; a second POST would run it twice.
+    if job.status != 'pending' or job.queued_at is not None:
+        return redirect('job_detail', job_id=job.id)
+    duplicate_action = request.POST.get('duplicates', 'keep')
+    if duplicate_action in DUPLICATE_ACTIONS:
+        job.duplicate_action = duplicate_action
+        job.save(update_fields=['duplicate_action'])
+    enqueue(job)
     
-    try:
-        job = get_object_or_404(UploadJob, id=job_id, user=request.user)
-        workspace = _ensure_workspace(request.user)
-        
-        updir = workspace / 'uploads' / str(job.id)
-        orgdir = workspace / 'jobs' / str(job.id)
-        orgdir.mkdir(parents=True, exist_ok=True)
-        
-        print(f"Organizing job {job.id}")
-        print(f"Source dir: {updir}")
-        print(f"Org dir: {orgdir}")
-        
-        # Move and organize files
-        successfully_moved = 0
-        for item in preview_list:
-            cat = item['category']
-            target_dir = orgdir / cat
-            target_dir.mkdir(parents=True, exist_ok=True)
-            
-            src = updir / item['original_name']
-            dest = target_dir / item['new_name']
-            
-            if src.exists():
-                try:
-                    print(f"Copying {src} to {dest}")
-                    shutil.copy2(str(src), str(dest))
-                    FileRecord.objects.create(
-                        job=job,
-                        original_name=item['original_name'],
-                        new_name=item['new_name'],
-                        category=cat,
-                        file_size=item.get('file_size', src.stat().st_size),
-                        original_path=str(src),
-                        organized_path=str(dest),
-                    )
-                    successfully_moved += 1
-                except Exception as e:
-                    print(f"Error copying file {item['original_name']}: {e}")
-            else:
-                print(f"Source file not found: {src}")
-        
-        print(f"Successfully moved {successfully_moved} files")
-        
-        # Create ZIP
-        zip_path = workspace / 'jobs' / f'{job.id}.zip'
-        if zip_path.exists():
-            zip_path.unlink()
-        
-        print(f"Creating ZIP at {zip_path}")
-        try:
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for root, _, files in os.walk(str(orgdir)):
-                    for f in files:
-                        full = os.path.join(root, f)
-                        arc = os.path.relpath(full, str(orgdir))
-                        zf.write(full, arc)
-            print(f"ZIP created successfully")
-        except Exception as e:
-            print(f"Error creating ZIP: {e}")
-        
-        # Update job
-        job.status = 'completed'
-        job.processed_files = successfully_moved
-        job.completed_at = now()
-        job.save()
-        print(f"Job {job.id} marked as completed")
-        
-        # Update profile stats
-        try:
-            profile = request.user.profile
-            profile.total_files_organized += job.total_files
-            profile.total_space_saved += job.total_size
-            profile.save()
-            print(f"Profile stats updated")
-        except Exception as e:
-            print(f"Error updating profile: {e}")
-        
-        # Clear session data
-        request.session['current_job_id'] = None
-        request.session['file_data'] = None
-        request.session['preview'] = None
-        request.session.modified = True
-        
-        return redirect('download', job_id=job.id)
-    except Exception as e:
-        print(f"Organize error: {e}")
-        import traceback
-        traceback.print_exc()
-        return redirect('upload')
+    # Clear session data
+    request.session['current_job_id'] = None
+    request.session.modified = True
+    
+    return redirect('job_detail', job_id=job.id)
 
 
 @login_required
 def download(request, job_id):
-    """Download organized files as ZIP."""
-    try:
-        job = get_object_or_404(UploadJob, id=job_id, user=request.user)
-        workspace = _ensure_workspace(request.user)
-        zip_path = workspace / 'jobs' / f'{job.id}.zip'
-        
-        print(f"Download request for job {job.id}")
-        print(f"ZIP path: {zip_path}")
-        print(f"ZIP exists: {zip_path.exists()}")
-        
-        if not zip_path.exists():
-            print(f"ZIP not found at {zip_path}")
-            raise Http404('Archive not available')
-        
-        safe_filename = f'{job.job_name.replace(" ", "_")}.zip'
-        
-        response = FileResponse(
-            open(zip_path, 'rb'),
-            as_attachment=True,
-            filename=safe_filename,
-            content_type='application/zip'
-        )
-        response['Content-Length'] = zip_path.stat().st_size
-        return response
-    except Http404:
-        raise
-    except Exception as e:
-        print(f"Download error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise Http404('Error preparing download')
+    """Download organized files as ZIP.
+
+    Serves jobs/<id>.zip when the job materialized one, with ranges and
+    conditional GETs or through the front-end server (see fileserve.py),
+    or redirects to a presigned URL for it on remote storage. Otherwise it
+    streams an archive built on the fly from the uploaded files and their
+    FileRecords.
+    """
+    job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+    if job.status != 'completed':
+        raise Http404('Archive not available')
+    workspace = ensure_workspace(request.user)
+    zip_path = workspace / 'jobs' / f'{job.id}.zip'
+    safe_filename = f'{job.job_name.replace(" ", "_")}.zip'
+    storage = get_storage()
+
+    if not storage.is_local and not job.source_path and storage.exists(media_name(zip_path)):
+        return redirect(storage.url(media_name(zip_path), filename=safe_filename))
+
+    if zip_path.exists():
+        return serve_file(request, zip_path, safe_filename, 'application/zip')
+    
+    if not job.files.exists():
+        raise Http404('Archive not available')
+    
+    chunks = stream_zip(archive_members(job), policy=CompressionPolicy.from_settings(),
+                        workers=compression_workers())
+    response = StreamingHttpResponse(_timed_stream(job, chunks), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, safe_filename)
+    # Built as it is sent, so there is nothing stable to resume from.
+    response['Accept-Ranges'] = 'none'
+    return response
+
+
+def _timed_stream(job, chunks):
+    """Pass `chunks` through, logging how long the archive took to send."""
+    timings = Timings()
+    with timings.stage('download') as sent:
+        sent['files'] = job.total_files
+        for chunk in chunks:
+            sent['bytes'] += len(chunk)
+            yield chunk
+    logger.info('Streamed job %s archive: %s', job.id, timings.as_dict()['download'])
 
 
 @login_required
 def job_detail(request, job_id):
-    """View job details and file records."""
+    """View job details; file records are fetched page by page from the API."""
     job = get_object_or_404(UploadJob, id=job_id, user=request.user)
-    files = job.files.all()
+    categories = list(job.files.order_by('category').values('category').annotate(count=Count('id')))
     
     return render(request, 'organizer/job_detail.html', {
         'job': job,
-        'files': files,
+        'categories': categories,
+        'file_count': sum(c['count'] for c in categories),
     })
 
 
+@login_required
+@require_GET
+def job_progress(request, job_id):
+    """JSON progress for a job, polled by the job detail page."""
+    job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'processed_files': job.processed_files,
+        'total_files': job.total_files,
+        'percent': job.progress_percent,
+        'error': job.error_message.splitlines()[0] if job.error_message else '',
+    })
+
+
+@login_required
+@require_POST
+def rerun_job(request, job_id):
+    """Queue an organized job to re-apply the current rules to its files."""
+    job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+    if job.status in ('completed', 'failed') and job.files.exists():
+        enqueue(job, rerun=True)
+    return redirect('job_detail', job_id=job.id)
+
+
+@login_required
+@require_POST
+def delete_job(request, job_id):
+    """Delete a job and its files, giving its size back to the user's quota."""
+    job = get_object_or_404(UploadJob, id=job_id, user=request.user)
+    if job.status == 'processing' or (job.status == 'pending' and job.queued_at is not None):
+        # A worker is using, or about to use, its files.
+        return redirect('job_detail', job_id=job.id)
+    discard_job(job)
+    if request.session.get('current_job_id') == job_id:
+        del request.session['current_job_id']
+    return redirect('dashboard')
+
+
 # === Rules Management ===
 @login_required
 def rules(request):
@@ -409,6 +417,7 @@ def rules(request):
             rule = form.save(commit=False)
             rule.user = request.user
             rule.save()
+            invalidate_rules(request.user)
             return redirect('rules')
     else:
         form = RuleForm()
@@ -424,6 +433,7 @@ def delete_rule(request, rule_id):
     """Delete a custom rule."""
     rule = get_object_or_404(CustomRule, id=rule_id, user=request.user)
     rule.delete()
+    invalidate_rules(request.user)
     return redirect('rules')
 
 
@@ -0,0 +1,13 @@
+from pathlib import Path
+
+from django.conf import settings
+
+
+def ensure_workspace(user):
+    """Create or get user's workspace directory."""
+    base = Path(settings.MEDIA_ROOT) / f'users/{user.id}'
+    (base / 'uploads').mkdir(parents=True, exist_ok=True)
+    (base / 'organized').mkdir(parents=True, exist_ok=True)
+    (base / 'jobs').mkdir(parents=True, exist_ok=True)
+    return base
+
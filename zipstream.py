@@ -0,0 +1,336 @@
+"""Streaming ZIP writer.
+
+Builds a ZIP archive as an iterator of byte chunks, so a download can be
+served while the archive is being produced: no temp archive and memory
+bounded by the read chunk size. Every entry uses a data descriptor
+(general purpose bit 3), so CRCs and sizes never require seeking back, and
+Zip64 records are added once an entry or the archive outgrows 4 GiB.
+
+Members can also be deflated ahead of time on a thread pool (zlib drops
+the GIL, so this scales across cores) and then spliced into the archive
+in order with their sizes already known. `rename_zip` re-emits an existing
+archive under new member names without recompressing anything.
+"""
+import os
+import time
+import zlib
+import struct
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import zipfile
+from zipfile import ZIP_STORED, ZIP_DEFLATED
+
+
+CHUNK_SIZE = 64 * 1024
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_END_RECORD64 = struct.Struct('<IQHHIIQQQQ')
+_END_LOCATOR64 = struct.Struct('<IIQI')
+
+_LOCAL_SIG = 0x04034B50
+_CENTRAL_SIG = 0x02014B50
+_DESCRIPTOR_SIG = 0x08074B50
+_END_SIG = 0x06054B50
+_END64_SIG = 0x06064B50
+_LOCATOR64_SIG = 0x07064B50
+
+_FLAG_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_VERSION = 20
+_VERSION_ZIP64 = 45
+_MADE_BY_UNIX = 3 << 8
+_FILE_ATTRS = (0o100644 & 0xFFFF) << 16
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class _Entry:
+    __slots__ = ('name', 'flags', 'method', 'dos_time', 'dos_date',
+                 'crc', 'compress_size', 'file_size', 'offset')
+
+
+class ZipStream:
+    """Incrementally emit a ZIP archive.
+
+    Call `add_file` / `add_stream` for each member and `finish` at the end;
+    each returns a generator of the bytes to send.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._entries = []
+        self._offset = 0
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def add_file(self, path, arcname, compress_type=ZIP_DEFLATED, compresslevel=None):
+        """Yield the bytes that store the file at `path` as `arcname`."""
+        st = os.stat(path)
+        with open(path, 'rb') as fh:
+            yield from self.add_stream(fh, arcname, st.st_size, st.st_mtime,
+                                       compress_type, compresslevel)
+
+    def _new_entry(self, arcname, compress_type, mtime, flags):
+        entry = _Entry()
+        name = arcname.replace(os.sep, '/').lstrip('/')
+        try:
+            entry.name = name.encode('ascii')
+            entry.flags = flags
+        except UnicodeEncodeError:
+            entry.name = name.encode('utf-8')
+            entry.flags = flags | _FLAG_UTF8
+        entry.method = compress_type
+        entry.dos_time, entry.dos_date = _dos_datetime(time.time() if mtime is None else mtime)
+        entry.offset = self._offset
+        return entry
+
+    def _known_size_header(self, entry):
+        """Local header for an entry whose CRC and sizes are already set."""
+        zip64 = entry.file_size > ZIP64_LIMIT or entry.compress_size > ZIP64_LIMIT
+        extra = b''
+        file_size, compress_size = entry.file_size, entry.compress_size
+        if zip64:
+            extra = struct.pack('<HHQQ', 1, 16, file_size, compress_size)
+            file_size = compress_size = 0xFFFFFFFF
+        return self._emit(_LOCAL_HEADER.pack(
+            _LOCAL_SIG, _VERSION_ZIP64 if zip64 else _VERSION, entry.flags, entry.method,
+            entry.dos_time, entry.dos_date, entry.crc, compress_size, file_size,
+            len(entry.name), len(extra),
+        ) + entry.name + extra)
+
+    def add_compressed(self, member):
+        """Yield the bytes that splice in a `PrecompressedMember`."""
+        entry = self._new_entry(member.arcname, member.compress_type, member.mtime, 0)
+        entry.crc = member.crc
+        entry.file_size = member.file_size
+        entry.compress_size = member.compress_size
+        yield self._known_size_header(entry)
+        with member.data:
+            member.data.seek(0)
+            while True:
+                chunk = member.data.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield self._emit(chunk)
+        self._entries.append(entry)
+
+    def add_raw(self, fh, info, arcname):
+        """Yield the bytes that copy member `info` of the open ZIP `fh` as `arcname`.
+
+        The compressed data is copied as is, so nothing is recompressed.
+        """
+        fh.seek(info.header_offset)
+        *_, name_len, extra_len = _LOCAL_HEADER.unpack(fh.read(_LOCAL_HEADER.size))
+        fh.seek(name_len + extra_len, os.SEEK_CUR)
+        entry = self._new_entry(arcname, info.compress_type, None, 0)
+        entry.dos_time, entry.dos_date = _dos_datetime(time.mktime(info.date_time + (0, 0, -1)))
+        entry.crc = info.CRC
+        entry.file_size = info.file_size
+        entry.compress_size = info.compress_size
+        yield self._known_size_header(entry)
+        remaining = info.compress_size
+        while remaining:
+            chunk = fh.read(min(self.chunk_size, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f'Truncated member {info.filename!r}')
+            remaining -= len(chunk)
+            yield self._emit(chunk)
+        self._entries.append(entry)
+
+    def add_stream(self, fh, arcname, size_hint=None, mtime=None,
+                   compress_type=ZIP_DEFLATED, compresslevel=None):
+        """Yield the bytes that store everything read from `fh` as `arcname`."""
+        entry = self._new_entry(arcname, compress_type, mtime, _FLAG_DESCRIPTOR)
+        # Same heuristic as zipfile: reserve Zip64 sizes if the entry may not fit.
+        zip64 = size_hint is None or size_hint * 1.05 > ZIP64_LIMIT
+
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0) if zip64 else b''
+        marker = 0xFFFFFFFF if zip64 else 0
+        yield self._emit(_LOCAL_HEADER.pack(
+            _LOCAL_SIG, _VERSION_ZIP64 if zip64 else _VERSION, entry.flags, entry.method,
+            entry.dos_time, entry.dos_date, 0, marker, marker, len(entry.name), len(extra),
+        ) + entry.name + extra)
+
+        if compress_type == ZIP_DEFLATED:
+            level = zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        elif compress_type == ZIP_STORED:
+            compressor = None
+        else:
+            raise ValueError(f'Unsupported compression method: {compress_type}')
+
+        crc = 0
+        file_size = 0
+        compress_size = 0
+        while True:
+            chunk = fh.read(self.chunk_size)
+            if not chunk:
+                break
+            file_size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+                if not chunk:
+                    continue
+            compress_size += len(chunk)
+            yield self._emit(chunk)
+        if compressor is not None:
+            tail = compressor.flush()
+            compress_size += len(tail)
+            if tail:
+                yield self._emit(tail)
+
+        if not zip64 and (file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT):
+            raise RuntimeError(f'{arcname} grew past the size announced for it')
+        entry.crc = crc
+        entry.file_size = file_size
+        entry.compress_size = compress_size
+        self._entries.append(entry)
+
+        fmt = '<IIQQ' if zip64 else '<IIII'
+        yield self._emit(struct.pack(fmt, _DESCRIPTOR_SIG, crc, compress_size, file_size))
+
+    def finish(self):
+        """Yield the central directory and end-of-archive records."""
+        cd_offset = self._offset
+        for entry in self._entries:
+            zip64_fields = []
+            file_size, compress_size, offset = entry.file_size, entry.compress_size, entry.offset
+            if file_size > ZIP64_LIMIT:
+                zip64_fields.append(file_size)
+                file_size = 0xFFFFFFFF
+            if compress_size > ZIP64_LIMIT:
+                zip64_fields.append(compress_size)
+                compress_size = 0xFFFFFFFF
+            if offset > ZIP64_LIMIT:
+                zip64_fields.append(offset)
+                offset = 0xFFFFFFFF
+            extra = b''
+            if zip64_fields:
+                extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields)
+            version = _VERSION_ZIP64 if zip64_fields else _VERSION
+            yield self._emit(_CENTRAL_HEADER.pack(
+                _CENTRAL_SIG, _MADE_BY_UNIX | version, version, entry.flags, entry.method,
+                entry.dos_time, entry.dos_date, entry.crc, compress_size, file_size,
+                len(entry.name), len(extra), 0, 0, 0, _FILE_ATTRS, offset,
+            ) + entry.name + extra)
+
+        count = len(self._entries)
+        cd_size = self._offset - cd_offset
+        if count > ZIP_FILECOUNT_LIMIT or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+            end64_offset = self._offset
+            yield self._emit(_END_RECORD64.pack(
+                _END64_SIG, _END_RECORD64.size - 12, _MADE_BY_UNIX | _VERSION_ZIP64,
+                _VERSION_ZIP64, 0, 0, count, count, cd_size, cd_offset,
+            ))
+            yield self._emit(_END_LOCATOR64.pack(_LOCATOR64_SIG, 0, end64_offset, 1))
+            count = min(count, 0xFFFF)
+            cd_size = min(cd_size, 0xFFFFFFFF)
+            cd_offset = min(cd_offset, 0xFFFFFFFF)
+        yield self._emit(_END_RECORD.pack(_END_SIG, 0, 0, count, count, cd_size, cd_offset, 0))
+
+
+def _deflate_everything(path, arcname):
+    return ZIP_DEFLATED, None
+
+
+class PrecompressedMember:
+    """A member deflated ahead of time into a spooled temp file."""
+
+    __slots__ = ('arcname', 'compress_type', 'mtime', 'crc',
+                 'file_size', 'compress_size', 'data')
+
+
+def precompress(path, arcname, compresslevel=None, chunk_size=CHUNK_SIZE):
+    """Deflate `path` into a spooled temp file, recording CRC and sizes."""
+    member = PrecompressedMember()
+    member.arcname = arcname
+    member.compress_type = ZIP_DEFLATED
+    member.mtime = os.stat(path).st_mtime
+    member.data = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    level = zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = file_size = compress_size = 0
+    with open(path, 'rb') as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            file_size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            out = compressor.compress(chunk)
+            compress_size += len(out)
+            member.data.write(out)
+    out = compressor.flush()
+    compress_size += len(out)
+    member.data.write(out)
+    member.crc, member.file_size, member.compress_size = crc, file_size, compress_size
+    return member
+
+
+def stream_zip(members, policy=None, workers=1, chunk_size=CHUNK_SIZE):
+    """Yield a complete ZIP archive holding `members` ((path, arcname) pairs).
+
+    `policy(path, arcname)` returns ``(compress_type, compresslevel)`` per
+    member (default: deflate everything). With ``workers > 1`` deflated
+    members are compressed on a thread pool, at most a few per worker ahead
+    of the writer, and spliced into the output in their original order.
+    """
+    if policy is None:
+        policy = _deflate_everything
+    zs = ZipStream(chunk_size)
+
+    if workers <= 1:
+        for path, arcname in members:
+            compress_type, level = policy(path, arcname)
+            yield from zs.add_file(path, arcname, compress_type, level)
+        yield from zs.finish()
+        return
+
+    window = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def drain(limit):
+            while len(window) > limit:
+                path, arcname, future = window.popleft()
+                if future is None:
+                    yield from zs.add_file(path, arcname, ZIP_STORED)
+                else:
+                    yield from zs.add_compressed(future.result())
+
+        for path, arcname in members:
+            compress_type, level = policy(path, arcname)
+            future = None
+            if compress_type == ZIP_DEFLATED:
+                future = pool.submit(precompress, path, arcname, level, chunk_size)
+            window.append((path, arcname, future))
+            yield from drain(workers * 4)
+        yield from drain(0)
+    yield from zs.finish()
+
+
+def rename_zip(path, renames, chunk_size=CHUNK_SIZE):
+    """Yield a copy of the ZIP at `path` with members renamed per `renames`.
+
+    `renames` maps old arcnames to new ones; other members keep theirs.
+    Member data is copied byte for byte, so only the headers and the
+    central directory are rewritten.
+    """
+    zs = ZipStream(chunk_size)
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as fh:
+        for info in archive.infolist():
+            yield from zs.add_raw(fh, info, renames.get(info.filename, info.filename))
+    yield from zs.finish()